@@ -1,22 +1,39 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from datetime import datetime
 from sqlalchemy import func
+import os
 
 # Importamos nuestros modelos (Incluida la nueva CierreCaja) y el gestor
-from models import db, Usuario, Venta, Producto, Insumo, Sabor, ComboItem, CierreCaja
+from models import db, Usuario, Venta, Producto, CierreCaja, StockSabor, StockInsumo
 from gestor import HeladeriaManager
+from trabajos import GestorTrabajosReporte
+from base_datos import configurar_sqlite, abrir_lectura_consistente
+import eventos
+import metricas
+import exportacion
+import archivo
 
 # --- CONFIGURACIÓN INICIAL ---
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'tu_clave_secreta_super_segura' 
 # Timeout agregado para evitar bloqueos en Google Drive/OneDrive
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///heladeria.db?timeout=15' 
+# HELADERIA_DB_URI permite apuntar a otra base (ej: la del benchmark) sin tocar la real
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('HELADERIA_DB_URI', 'sqlite:///heladeria.db?timeout=15')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Inicializar Extensiones
 db.init_app(app)
+# WAL + PRAGMAs en cada conexión: los reportes no frenan las ventas entre workers
+with app.app_context():
+    configurar_sqlite(db.engine)
+    # Latencia, consultas y tiempo SQL por ruta (ver /admin/metrics)
+    metricas.instrumentar(app, db.engine)
+    # Ventas viejas en otra base adjunta (ver mantenimiento.py archivar); reportes leen las dos
+    app.config.setdefault('ARCHIVO_VENTAS', os.environ.get('HELADERIA_ARCHIVO') or archivo.ruta_por_defecto(db.engine))
+    archivo.configurar_archivo(db.engine, app.config['ARCHIVO_VENTAS'])
+    archivo.crear_tablas(db.engine)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
@@ -24,10 +41,23 @@ login_manager.login_view = 'login'
 # Instancia del Gestor
 gestor = HeladeriaManager()
 
+# Tope de ventas por envío de /vender/lote (la terminal parte colas más largas)
+MAX_VENTAS_POR_LOTE = 500
+
+# Token para que Prometheus lea /admin/metrics sin sesión (Authorization: Bearer ...)
+app.config.setdefault('METRICAS_TOKEN', os.environ.get('HELADERIA_METRICAS_TOKEN'))
+
+# Reportes en segundo plano: pool local por worker, archivos compartidos en disco
+app.config.setdefault('REPORTES_CACHE_DIR', os.path.join(app.instance_path, 'reportes'))
+trabajos_reporte = GestorTrabajosReporte(app, gestor, app.config['REPORTES_CACHE_DIR'])
+MIMETYPE_EXCEL = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
 # --- GESTIÓN DE SESIÓN ---
 @login_manager.user_loader
 def load_user(user_id):
-    return Usuario.query.get(int(user_id))
+    # Sale del caché del gestor: la venta no paga un SELECT de Usuario por request
+    # (los cambios de otros workers se controlan cada pocos segundos, ver sesiones.py)
+    return gestor.usuario_sesion(int(user_id))
 
 @app.route('/')
 def index():
@@ -79,9 +109,47 @@ def vender():
         else:
             return jsonify({'success': False, 'msg': mensaje}), 400
 
-    sabores = gestor.obtener_sabores_venta()
-    productos = gestor.obtener_productos()
-    return render_template('vender.html', sabores=sabores, productos=productos, vendedor=current_user)
+    # Productos y sabores los arma la página con /api/catalogo (guardado en la tablet)
+    return render_template('vender.html', vendedor=current_user)
+
+# --- CATÁLOGO PARA LAS TERMINALES (JSON + ETAG) ---
+@app.route('/api/catalogo')
+@login_required
+def api_catalogo():
+    version, cuerpo = gestor.catalogo_venta()
+    respuesta = app.response_class(cuerpo, mimetype='application/json')
+    respuesta.set_etag(f"catalogo-{version}")
+    # La tablet puede guardarlo, pero siempre pregunta si cambió (If-None-Match -> 304)
+    respuesta.cache_control.no_cache = True
+    return respuesta.make_conditional(request)
+
+# --- VENTAS POR LOTE (COLA OFFLINE DE LAS TERMINALES) ---
+@app.route('/vender/lote', methods=['POST'])
+@login_required
+def vender_lote():
+    data = request.get_json(silent=True) or {}
+    carritos = data.get('ventas')
+    if not isinstance(carritos, list) or not carritos:
+        return jsonify({'success': False, 'msg': "Lote vacío."}), 400
+    if len(carritos) > MAX_VENTAS_POR_LOTE:
+        return jsonify({'success': False, 'msg': f"Máximo {MAX_VENTAS_POR_LOTE} ventas por lote."}), 400
+
+    sucursal_actual = current_user.sucursal or "General"
+    try:
+        resultados, dias_pasados = gestor.procesar_lote_ventas(carritos, sucursal=sucursal_actual)
+    except Exception as e:
+        db.session.rollback()
+        # No se guardó nada: la terminal puede reintentar el lote entero
+        return jsonify({'success': False, 'msg': f"Error: {str(e)}"}), 503
+
+    try:
+        gestor.rehacer_resumenes(dias_pasados)
+    except Exception:
+        # Las ventas ya quedaron guardadas: se informa OK y el resumen se rehace con mantenimiento.py resumenes
+        db.session.rollback()
+        app.logger.exception("Error rehaciendo resúmenes del lote")
+
+    return jsonify({'success': True, 'resultados': resultados})
 
 # --- PANEL DEL VENDEDOR (MI CAJA) ---
 @app.route('/mi_caja')
@@ -91,19 +159,15 @@ def panel_vendedor():
     
     mi_sucursal = current_user.sucursal
     
-    # Usamos la lógica de turnos para que coincida con el cierre del admin
-    ventas_turno = gestor.obtener_ventas_turno_actual(mi_sucursal)
-    
-    # Ordenamos visualmente: lo más reciente arriba
-    ventas_turno.sort(key=lambda x: x.fecha, reverse=True)
-    
-    # Cálculos sobre ese turno específico
-    total_recaudado = sum(v.total for v in ventas_turno)
-    cantidad_ventas = len(ventas_turno)
-    
-    ventas_efectivo = [v for v in ventas_turno if v.medio_pago == 'Efectivo']
-    total_efectivo = sum(v.total for v in ventas_efectivo)
-    cantidad_efectivo = len(ventas_efectivo)
+    # Totales del turno: vienen ya acumulados (no se recorren las ventas)
+    resumen = gestor.resumen_turno_actual(mi_sucursal)
+    total_recaudado = resumen['total']
+    cantidad_ventas = resumen['cantidad']
+    total_efectivo = resumen['efectivo']
+    cantidad_efectivo = resumen['cantidad_efectivo']
+
+    # Para la tabla alcanza con los últimos movimientos (lo más reciente arriba)
+    ventas_turno = gestor.obtener_ventas_turno_actual(mi_sucursal, limite=50)
     
     return render_template('panel_vendedor.html', sucursal=mi_sucursal, ventas=ventas_turno, total_recaudado=total_recaudado, cantidad_ventas=cantidad_ventas, total_efectivo=total_efectivo, cantidad_efectivo=cantidad_efectivo)
 
@@ -112,46 +176,100 @@ def panel_vendedor():
 @login_required
 def admin_dashboard():
     if current_user.rol != 'admin': return redirect(url_for('vender'))
-    
-    # 1. MÁXIMO PAZ: Ventas y Desglose
-    ventas_mp = gestor.obtener_ventas_turno_actual("Máximo Paz")
-    total_mp = sum(v.total for v in ventas_mp)
-    count_mp = len(ventas_mp)
-    # Calculamos desglose para el modal (Efectivo vs Digital)
-    efectivo_mp = sum(v.total for v in ventas_mp if v.medio_pago == 'Efectivo')
-    digital_mp = total_mp - efectivo_mp 
-
-    # 2. TRISTÁN SUÁREZ: Ventas y Desglose
-    ventas_ts = gestor.obtener_ventas_turno_actual("Tristán Suárez")
-    total_ts = sum(v.total for v in ventas_ts)
-    count_ts = len(ventas_ts)
-    # Calculamos desglose para el modal
-    efectivo_ts = sum(v.total for v in ventas_ts if v.medio_pago == 'Efectivo')
-    digital_ts = total_ts - efectivo_ts
+
+    # Último evento y totales de los turnos en la misma foto de la base: el panel sigue en vivo
+    # desde este evento sin contar dos veces ni perder una venta que entre mientras se arma la página
+    abrir_lectura_consistente()
+    ultimo_evento = eventos.ultimo_id()
+
+    # 1. Totales del turno de cada sucursal y desglose para el modal (Efectivo vs Digital)
+    turnos = [(sucursal, gestor.resumen_turno_actual(sucursal.nombre)) for sucursal in gestor.obtener_sucursales()]
 
     # Globales
-    total_global_turno = total_mp + total_ts
-    count_global_turno = count_mp + count_ts
+    total_global_turno = sum(turno['total'] for _, turno in turnos)
+    count_global_turno = sum(turno['cantidad'] for _, turno in turnos)
 
     # Historial reciente
     ultimas_ventas = Venta.query.order_by(Venta.fecha.desc()).limit(10).all()
 
     # Mes actual
     nombres_meses = {1:"ENERO", 2:"FEBRERO", 3:"MARZO", 4:"ABRIL", 5:"MAYO", 6:"JUNIO", 7:"JULIO", 8:"AGOSTO", 9:"SEPTIEMBRE", 10:"OCTUBRE", 11:"NOVIEMBRE", 12:"DICIEMBRE"}
-    mes_actual = nombres_meses[datetime.now().month]
+    ahora = datetime.now()
+    mes_actual = nombres_meses[ahora.month]
+
+    # Acumulados del mes y del año (días cerrados desde los resúmenes diarios)
+    inicio_mes = ahora.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    acumulado_mes = gestor.metricas_ventas(inicio_mes, ahora)['global']
+    acumulado_anio = gestor.metricas_ventas(inicio_mes.replace(month=1), ahora)['global']
 
     return render_template('admin_dashboard.html',
                            mes_actual=mes_actual,
+                           anio_actual=ahora.year,
+                           acumulado_mes=acumulado_mes,
+                           acumulado_anio=acumulado_anio,
                            total_global=total_global_turno,
                            count_global=count_global_turno,
-                           # Datos MP
-                           total_mp=total_mp, count_mp=count_mp,
-                           efectivo_mp=efectivo_mp, digital_mp=digital_mp,
-                           # Datos TS
-                           total_ts=total_ts, count_ts=count_ts,
-                           efectivo_ts=efectivo_ts, digital_ts=digital_ts,
+                           # Una tarjeta por sucursal
+                           turnos=turnos,
                            # Extras
-                           ventas=ultimas_ventas)
+                           sucursales={s.nombre: s for s, _ in turnos},
+                           ventas=ultimas_ventas,
+                           ultimo_evento=ultimo_evento)
+
+# --- PANEL EN VIVO (SERVER-SENT EVENTS) ---
+@app.route('/admin/eventos')
+@login_required
+def eventos_panel():
+    if current_user.rol != 'admin': return "No autorizado", 403
+    # Al reconectarse, EventSource manda el último id recibido
+    desde = request.headers.get('Last-Event-ID') or request.args.get('desde')
+    desde = int(desde) if desde and desde.isdigit() else eventos.ultimo_id()
+    return Response(stream_with_context(eventos.flujo_sse(desde)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# --- GESTIÓN DE USUARIOS ---
+@app.route('/admin/usuarios', methods=['GET', 'POST'])
+@login_required
+def gestion_usuarios():
+    if current_user.rol != 'admin': return redirect(url_for('vender'))
+
+    if request.method == 'POST':
+        accion = request.form.get('accion')
+
+        if accion == 'crear_usuario':
+            exito, msg = gestor.crear_usuario(request.form.get('username'), request.form.get('password'),
+                                              request.form.get('rol'), request.form.get('sucursal'))
+            flash(msg)
+
+        elif accion == 'actualizar_usuario':
+            id_usuario = int(request.form.get('user_id'))
+            if id_usuario == current_user.id and request.form.get('rol') != 'admin':
+                flash("⚠️ No puedes quitarte el rol de administrador.")
+            else:
+                exito, msg = gestor.actualizar_usuario(id_usuario, request.form.get('rol'), request.form.get('sucursal'),
+                                                       request.form.get('password'))
+                flash(msg)
+
+        elif accion == 'eliminar_usuario':
+            id_borrar = int(request.form.get('user_id'))
+            if id_borrar == current_user.id:
+                flash("⚠️ No puedes eliminarte a ti mismo.")
+            else:
+                exito, msg = gestor.eliminar_usuario(id_borrar)
+                flash(msg)
+
+        return redirect(url_for('gestion_usuarios'))
+
+    return render_template('admin_usuarios.html', usuarios=gestor.obtener_usuarios(), sucursales=gestor.obtener_sucursales())
+
+# --- MÉTRICAS (PROMETHEUS) ---
+@app.route('/admin/metrics')
+def metricas_prometheus():
+    token = app.config.get('METRICAS_TOKEN')
+    con_token = token and request.headers.get('Authorization') == f"Bearer {token}"
+    es_admin = current_user.is_authenticated and current_user.rol == 'admin'
+    if not (con_token or es_admin): return "No autorizado", 403
+    return Response(metricas.exportar(), mimetype='text/plain; version=0.0.4')
 
 # --- PROCESAR CIERRE DE CAJA (BOTONES ROJOS) ---
 @app.route('/admin/cerrar-caja', methods=['POST'])
@@ -166,6 +284,69 @@ def procesar_cierre():
     
     return redirect(url_for('admin_dashboard'))
 
+# --- HISTORIAL DE TURNOS CERRADOS ---
+def _cierre_a_dict(cierre, ventas=None):
+    datos = {
+        'id': cierre.id, 'sucursal': cierre.sucursal, 'fecha_cierre': cierre.fecha_cierre.isoformat(timespec='seconds'),
+        'monto_total': cierre.monto_total, 'cantidad_ventas': cierre.cantidad_ventas,
+        'venta_desde_id': cierre.venta_desde_id, 'venta_hasta_id': cierre.venta_hasta_id,
+        'medios': {m.medio_pago: {'cantidad_ventas': m.cantidad_ventas, 'monto_total': m.monto_total} for m in cierre.medios},
+    }
+    if ventas is not None:
+        datos['ventas'] = [{'id': v.id, 'fecha': v.fecha.isoformat(timespec='seconds'), 'medio_pago': v.medio_pago,
+                            'total': v.total, 'detalle': v.detalle} for v in ventas]
+    return datos
+
+def _leer_pagina_cierres():
+    antes = request.args.get('antes', type=int)
+    limite = min(request.args.get('limite', 50, type=int), 200)
+    return gestor.historial_cierres(request.args.get('sucursal') or None, antes, limite), limite
+
+@app.route('/admin/turnos')
+@login_required
+def historial_turnos():
+    if current_user.rol != 'admin': return redirect(url_for('vender'))
+    cierres, limite = _leer_pagina_cierres()
+    return render_template('admin_turnos.html', cierres=cierres, limite=limite, turno=None, ventas=None,
+                           sucursales=gestor.obtener_sucursales(), sucursal=request.args.get('sucursal', ''))
+
+@app.route('/admin/turnos/<int:id_cierre>')
+@login_required
+def detalle_turno(id_cierre):
+    if current_user.rol != 'admin': return redirect(url_for('vender'))
+    cierre = db.session.get(CierreCaja, id_cierre)
+    if not cierre:
+        flash("Turno inexistente.")
+        return redirect(url_for('historial_turnos'))
+    return render_template('admin_turnos.html', cierres=None, turno=cierre, ventas=gestor.ventas_de_cierre(cierre))
+
+@app.route('/api/turnos')
+@login_required
+def api_turnos():
+    if current_user.rol != 'admin': return jsonify({'success': False, 'msg': 'Sin permiso'}), 403
+    cierres, _ = _leer_pagina_cierres()
+    return jsonify([_cierre_a_dict(c) for c in cierres])
+
+@app.route('/api/turnos/<int:id_cierre>')
+@login_required
+def api_turno(id_cierre):
+    if current_user.rol != 'admin': return jsonify({'success': False, 'msg': 'Sin permiso'}), 403
+    cierre = db.session.get(CierreCaja, id_cierre)
+    if not cierre: return jsonify({'success': False, 'msg': 'Turno inexistente'}), 404
+    return jsonify(_cierre_a_dict(cierre, gestor.ventas_de_cierre(cierre)))
+
+def _fin_del_dia(texto):
+    """'YYYY-MM-DD' -> ese día a las 23:59:59 (None si no vino fecha)"""
+    if not texto: return None
+    return datetime.strptime(texto, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+
+@app.template_filter('duracion')
+def _duracion(horas):
+    """Horas hasta agotar -> texto corto para las tarjetas de stock"""
+    if horas < 1: return "menos de 1 h"
+    if horas < 48: return f"{horas:.0f} h"
+    return f"{horas / 24:.1f} días".replace('.', ',')
+
 # --- GESTIÓN SABORES ---
 @app.route('/admin/sabores', methods=['GET', 'POST'])
 @login_required
@@ -176,11 +357,8 @@ def gestion_sabores():
         accion = request.form.get('accion')
         
         if accion == 'crear':
-            nombre = request.form.get('nombre')
-            nuevo_sabor = Sabor(nombre=nombre, stock_maximo=0, stock_tristan=0)
-            db.session.add(nuevo_sabor)
-            db.session.commit()
-            flash(f"Sabor {nombre} creado.")
+            exito, msg = gestor.crear_sabor(request.form.get('nombre'))
+            flash(msg)
 
         elif accion == 'agregar_stock':
             nombre = request.form.get('sabor_nombre')
@@ -198,14 +376,14 @@ def gestion_sabores():
             flash(msg)
 
         elif accion == 'cambiar_estado':
-            nombre = request.form.get('sabor_nombre')
-            sabor = Sabor.query.filter_by(nombre=nombre).first()
-            if sabor:
-                sabor.activo = not sabor.activo
-                db.session.commit()
+            gestor.alternar_sabor(request.form.get('sabor_nombre'))
     
     sabores = gestor.obtener_todos_sabores()
-    return render_template('admin_sabores.html', sabores=sabores)
+    fecha_stock = request.args.get('fecha')
+    # El pronóstico es desde ahora: no se muestra al mirar el stock de otro día
+    agotamiento = {} if fecha_stock else gestor.pronostico_stock(StockSabor)
+    return render_template('admin_sabores.html', sabores=sabores, fecha_stock=fecha_stock, agotamiento=agotamiento,
+                           sucursales=gestor.obtener_sucursales(), stock=gestor.stock_por_sucursal(StockSabor, _fin_del_dia(fecha_stock)))
 
 # --- GESTIÓN INSUMOS ---
 @app.route('/admin/insumos', methods=['GET', 'POST'])
@@ -224,26 +402,18 @@ def gestion_insumos():
             flash(msg)
         
         elif accion == 'crear':
-            nombre = request.form.get('nombre')
-            nuevo_insumo = Insumo(nombre=nombre, stock_maximo=0, stock_tristan=0)
-            db.session.add(nuevo_insumo)
-            db.session.commit()
-            flash(f"Insumo '{nombre}' creado.")
+            exito, msg = gestor.crear_insumo(request.form.get('nombre'))
+            flash(msg)
 
         elif accion == 'eliminar':
-            id_insumo = request.form.get('id_insumo')
-            insumo = Insumo.query.get(id_insumo)
-            if insumo:
-                try:
-                    db.session.delete(insumo)
-                    db.session.commit()
-                    flash(f"Insumo '{insumo.nombre}' eliminado.")
-                except Exception as e:
-                    db.session.rollback()
-                    flash("No se puede eliminar: está asociado a un producto activo.")
+            exito, msg = gestor.eliminar_insumo(request.form.get('id_insumo'))
+            flash(msg)
 
     insumos = gestor.obtener_insumos()
-    return render_template('admin_insumos.html', insumos=insumos)
+    fecha_stock = request.args.get('fecha')
+    agotamiento = {} if fecha_stock else gestor.pronostico_stock(StockInsumo)
+    return render_template('admin_insumos.html', insumos=insumos, fecha_stock=fecha_stock, agotamiento=agotamiento,
+                           sucursales=gestor.obtener_sucursales(), stock=gestor.stock_por_sucursal(StockInsumo, _fin_del_dia(fecha_stock)))
 
 # --- GESTIÓN PRECIOS (ABM + COMBOS) ---
 @app.route('/admin/precios', methods=['GET', 'POST'])
@@ -264,81 +434,79 @@ def gestion_precios():
             flash("Precio actualizado.")
 
         elif accion == 'eliminar':
-            id_prod = request.form.get('id_producto')
-            prod = Producto.query.get(id_prod)
-            
-            if prod and prod.es_combo:
-                ComboItem.query.filter_by(promo_id=prod.id).delete()
-                
-            if prod:
-                db.session.delete(prod)
-                db.session.commit()
-                flash(f"Producto '{prod.nombre}' eliminado.")
+            exito, msg = gestor.eliminar_producto(request.form.get('id_producto'))
+            if exito: flash(msg)
         
         elif accion == 'crear':
-            nombre = request.form.get('nombre')
-            precio = float(request.form.get('precio'))
             tipo = request.form.get('tipo') 
-            
-            if tipo == 'combo':
-                nuevo_prod = Producto(
-                    nombre=nombre, 
-                    precio=precio, 
-                    es_helado=True, 
-                    es_combo=True, 
-                    peso_helado=0 
-                )
-                db.session.add(nuevo_prod)
-                db.session.flush()
-
-                componentes = request.form.getlist('componentes') 
-                for item_id in componentes:
-                    cantidad = int(request.form.get(f'cantidad_{item_id}', 1))
-                    if cantidad > 0:
-                        db.session.add(ComboItem(promo_id=nuevo_prod.id, item_id=item_id, cantidad=cantidad))
-                
-                db.session.commit()
-                flash(f"Combo '{nombre}' creado con éxito.")
-
-            else:
-                insumo_id = request.form.get('insumo_id') 
-                es_helado = False
-                peso = 0
-                if tipo == 'helado':
-                    es_helado = True
-                    peso = float(request.form.get('peso', 0))
-                
-                id_insumo_final = int(insumo_id) if insumo_id else None
-
-                nuevo_prod = Producto(
-                    nombre=nombre, 
-                    precio=precio, 
-                    es_helado=es_helado, 
-                    peso_helado=peso, 
-                    es_combo=False, 
-                    insumo_id=id_insumo_final
-                )
-                db.session.add(nuevo_prod)
-                db.session.commit()
-                flash(f"Producto '{nombre}' creado.")
+            componentes = {int(item_id): int(request.form.get(f'cantidad_{item_id}', 1))
+                           for item_id in request.form.getlist('componentes')} if tipo == 'combo' else None
+            exito, msg = gestor.crear_producto(request.form.get('nombre'), float(request.form.get('precio')), tipo,
+                                               peso=float(request.form.get('peso', 0) or 0),
+                                               insumo_id=request.form.get('insumo_id'), componentes=componentes)
+            flash(msg)
 
         return redirect(url_for('gestion_precios'))
         
     productos = gestor.obtener_productos()
     return render_template('admin_precios.html', productos=productos, insumos=insumos, productos_para_combo=todos_los_productos)
 
+# --- GESTIÓN DE PROMOS (CONFIGURADOR DE COMBOS) ---
+@app.route('/admin/promos', methods=['GET', 'POST'])
+@login_required
+def gestion_promos():
+    if current_user.rol != 'admin': return redirect(url_for('vender'))
+
+    if request.method == 'POST':
+        accion = request.form.get('accion')
+        id_promo_form = request.form.get('id_promo_actual')
+
+        if accion == 'agregar_item':
+            # Un combo que termine conteniéndose a sí mismo se rechaza acá (no al vender)
+            exito, msg = gestor.agregar_item_a_promo(id_promo_form, request.form.get('id_producto_hijo'),
+                                                     request.form.get('cantidad', 1))
+            flash(msg)
+
+        elif accion == 'eliminar_item':
+            exito, msg = gestor.eliminar_item_de_promo(request.form.get('id_combo_item'))
+            flash(msg)
+
+        return redirect(url_for('gestion_promos', id_promo=id_promo_form))
+
+    promo_seleccionada = None
+    items_actuales = []
+    id_seleccionado = request.args.get('id_promo', type=int)
+    if id_seleccionado:
+        promo_seleccionada = db.session.get(Producto, id_seleccionado)
+        items_actuales = gestor.obtener_items_de_promo(id_seleccionado)
+
+    return render_template('admin_promos.html',
+                           promos=Producto.query.filter_by(es_combo=True).all(),
+                           productos=Producto.query.all(),
+                           promo_actual=promo_seleccionada,
+                           items=items_actuales)
+
 # --- REPORTES EXCEL (GESTOR MULTI-HOJA) ---
+def _leer_rango_fechas(datos):
+    """Fechas 'YYYY-MM-DD' del formulario -> (inicio 00:00:00, fin 23:59:59)"""
+    fecha_inicio = datetime.strptime(datos.get('fecha_inicio'), '%Y-%m-%d')
+    fecha_fin = datetime.strptime(datos.get('fecha_fin'), '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+    return fecha_inicio, fecha_fin
+
 @app.route('/admin/reporte', methods=['POST'])
 @login_required
 def descargar_reporte():
     if current_user.rol != 'admin': return redirect(url_for('vender'))
     
     fecha_inicio_str = request.form.get('fecha_inicio')
-    fecha_fin_str = request.form.get('fecha_fin')
 
     try:
-        fecha_inicio = datetime.strptime(fecha_inicio_str, '%Y-%m-%d')
-        fecha_fin = datetime.strptime(fecha_fin_str, '%Y-%m-%d').replace(hour=23, minute=59, second=59)
+        fecha_inicio, fecha_fin = _leer_rango_fechas(request.form)
+
+        # Si ya se generó en segundo plano (mismo rango, sin ventas nuevas), se sirve de disco
+        en_cache = trabajos_reporte.archivo_en_cache(fecha_inicio, fecha_fin)
+        if en_cache:
+            return send_file(en_cache, as_attachment=True, download_name=f"Reporte_{fecha_inicio_str}.xlsx", mimetype=MIMETYPE_EXCEL)
         
         excel_file = gestor.generar_reporte_excel(fecha_inicio, fecha_fin)
 
@@ -346,12 +514,74 @@ def descargar_reporte():
             flash("No hay ventas en ese rango.")
             return redirect(url_for('admin_dashboard'))
 
-        return send_file(excel_file, as_attachment=True, download_name=f"Reporte_{fecha_inicio_str}.xlsx", mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        return send_file(excel_file, as_attachment=True, download_name=f"Reporte_{fecha_inicio_str}.xlsx", mimetype=MIMETYPE_EXCEL)
 
-    except Exception as e:
-        print(f"Error reporte: {e}")
+    except Exception:
+        app.logger.exception("Error generando el reporte")
         flash("Error fechas.")
         return redirect(url_for('admin_dashboard'))
 
+# --- EXPORTACIÓN CSV / JSON LINES (STREAMING, PARA CONTABILIDAD) ---
+@app.route('/admin/reporte/exportar')
+@login_required
+def exportar_ventas():
+    if current_user.rol != 'admin': return "No autorizado", 403
+
+    formato = request.args.get('formato', 'csv')
+    if formato not in exportacion.FORMATOS: return "Formato inválido", 400
+    try:
+        fecha_inicio, fecha_fin = _leer_rango_fechas(request.args)
+    except (TypeError, ValueError):
+        return "Fechas inválidas", 400
+    comprimir = request.args.get('gzip') in ('1', 'on')
+
+    # Se genera mientras se descarga: la primera fila sale enseguida y la memoria no crece con el rango
+    cuerpo = exportacion.exportar_ventas(formato, fecha_inicio, fecha_fin, request.args.get('sucursal'), comprimir)
+    nombre = exportacion.nombre_archivo(formato, fecha_inicio, fecha_fin, comprimir)
+    mimetype = 'application/gzip' if comprimir else exportacion.FORMATOS[formato][0]
+    return Response(stream_with_context(cuerpo), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{nombre}"', 'X-Accel-Buffering': 'no'})
+
+# --- REPORTES EN SEGUNDO PLANO (ENVIAR / CONSULTAR / DESCARGAR) ---
+def _estado_trabajo(trabajo):
+    datos = {'id': trabajo.id, 'estado': trabajo.estado, 'error': trabajo.error}
+    if trabajo.estado == 'listo':
+        datos['url_descarga'] = url_for('descargar_trabajo_reporte', id_trabajo=trabajo.id)
+    return datos
+
+@app.route('/admin/reporte/trabajos', methods=['POST'])
+@login_required
+def crear_trabajo_reporte():
+    if current_user.rol != 'admin': return jsonify({'success': False, 'msg': 'Sin permiso'}), 403
+
+    try:
+        fecha_inicio, fecha_fin = _leer_rango_fechas(request.get_json(silent=True) or request.form)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'msg': 'Fechas inválidas'}), 400
+
+    trabajo = trabajos_reporte.enviar(fecha_inicio, fecha_fin)
+    return jsonify(_estado_trabajo(trabajo)), 202
+
+@app.route('/admin/reporte/trabajos/<id_trabajo>')
+@login_required
+def estado_trabajo_reporte(id_trabajo):
+    if current_user.rol != 'admin': return jsonify({'success': False, 'msg': 'Sin permiso'}), 403
+
+    trabajo = trabajos_reporte.obtener(id_trabajo)
+    if not trabajo: return jsonify({'success': False, 'msg': 'Trabajo inexistente'}), 404
+    return jsonify(_estado_trabajo(trabajo))
+
+@app.route('/admin/reporte/trabajos/<id_trabajo>/descargar')
+@login_required
+def descargar_trabajo_reporte(id_trabajo):
+    if current_user.rol != 'admin': return redirect(url_for('vender'))
+
+    trabajo = trabajos_reporte.obtener(id_trabajo)
+    if not trabajo or trabajo.estado != 'listo' or not os.path.exists(trabajo.archivo):
+        flash("El reporte no está disponible.")
+        return redirect(url_for('admin_dashboard'))
+
+    return send_file(trabajo.archivo, as_attachment=True, download_name=f"Reporte_{trabajo.fecha_inicio:%Y-%m-%d}.xlsx", mimetype=MIMETYPE_EXCEL)
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
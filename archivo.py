@@ -0,0 +1,164 @@
+# archivo.py - VENTAS VIEJAS EN UNA BASE APARTE (ATTACH + UNION ALL)
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import MetaData, Table, Column, Index, event, select, delete, func, union_all, exists, and_, or_
+from sqlalchemy.orm import aliased
+
+from models import db, Venta, VentaItem, VentaItemSabor, CierreCaja
+from base_datos import reintentar_si_bloqueada
+
+# Nombre con el que se adjunta el archivo en cada conexión (archivo.venta, archivo.venta_item, ...)
+ESQUEMA = 'archivo'
+VENTAS_POR_LOTE = 5000
+
+metadata_archivo = MetaData()
+
+
+def _copiar_tabla(tabla):
+    # Mismas columnas e índices; sin claves foráneas (SQLite no las admite entre bases adjuntas)
+    columnas = [
+        Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable,
+               server_default=c.server_default.arg if c.server_default is not None else None)
+        for c in tabla.columns
+    ]
+    indices = [Index(i.name, *(c.name for c in i.columns), unique=i.unique) for i in tabla.indexes]
+    return Table(tabla.name, metadata_archivo, *columnas, *indices, schema=ESQUEMA)
+
+
+_TABLAS = {modelo: _copiar_tabla(modelo.__table__) for modelo in (Venta, VentaItem, VentaItemSabor)}
+VentaArchivo = aliased(Venta, _TABLAS[Venta], adapt_on_names=True)
+VentaItemArchivo = aliased(VentaItem, _TABLAS[VentaItem], adapt_on_names=True)
+VentaItemSaborArchivo = aliased(VentaItemSabor, _TABLAS[VentaItemSabor], adapt_on_names=True)
+
+# (Venta, VentaItem, VentaItemSabor) de la base caliente y del archivo
+FUENTES = ((Venta, VentaItem, VentaItemSabor), (VentaArchivo, VentaItemArchivo, VentaItemSaborArchivo))
+
+
+def ruta_por_defecto(engine):
+    """heladeria.db -> heladeria_archivo.db (en la misma carpeta); base en memoria -> archivo en memoria."""
+    base = engine.url.database
+    if not base or base == ':memory:': return ':memory:'
+    raiz, extension = os.path.splitext(base)
+    return f"{raiz}_archivo{extension or '.db'}"
+
+
+def configurar_archivo(engine, ruta):
+    """Adjunta el archivo en cada conexión nueva del pool (registrar después de configurar_sqlite)."""
+    @event.listens_for(engine, 'connect')
+    def _adjuntar(conexion_dbapi, registro):
+        cursor = conexion_dbapi.cursor()
+        cursor.execute(f"ATTACH DATABASE ? AS {ESQUEMA}", (ruta,))
+        cursor.execute(f"PRAGMA {ESQUEMA}.journal_mode=WAL")
+        cursor.execute(f"PRAGMA {ESQUEMA}.synchronous=NORMAL")
+        cursor.close()
+
+
+def crear_tablas(engine):
+    """Crea las tablas del archivo si faltan (barato: se llama al arrancar la app)."""
+    metadata_archivo.create_all(engine, checkfirst=True)
+
+
+def en_ambas(construir):
+    """
+    UNION ALL de la misma consulta sobre la base caliente y el archivo.
+    'construir' recibe (Venta, VentaItem, VentaItemSabor) y devuelve un select.
+    Cada mitad usa sus propios índices; SQLite mezcla las dos (también con ORDER BY ... LIMIT).
+    Una vista UNION ALL no sirve para los JOIN: SQLite la materializa entera.
+    """
+    return union_all(*(construir(*fuente) for fuente in FUENTES))
+
+
+def ids_cliente_registrados(ids):
+    """
+    Los id_cliente de 'ids' que ya tienen venta, en la base caliente o en el archivo.
+    El índice único solo cubre cada base por separado: un reenvío (o reimportación) de una
+    venta ya archivada la duplicaría.
+    """
+    ids = [i for i in ids if i]
+    if not ids: return set()
+    return set(db.session.execute(en_ambas(
+        lambda V, *_: select(V.id_cliente).where(V.id_cliente.in_(ids))
+    )).scalars())
+
+
+# --- ARCHIVAR ---
+def archivar(dias, hasta_venta_id, hasta_dia, tamanio_lote=VENTAS_POR_LOTE, al_avanzar=None):
+    """
+    Mueve al archivo las ventas de más de 'dias' días que ya están en una caja cerrada (o importadas),
+    en días ya resumidos (<= hasta_dia) y ya sumadas al pronóstico (id <= hasta_venta_id).
+    Los cierres sin rango de ids (anteriores a esa columna) no cuentan: correr antes indexar-cierres.
+    Lote por lote y en orden de id; si se corta, volver a correrlo completa lo que faltó.
+    Devuelve la cantidad de ventas archivadas.
+    """
+    limite = min(datetime.now() - timedelta(days=dias), datetime.combine(hasta_dia + timedelta(days=1), datetime.min.time()))
+    # Caja cerrada: por id, igual que los turnos (la hora de la terminal puede estar corrida).
+    # Las importadas no son de ningún turno: alcanza con la antigüedad
+    ultimo_cerrado = select(func.max(CierreCaja.venta_hasta_id)).where(CierreCaja.sucursal == Venta.sucursal).scalar_subquery()
+    condicion = (
+        Venta.fecha < limite, Venta.id <= hasta_venta_id,
+        or_(Venta.importada.is_(True), Venta.id <= ultimo_cerrado),
+        # Sin renglones todavía: una vez archivada, migrar-items ya no la encontraría
+        Venta.items.any(),
+        Venta.id.not_in(_centinelas()),
+    )
+
+    total, desde_id = 0, 0
+    while True:
+        ids = db.session.execute(
+            select(Venta.id).where(Venta.id > desde_id, *condicion).order_by(Venta.id).limit(tamanio_lote)
+        ).scalars().all()
+        db.session.rollback() # Cierra la lectura: cada lote es su propia transacción
+        if not ids: return total
+        _mover_lote(ids)
+        total += len(ids)
+        desde_id = ids[-1]
+        if al_avanzar: al_avanzar(total)
+
+
+def _centinelas():
+    """
+    Ventas que no se mueven: la que tiene el id más alto de venta, de venta_item y de venta_item_sabor.
+    Sin AUTOINCREMENT, SQLite da max(id) + 1: si la fila más alta de una tabla se fuera al archivo,
+    la próxima venta reusaría un id que ya está archivado.
+    """
+    ultimo_item = select(func.max(VentaItem.id)).scalar_subquery()
+    ultimo_sabor = select(func.max(VentaItemSabor.id)).scalar_subquery()
+    consultas = (
+        select(func.max(Venta.id)),
+        select(VentaItem.venta_id).where(VentaItem.id == ultimo_item),
+        select(VentaItem.venta_id).join(VentaItemSabor, VentaItemSabor.venta_item_id == VentaItem.id)
+                                  .where(VentaItemSabor.id == ultimo_sabor),
+    )
+    return {id_venta for consulta in consultas for id_venta in db.session.execute(consulta).scalars() if id_venta}
+
+
+@reintentar_si_bloqueada
+def _mover_lote(ids):
+    # Con WAL el commit es atómico por archivo, no entre los dos: un lote cortado puede quedar
+    # copiado pero no borrado. Al repetirlo se saltean solo las filas idénticas ya archivadas;
+    # un id archivado con otro contenido hace fallar el INSERT (nunca se borra algo que no se copió)
+    items = select(VentaItem.id).where(VentaItem.venta_id.in_(ids))
+    pasos = (
+        (Venta, Venta.id.in_(ids)),
+        (VentaItem, VentaItem.venta_id.in_(ids)),
+        (VentaItemSabor, VentaItemSabor.venta_item_id.in_(items)),
+    )
+    for modelo, filtro in pasos:
+        tabla, origen = _TABLAS[modelo], modelo.__table__
+        columnas = [c.name for c in tabla.columns]
+        # Misma fila (IS compara también los NULL); el id va primero para que use la clave primaria
+        # (alias: si no, SQLAlchemy confunde archivo.venta con venta por tener el mismo nombre)
+        copia = tabla.alias('copia')
+        ya_copiada = exists().where(and_(copia.c.id == origen.c.id, *(copia.c[c].is_(origen.c[c]) for c in columnas)))
+        db.session.execute(
+            tabla.insert().from_select(columnas, select(*(origen.c[c] for c in columnas)).where(filtro, ~ya_copiada))
+        )
+    for modelo, filtro in reversed(pasos):
+        db.session.execute(delete(modelo).where(filtro).execution_options(synchronize_session=False))
+    db.session.commit()
+
+
+def compactar():
+    """VACUUM de la base caliente: devuelve al disco el espacio de lo archivado."""
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conexion:
+        conexion.exec_driver_sql("VACUUM main")
@@ -0,0 +1,81 @@
+# base_datos.py - AJUSTES DE SQLITE PARA VARIOS WORKERS (WAL + REINTENTOS)
+import functools
+import random
+import sqlite3
+import time
+from contextvars import ContextVar
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm.exc import StaleDataError
+
+from models import db
+
+# Se aplican en cada conexión nueva del pool
+PRAGMAS_SQLITE = {
+    'journal_mode': 'WAL',       # Los lectores (reportes) no bloquean al que escribe (ventas)
+    'synchronous': 'NORMAL',     # Con WAL sigue siendo seguro ante cortes; mucho menos fsync
+    'cache_size': -32000,        # ~32 MB de caché de páginas por conexión (negativo = KiB)
+    'mmap_size': 268435456,      # 256 MB leídos por mmap: menos copias en reportes grandes
+    'temp_store': 'MEMORY',      # GROUP BY / ORDER BY temporales en memoria
+}
+
+# Reintentos ante "database is locked" o un conflicto optimista (StaleDataError)
+INTENTOS_BLOQUEO = 6
+ESPERA_INICIAL = 0.05 # segundos; se duplica en cada intento (+ azar)
+
+_en_reintento = ContextVar('_en_reintento', default=False)
+
+
+def configurar_sqlite(engine):
+    """Registra los PRAGMA para todas las conexiones del engine."""
+    @event.listens_for(engine, 'connect')
+    def _aplicar_pragmas(conexion_dbapi, registro):
+        if not isinstance(conexion_dbapi, sqlite3.Connection): return
+        cursor = conexion_dbapi.cursor()
+        for pragma, valor in PRAGMAS_SQLITE.items():
+            cursor.execute(f"PRAGMA {pragma}={valor}")
+        cursor.close()
+
+
+def abrir_lectura_consistente():
+    """
+    pysqlite no abre transacción para los SELECT: cada consulta ve la base como está en ese momento.
+    Con un BEGIN explícito, todas las lecturas hasta el próximo commit/rollback ven la misma foto (WAL).
+    """
+    conexion = db.session.connection()
+    if not conexion.connection.dbapi_connection.in_transaction:
+        conexion.exec_driver_sql("BEGIN")
+
+
+def es_bloqueo(error):
+    texto = str(getattr(error, 'orig', error)).lower()
+    return 'database is locked' in texto or 'database is busy' in texto
+
+
+def reintentar_si_bloqueada(funcion):
+    """
+    Vuelve a ejecutar la unidad de trabajo completa si SQLite respondió "database is locked"
+    o si otro proceso cambió lo que se había leído (StaleDataError: control optimista).
+    Antes de reintentar hace rollback, así la sesión arranca limpia y relee todo.
+    Si ya estamos dentro de otra función con reintento, reintenta la de afuera.
+    """
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        if _en_reintento.get():
+            return funcion(*args, **kwargs)
+
+        marca = _en_reintento.set(True)
+        try:
+            espera = ESPERA_INICIAL
+            for intento in range(1, INTENTOS_BLOQUEO + 1):
+                try:
+                    return funcion(*args, **kwargs)
+                except (OperationalError, StaleDataError) as e:
+                    if not (isinstance(e, StaleDataError) or es_bloqueo(e)) or intento == INTENTOS_BLOQUEO:
+                        raise
+                    db.session.rollback()
+                    time.sleep(espera + random.uniform(0, espera))
+                    espera *= 2
+        finally:
+            _en_reintento.reset(marca)
+    return envoltura
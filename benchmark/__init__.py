@@ -0,0 +1,20 @@
+# benchmark - DATOS SINTÉTICOS A ESCALA + MEDICIÓN DE LOS CAMINOS CALIENTES
+#
+#   python -m benchmark generar --ventas 2000000 --anios 3 --sucursales 6 --sabores 60
+#   python -m benchmark medir --salida resultados.json
+#   python -m benchmark comparar antes.json despues.json
+#
+# Trabaja sobre su propia base (instance/benchmark.db), nunca sobre heladeria.db.
+import os
+import sys
+
+URI_BENCHMARK = 'sqlite:///benchmark.db?timeout=15'
+
+# 'generar' hace drop_all: con cualquier otra base (ej: HELADERIA_DB_URI de producción en el entorno) no se arranca
+if os.environ.get('HELADERIA_DB_URI', URI_BENCHMARK) != URI_BENCHMARK:
+    raise SystemExit(f"HELADERIA_DB_URI apunta a {os.environ['HELADERIA_DB_URI']!r}: el benchmark solo corre sobre {URI_BENCHMARK!r}")
+if 'app' in sys.modules:
+    raise SystemExit("'app' ya estaba importada con su base: importar benchmark antes que app")
+
+# Tiene que quedar definido antes de que alguien importe 'app'
+os.environ['HELADERIA_DB_URI'] = URI_BENCHMARK
@@ -0,0 +1,110 @@
+# benchmark/__main__.py - LÍNEA DE COMANDOS: generar / medir / comparar
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime
+
+
+def generar(ventas, anios, sucursales, sabores, semilla):
+    """Rehace la base del benchmark con datos sintéticos."""
+    from benchmark.datos import GeneradorVentas
+    inicio = time.perf_counter()
+    print(f"🏗️ Generando {ventas} ventas en {anios} años ({sucursales} sucursales, {sabores} sabores)...")
+    GeneradorVentas(ventas, anios, sucursales, sabores, semilla).generar(
+        al_avanzar=lambda hechas, total: print(f"   ... {hechas}/{total} ventas")
+    )
+    print(f"✅ Base lista en {time.perf_counter() - inicio:.0f}s.")
+
+
+def medir(salida, repeticiones, repeticiones_reporte, solo=None):
+    """Corre los escenarios y guarda los resultados en JSON."""
+    from benchmark.medicion import Escenarios
+    from app import app, db, gestor
+    from models import Venta, Sabor
+
+    with app.app_context():
+        volumen = {
+            'ventas': db.session.query(db.func.count(Venta.id)).scalar(),
+            'sucursales': len(gestor.obtener_sucursales()),
+            'sabores': Sabor.query.count(),
+        }
+    print(f"⏱️ Midiendo sobre {volumen['ventas']} ventas...")
+
+    resultados = Escenarios(repeticiones, repeticiones_reporte).correr(
+        solo=solo,
+        al_terminar=lambda nombre, r: print(f"   {nombre:<32} p50 {r['p50_ms']:>9.2f} ms  p95 {r['p95_ms']:>9.2f} ms  "
+                                           f"{r['consultas']:>6} consultas  {r['memoria_pico_kb']:>9.1f} KB")
+    )
+    informe = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'commit': _commit_actual(),
+        'python': platform.python_version(),
+        'base': os.environ.get('HELADERIA_DB_URI'),
+        'volumen': volumen,
+        'resultados': resultados,
+    }
+    with open(salida, 'w', encoding='utf-8') as archivo:
+        json.dump(informe, archivo, ensure_ascii=False, indent=2)
+    print(f"✅ Resultados en {salida}")
+
+
+def comparar(antes, despues):
+    """Muestra la diferencia de p50/p95/consultas/memoria entre dos corridas."""
+    with open(antes, encoding='utf-8') as a, open(despues, encoding='utf-8') as d:
+        viejo, nuevo = json.load(a), json.load(d)
+    print(f"{viejo.get('commit') or antes} -> {nuevo.get('commit') or despues}")
+    for nombre, r in nuevo['resultados'].items():
+        previo = viejo['resultados'].get(nombre)
+        if not previo:
+            print(f"   {nombre:<32} (nuevo)")
+            continue
+        cambios = "  ".join(
+            f"{metrica} {_variacion(previo[metrica], r[metrica])}"
+            for metrica in ('p50_ms', 'p95_ms', 'consultas', 'memoria_pico_kb')
+        )
+        print(f"   {nombre:<32} {cambios}")
+
+
+def _variacion(antes, despues):
+    if not antes: return f"{despues}"
+    return f"{(despues - antes) / antes * 100:+.0f}%"
+
+
+def _commit_actual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="Benchmark de la heladería con datos a escala")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+
+    p = comandos.add_parser('generar', help=generar.__doc__)
+    p.add_argument('--ventas', type=int, default=1000000)
+    p.add_argument('--anios', type=float, default=3)
+    p.add_argument('--sucursales', type=int, default=4)
+    p.add_argument('--sabores', type=int, default=40)
+    p.add_argument('--semilla', type=int, default=42)
+    p.set_defaults(funcion=generar)
+
+    p = comandos.add_parser('medir', help=medir.__doc__)
+    p.add_argument('--salida', default='benchmark.json')
+    p.add_argument('--repeticiones', type=int, default=50)
+    p.add_argument('--repeticiones-reporte', type=int, default=3, help="Los reportes son lentos: menos vueltas")
+    p.add_argument('--solo', nargs='+', help="Nombres de escenarios a correr")
+    p.set_defaults(funcion=medir)
+
+    p = comandos.add_parser('comparar', help=comparar.__doc__)
+    p.add_argument('antes')
+    p.add_argument('despues')
+    p.set_defaults(funcion=comparar)
+
+    args = vars(parser.parse_args())
+    args.pop('comando')
+    args.pop('funcion')(**args)
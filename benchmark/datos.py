@@ -0,0 +1,204 @@
+# benchmark/datos.py - GENERADOR DE VENTAS SINTÉTICAS (AÑOS DE HISTORIA, VARIAS SUCURSALES)
+import math
+from datetime import date, datetime, timedelta
+import numpy as np
+
+from app import app, db, gestor
+from init_db import cargar_datos_completos
+from models import Sabor, Venta, VentaItem, VentaItemSabor, CierreCaja, StockSabor, StockInsumo
+from stock import registrar_movimiento, crear_filas_stock
+
+NOMBRES_SUCURSALES = ["Canning", "Ezeiza", "Monte Grande", "Adrogué", "Lomas de Zamora", "Temperley", "Burzaco", "Longchamps"]
+NOMBRES_SABORES = [
+    "Banana Split", "Mascarpone", "Pistacho", "Cereza", "Crema Rusa", "Tiramisú", "Maracuyá", "Durazno",
+    "Ananá", "Kinotos al Whisky", "Crema Oreo", "Marroc", "Coco", "Mousse de Limón", "Chocolate Amargo", "Cookies",
+]
+# Medio de pago: proporciones típicas de mostrador
+MEDIOS_PAGO = (("Efectivo", 0.45), ("MercadoPago", 0.35), ("Tarjeta", 0.20))
+# Productos por carrito
+PRODUCTOS_POR_CARRITO = ((1, 0.60), (2, 0.28), (3, 0.09), (4, 0.03))
+# Peso relativo de cada producto (los que no figuran valen 1)
+PESO_PRODUCTO = {"Cucurucho Chico": 5, "Cucurucho Grande": 4, "1/4 kg": 4, "Vasito": 3, "1/2 kg": 3, "1 kg": 2}
+# Ventas por hora del día (12 a 23 hs): la tarde-noche es la hora pico
+PESO_HORA = {12: 2, 13: 3, 14: 3, 15: 3, 16: 4, 17: 5, 18: 6, 19: 7, 20: 8, 21: 9, 22: 7, 23: 4}
+FILAS_POR_INSERT = 50000
+
+
+class GeneradorVentas:
+    """
+    Rehace la base del benchmark: catálogo de init_db + sucursales y sabores extra
+    + 'ventas' ventas repartidas en 'anios' años con estacionalidad (verano, fines de semana,
+    hora pico), con renglones y sabores como los que arma la venta real.
+    Las filas se insertan con executemany directo del driver (como el importador).
+    """
+
+    def __init__(self, ventas=1000000, anios=3, sucursales=4, sabores=40, semilla=42):
+        self.ventas = ventas
+        self.anios = anios
+        self.sucursales = sucursales
+        self.sabores = sabores
+        self.rng = np.random.default_rng(semilla)
+
+    def generar(self, al_avanzar=None):
+        cargar_datos_completos()
+        with app.app_context():
+            self._completar_catalogo()
+            self._insertar_ventas(al_avanzar)
+            self._insertar_cierres()
+            self._reponer_stock()
+            # Estado "de producción": resúmenes, pronóstico y turnos al día
+            for sucursal in gestor.obtener_sucursales():
+                gestor.indexar_cierres(sucursal.nombre)
+            gestor.reconstruir_turnos_abiertos()
+            gestor.resumenes.actualizar()
+            gestor.pronostico.actualizar()
+            gestor.consolidar_stock()
+
+    # --- CATÁLOGO ---
+    def _completar_catalogo(self):
+        existentes = len(gestor.obtener_sucursales())
+        for n in range(existentes, self.sucursales):
+            nombre = NOMBRES_SUCURSALES[n - existentes] if n - existentes < len(NOMBRES_SUCURSALES) else f"Sucursal {n + 1}"
+            gestor.crear_sucursal(nombre)
+
+        actuales = Sabor.query.count()
+        for n in range(actuales, self.sabores):
+            nombre = NOMBRES_SABORES[n - actuales] if n - actuales < len(NOMBRES_SABORES) else f"Sabor {n + 1}"
+            db.session.add(Sabor(nombre=nombre, activo=True))
+        db.session.flush()
+        crear_filas_stock()
+        gestor.invalidar_catalogo()
+        db.session.commit()
+
+    def _reponer_stock(self):
+        for sucursal in gestor.obtener_sucursales():
+            for sabor in Sabor.query.all():
+                registrar_movimiento(StockSabor, 'reposicion', sabor.id, sucursal.id, 60000)
+            for insumo in gestor.obtener_insumos():
+                registrar_movimiento(StockInsumo, 'reposicion', insumo.id, sucursal.id, 2000)
+        db.session.commit()
+
+    # --- VENTAS ---
+    def _insertar_ventas(self, al_avanzar=None):
+        catalogo = gestor.catalogo.obtener()
+        sucursales = [s.nombre for s in catalogo.sucursales_con_stock()]
+        productos = list(catalogo.productos_por_id.values())
+        sabores = [s.nombre for s in Sabor.query.order_by(Sabor.id)]
+
+        fechas = self._fechas()
+        n = len(fechas)
+        # Sucursales con distinto movimiento (la primera es la que más vende)
+        peso_sucursal = _normalizar([1 / (i + 1) ** 0.5 for i in range(len(sucursales))])
+        id_sucursal = self.rng.choice(len(sucursales), size=n, p=peso_sucursal)
+        medio = self.rng.choice(len(MEDIOS_PAGO), size=n, p=_normalizar([p for _, p in MEDIOS_PAGO]))
+        cantidad_items = self.rng.choice([c for c, _ in PRODUCTOS_POR_CARRITO], size=n, p=_normalizar([p for _, p in PRODUCTOS_POR_CARRITO]))
+
+        # Todos los productos y sabores sorteados de una vez; el bucle solo arma los textos
+        total_items = int(cantidad_items.sum())
+        id_producto = self.rng.choice(len(productos), size=total_items, p=_normalizar([PESO_PRODUCTO.get(p.nombre, 1) for p in productos]))
+        # Popularidad de sabores tipo Zipf (unos pocos se llevan la mayoría)
+        sabor_sorteado = self.rng.choice(len(sabores), size=total_items * 4, p=_normalizar([1 / (i + 1) ** 0.8 for i in range(len(sabores))]))
+        gustos_sorteados = self.rng.integers(1, 5, size=total_items)
+
+        textos_combo = {
+            p.id: " [" + " + ".join(f"{c}x {h.nombre}" if c > 1 else h.nombre for h, c in catalogo.componentes(p.id)) + "]"
+            for p in productos if p.es_combo and catalogo.componentes(p.id)
+        }
+        max_gustos = [_max_gustos(catalogo.gramos_helado(p)) for p in productos]
+        gramos = [catalogo.gramos_helado(p) for p in productos]
+
+        id_venta = (db.session.query(db.func.max(Venta.id)).scalar() or 0) + 1
+        id_item = (db.session.query(db.func.max(VentaItem.id)).scalar() or 0) + 1
+        filas_venta, filas_item, filas_sabor = [], [], []
+        posicion_item = 0
+        for i in range(n):
+            total = 0.0
+            detalle = []
+            for _ in range(cantidad_items[i]):
+                indice = id_producto[posicion_item]
+                producto = productos[indice]
+                elegidos = []
+                if max_gustos[indice]:
+                    cantidad = min(gustos_sorteados[posicion_item], max_gustos[indice])
+                    inicio = posicion_item * 4
+                    elegidos = list(dict.fromkeys(sabores[s] for s in sabor_sorteado[inicio:inicio + cantidad]))
+                texto = producto.nombre + textos_combo.get(producto.id, "")
+                texto += f" ({', '.join(elegidos)})" if elegidos else " (Sin sabores)"
+
+                filas_item.append((id_item, id_venta, producto.id, producto.nombre, texto, producto.precio, 1))
+                for nombre in elegidos:
+                    filas_sabor.append((id_item, nombre, gramos[indice] / len(elegidos)))
+                total += producto.precio
+                detalle.append(texto)
+                id_item += 1
+                posicion_item += 1
+
+            filas_venta.append((id_venta, fechas[i], total, MEDIOS_PAGO[medio[i]][0], "; ".join(detalle), sucursales[id_sucursal[i]]))
+            id_venta += 1
+
+            if len(filas_venta) >= FILAS_POR_INSERT:
+                self._volcar(filas_venta, filas_item, filas_sabor)
+                filas_venta, filas_item, filas_sabor = [], [], []
+                if al_avanzar: al_avanzar(i + 1, n)
+
+        if filas_venta:
+            self._volcar(filas_venta, filas_item, filas_sabor)
+            if al_avanzar: al_avanzar(n, n)
+
+    def _fechas(self):
+        """Fechas (texto, ordenadas) hasta ayer: más en verano, fines de semana y a la noche."""
+        hasta = date.today() - timedelta(days=1)
+        dias = [hasta - timedelta(days=d) for d in range(int(self.anios * 365))][::-1]
+        peso_dia = []
+        for dia in dias:
+            # Pico a mediados de enero (verano), piso en julio
+            estacion = 1 + 0.6 * math.cos(2 * math.pi * (dia.timetuple().tm_yday - 15) / 365)
+            peso_dia.append(estacion * (1.5 if dia.weekday() >= 4 else 1.0))
+
+        dia = self.rng.choice(len(dias), size=self.ventas, p=_normalizar(peso_dia))
+        horas = list(PESO_HORA)
+        hora = self.rng.choice(horas, size=self.ventas, p=_normalizar(list(PESO_HORA.values())))
+        segundos = self.rng.integers(0, 3600, size=self.ventas)
+        orden = np.lexsort((segundos, hora, dia))
+
+        inicio = datetime.combine(dias[0], datetime.min.time())
+        return [
+            (inicio + timedelta(days=int(dia[i]), hours=int(hora[i]), seconds=int(segundos[i]))).isoformat(' ', 'microseconds')
+            for i in orden
+        ]
+
+    def _volcar(self, filas_venta, filas_item, filas_sabor):
+        conexion = db.session.connection()
+        conexion.exec_driver_sql(
+            f"INSERT INTO {Venta.__tablename__} (id, fecha, total, medio_pago, detalle, sucursal) VALUES (?, ?, ?, ?, ?, ?)", filas_venta)
+        conexion.exec_driver_sql(
+            f"INSERT INTO {VentaItem.__tablename__} (id, venta_id, producto_id, nombre_producto, descripcion, precio_unitario, cantidad) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", filas_item)
+        conexion.exec_driver_sql(
+            f"INSERT INTO {VentaItemSabor.__tablename__} (venta_item_id, sabor_nombre, gramos) VALUES (?, ?, ?)", filas_sabor)
+        db.session.commit()
+
+    def _insertar_cierres(self):
+        """Un cierre por sucursal y día (23:59), así el turno abierto arranca vacío."""
+        dia = db.func.date(Venta.fecha)
+        filas = db.session.query(Venta.sucursal, dia, db.func.sum(Venta.total), db.func.count(Venta.id))\
+                          .group_by(Venta.sucursal, dia).all()
+        db.session.bulk_insert_mappings(CierreCaja, [
+            {'sucursal': sucursal, 'fecha_cierre': datetime.fromisoformat(texto_dia).replace(hour=23, minute=59, second=59),
+             'monto_total': monto, 'cantidad_ventas': cantidad}
+            for sucursal, texto_dia, monto, cantidad in filas
+        ])
+        db.session.commit()
+
+
+def _normalizar(pesos):
+    total = float(sum(pesos))
+    return [p / total for p in pesos]
+
+
+def _max_gustos(gramos):
+    """Gustos que admite el producto según su peso (0 = no lleva helado)."""
+    if gramos <= 0: return 0
+    if gramos >= 1000: return 4
+    if gramos >= 500: return 3
+    return 2
@@ -0,0 +1,152 @@
+# benchmark/medicion.py - TIEMPOS (p50/p95), CONSULTAS Y MEMORIA PICO DE CADA ESCENARIO
+import gc
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from sqlalchemy import event
+
+from app import app, db, gestor
+from models import Sabor
+
+
+class ContadorConsultas:
+    """Cuenta las sentencias SQL que pasan por el engine mientras está activo."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.total = 0
+
+    def _contar(self, *args):
+        self.total += 1
+
+    def __enter__(self):
+        self.total = 0
+        event.listen(self.engine, 'before_cursor_execute', self._contar)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._contar)
+
+
+def medir(funcion, repeticiones, preparar=None):
+    """
+    Corre 'funcion' N veces y devuelve {p50_ms, p95_ms, media_ms, consultas, memoria_pico_kb}.
+    La memoria se mide en una corrida aparte: tracemalloc hace todo 2-3 veces más lento
+    y arruinaría los tiempos.
+    """
+    tiempos, consultas = [], []
+    contador = ContadorConsultas(db.engine)
+    for _ in range(repeticiones):
+        if preparar: preparar()
+        gc.collect()
+        with contador:
+            inicio = time.perf_counter()
+            funcion()
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        consultas.append(contador.total)
+
+    if preparar: preparar()
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        funcion()
+        pico = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'repeticiones': repeticiones,
+        'p50_ms': round(_percentil(tiempos, 50), 3),
+        'p95_ms': round(_percentil(tiempos, 95), 3),
+        'media_ms': round(statistics.fmean(tiempos), 3),
+        'consultas': round(statistics.fmean(consultas), 1),
+        'memoria_pico_kb': round(pico / 1024, 1),
+    }
+
+
+def _percentil(valores, p):
+    if len(valores) == 1: return valores[0]
+    return statistics.quantiles(valores, n=100, method='inclusive')[p - 1]
+
+
+# --- ESCENARIOS ---
+class Escenarios:
+    """Los caminos calientes de la app, cada uno como función sin argumentos."""
+
+    def __init__(self, repeticiones=50, repeticiones_reporte=3, semilla=7):
+        self.repeticiones = repeticiones
+        self.repeticiones_reporte = repeticiones_reporte
+        self.rng = random.Random(semilla)
+
+    def correr(self, solo=None, al_terminar=None):
+        resultados = {}
+        with app.app_context():
+            self.sucursales = [s.nombre for s in gestor.obtener_sucursales()]
+            self.productos = [p.nombre for p in gestor.obtener_productos() if not p.es_combo]
+            self.sabores = [s.nombre for s in Sabor.query.filter_by(activo=True)]
+            db.session.commit()
+
+            for nombre, funcion, repeticiones, preparar in self._lista():
+                if solo and nombre not in solo: continue
+                resultados[nombre] = medir(funcion, repeticiones, preparar)
+                db.session.rollback()
+                if al_terminar: al_terminar(nombre, resultados[nombre])
+        return resultados
+
+    def _lista(self):
+        admin, vendedor = self._cliente('admin'), self._cliente_vendedor()
+        hasta = datetime.now()
+        rep = self.repeticiones
+        return [
+            ('procesar_carrito', lambda: gestor.procesar_carrito(self._carrito(), self._sucursal()), rep, None),
+            ('obtener_ventas_turno_actual', lambda: gestor.obtener_ventas_turno_actual(self.sucursales[0]), rep, None),
+            ('obtener_ventas_turno_actual_50', lambda: gestor.obtener_ventas_turno_actual(self.sucursales[0], limite=50), rep, None),
+            # Cada cierre necesita ventas abiertas: se vende antes (fuera del tiempo medido)
+            ('cerrar_caja_sucursal', lambda: gestor.cerrar_caja_sucursal(self.sucursales[0]), rep,
+             lambda: [gestor.procesar_carrito(self._carrito(), self.sucursales[0]) for _ in range(5)]),
+            ('reporte_excel_mes', lambda: gestor.generar_reporte_excel(hasta - timedelta(days=30), hasta), self.repeticiones_reporte, None),
+            # openpyxl escribe ~10.000 filas/s: un trimestre alcanza para ver la tendencia
+            ('reporte_excel_trimestre', lambda: gestor.generar_reporte_excel(hasta - timedelta(days=90), hasta),
+             self.repeticiones_reporte, None),
+            ('GET /admin', lambda: _pedir(admin, '/admin'), rep, None),
+            ('GET /admin/sabores', lambda: _pedir(admin, '/admin/sabores'), rep, None),
+            ('GET /admin/insumos', lambda: _pedir(admin, '/admin/insumos'), rep, None),
+            ('GET /mi_caja', lambda: _pedir(vendedor, '/mi_caja'), rep, None),
+            ('GET /api/catalogo (304)', lambda: _pedir(vendedor, '/api/catalogo', self._etag(vendedor), esperado=304), rep, None),
+        ]
+
+    def _sucursal(self):
+        return self.rng.choice(self.sucursales)
+
+    def _carrito(self):
+        items = [
+            {'formato': self.rng.choice(self.productos), 'sabores': self.rng.sample(self.sabores, self.rng.randint(1, 3))}
+            for _ in range(self.rng.choice([1, 1, 1, 2, 2, 3]))
+        ]
+        return {'items': items, 'medio_pago': self.rng.choice(["Efectivo", "MercadoPago", "Tarjeta"])}
+
+    def _cliente(self, usuario):
+        cliente = app.test_client()
+        with app.app_context():
+            cliente.post('/login', data={'username': usuario, 'password': '123'})
+        return cliente
+
+    def _cliente_vendedor(self):
+        from models import Usuario
+        vendedor = Usuario.query.filter_by(rol='vendedor').first()
+        return self._cliente(vendedor.username)
+
+    def _etag(self, cliente):
+        return {'If-None-Match': _pedir(cliente, '/api/catalogo').headers['ETag']}
+
+
+def _pedir(cliente, url, headers=None, esperado=200):
+    # Contexto propio por pedido, como en el servidor: si no, 'g' (y el usuario
+    # cacheado por flask_login) se compartiría entre clientes
+    with app.app_context():
+        respuesta = cliente.get(url, headers=headers or {})
+    if respuesta.status_code != esperado:
+        raise RuntimeError(f"{url} respondió {respuesta.status_code}")
+    return respuesta
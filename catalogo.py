@@ -0,0 +1,147 @@
+# catalogo.py - CATÁLOGO EN MEMORIA (PRODUCTOS + COMBOS + INSUMOS + SABORES + SUCURSALES)
+import json
+import random
+import threading
+from collections import namedtuple
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, Producto, ComboItem, Sabor, Sucursal, ContadorVersion
+from recetas import RECETA_VACIA, receta_simple, cargar_recetas
+
+CLAVE_CATALOGO = 'catalogo'
+# Una base nueva arranca el contador al azar (no en 1): la versión es el ETag de /api/catalogo
+# y una tablet con el catálogo de la base anterior (ej: después de init_db) no debe recibir un 304
+VERSION_INICIAL_MAXIMA = 2**31 - 1
+
+# Copia liviana de un Producto: no depende de la sesión de SQLAlchemy
+ProductoCatalogo = namedtuple('ProductoCatalogo', 'id nombre precio es_helado peso_helado es_combo insumo_id')
+SucursalCatalogo = namedtuple('SucursalCatalogo', 'id nombre etiqueta color tiene_stock')
+
+
+class Catalogo:
+    """Foto inmutable del catálogo para una versión dada."""
+
+    def __init__(self, version, productos, combo_items, sucursales=(), sabores=(), recetas_combos=None):
+        self.version = version
+        self.sabores = list(sabores) # Nombres de los sabores activos (orden alfabético)
+        self.sucursales = list(sucursales)
+        self.sucursales_por_nombre = {s.nombre: s for s in self.sucursales}
+        self.productos_por_id = {}
+        self.productos_por_nombre = {}
+        for p in productos:
+            self.productos_por_id[p.id] = p
+            # Igual que filter_by(nombre=...).first(): gana el de menor id
+            self.productos_por_nombre.setdefault(p.nombre, p)
+
+        # promo_id -> [(producto_hijo, cantidad)]
+        self.componentes_por_combo = {}
+        for ci in combo_items:
+            hijo = self.productos_por_id.get(ci.item_id)
+            if hijo:
+                self.componentes_por_combo.setdefault(ci.promo_id, []).append((hijo, ci.cantidad))
+
+        # producto_id -> Receta: los combos vienen ya compilados (recetas.py), el resto es directo
+        self.recetas = {p.id: receta_simple(p) for p in self.productos_por_id.values() if not p.es_combo}
+        self.recetas.update(recetas_combos or {})
+        self._json_venta = None
+
+    def producto_por_nombre(self, nombre):
+        return self.productos_por_nombre.get(nombre)
+
+    def producto_por_id(self, id_producto):
+        return self.productos_por_id.get(id_producto)
+
+    def sucursal_por_nombre(self, nombre):
+        return self.sucursales_por_nombre.get(nombre)
+
+    def sucursales_con_stock(self):
+        """Locales con depósito propio (los que venden y tienen hoja en el reporte)."""
+        return [s for s in self.sucursales if s.tiene_stock]
+
+    def componentes(self, id_combo):
+        return self.componentes_por_combo.get(id_combo, [])
+
+    def receta(self, producto):
+        """Lo que descuenta una unidad del producto (combos anidados ya desarmados): una búsqueda."""
+        return self.recetas.get(producto.id, RECETA_VACIA)
+
+    def gramos_helado(self, producto):
+        """Gramos de helado que lleva una unidad del producto (sumando todo el combo)."""
+        return self.receta(producto).gramos_helado
+
+    def json_venta(self):
+        """
+        Lo que necesita la terminal para vender (sabores activos, productos, combos) en JSON compacto.
+        Se serializa una sola vez por versión: todas las tablets piden lo mismo.
+        """
+        if self._json_venta is None:
+            datos = {
+                'version': self.version,
+                'sabores': self.sabores,
+                'productos': [
+                    {'id': p.id, 'nombre': p.nombre, 'precio': p.precio, 'helado': p.es_helado, 'combo': p.es_combo}
+                    for p in self.productos_por_id.values()
+                ],
+                # id_combo -> [[id_producto, cantidad], ...]
+                'combos': {
+                    id_combo: [[hijo.id, cantidad] for hijo, cantidad in componentes]
+                    for id_combo, componentes in self.componentes_por_combo.items()
+                },
+            }
+            self._json_venta = json.dumps(datos, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return self._json_venta
+
+
+class CacheCatalogo:
+    """
+    Catálogo local del proceso (uno por worker de gunicorn).
+    Cada lectura compara contra el contador de versión en la base; si un admin
+    editó algo (y llamó a invalidar), se recarga todo en 6 consultas.
+    """
+
+    def __init__(self):
+        self._catalogo = None
+        self._lock = threading.Lock()
+
+    def obtener(self):
+        version = self._version_en_base()
+        catalogo = self._catalogo
+        if catalogo is not None and catalogo.version == version:
+            return catalogo
+
+        with self._lock:
+            if self._catalogo is None or self._catalogo.version != version:
+                self._catalogo = self._cargar(version)
+            return self._catalogo
+
+    def invalidar(self):
+        """Incrementa la versión dentro de la transacción actual (el que llama hace el commit)."""
+        stmt = insert(ContadorVersion).values(clave=CLAVE_CATALOGO, valor=random.randint(1, VERSION_INICIAL_MAXIMA))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ContadorVersion.clave],
+            set_={'valor': ContadorVersion.valor + 1}
+        )
+        db.session.execute(stmt)
+        self._catalogo = None
+
+    def _version_en_base(self):
+        valor = db.session.execute(
+            select(ContadorVersion.valor).where(ContadorVersion.clave == CLAVE_CATALOGO)
+        ).scalar()
+        return valor or 0
+
+    def _cargar(self, version):
+        productos = [
+            ProductoCatalogo(p.id, p.nombre, p.precio, bool(p.es_helado), p.peso_helado or 0.0, bool(p.es_combo), p.insumo_id)
+            for p in db.session.execute(select(Producto).order_by(Producto.id)).scalars()
+        ]
+        combo_items = db.session.execute(select(ComboItem).order_by(ComboItem.id)).scalars().all()
+        sucursales = [
+            SucursalCatalogo(s.id, s.nombre, s.etiqueta or s.nombre, s.color, bool(s.tiene_stock))
+            for s in db.session.execute(select(Sucursal).order_by(Sucursal.id)).scalars()
+        ]
+        sabores = db.session.execute(
+            select(Sabor.nombre).where(Sabor.activo == True).order_by(Sabor.nombre)
+        ).scalars().all()
+        return Catalogo(version, productos, combo_items, sucursales, sabores, cargar_recetas())
@@ -0,0 +1,70 @@
+# eventos.py - EVENTOS EN VIVO DEL PANEL (TABLA COMPARTIDA ENTRE WORKERS + SSE)
+import json
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select, delete
+
+from models import db, EventoPanel
+
+# Cada conexión SSE dura esto y se corta: el navegador se reconecta solo (con Last-Event-ID, sin
+# perder eventos). Cada panel abierto ocupa un hilo mientras dura la conexión: hay que servir con
+# workers gthread (gunicorn.conf.py); con workers sync ocuparía el worker entero y frenaría las ventas
+SEGUNDOS_POR_CONEXION = 25
+INTERVALO_CONSULTA = 1.0 # segundos entre lecturas de la tabla
+SEGUNDOS_LATIDO = 15 # comentario vacío para que proxies no corten la conexión
+REINTENTO_MS = 3000
+EVENTOS_POR_LECTURA = 200
+# Los eventos solo sirven para pantallas abiertas: se borran pasado un día
+HORAS_RETENCION = 24
+
+
+def publicar(tipo, sucursal, datos):
+    """
+    Agrega un evento en la transacción de quien llama: los paneles lo ven
+    recién cuando se hace el commit (una venta que falla no se publica).
+    """
+    db.session.add(EventoPanel(
+        fecha=datetime.now(), tipo=tipo, sucursal=sucursal,
+        datos=json.dumps(datos, ensure_ascii=False, separators=(',', ':'))
+    ))
+
+
+def ultimo_id():
+    return db.session.execute(select(db.func.max(EventoPanel.id))).scalar() or 0
+
+
+def purgar_viejos():
+    """Borra los eventos de más de HORAS_RETENCION (dentro de la transacción de quien llama)."""
+    limite = datetime.now() - timedelta(hours=HORAS_RETENCION)
+    db.session.execute(delete(EventoPanel).where(EventoPanel.fecha < limite))
+
+
+def flujo_sse(desde_id):
+    """
+    Generador de texto 'text/event-stream'. Cada worker consulta la tabla por id
+    (clave primaria: barato) en vez de un canal entre procesos.
+    """
+    fin = time.monotonic() + SEGUNDOS_POR_CONEXION
+    ultimo_envio = time.monotonic()
+    yield f"retry: {REINTENTO_MS}\n\n"
+
+    while time.monotonic() < fin:
+        filas = db.session.execute(
+            select(EventoPanel.id, EventoPanel.tipo, EventoPanel.datos)
+            .where(EventoPanel.id > desde_id)
+            .order_by(EventoPanel.id).limit(EVENTOS_POR_LECTURA)
+        ).all()
+        # Cierra la transacción de lectura: la próxima vuelta ve los commits nuevos
+        db.session.close()
+
+        for id_evento, tipo, datos in filas:
+            desde_id = id_evento
+            yield f"id: {id_evento}\nevent: {tipo}\ndata: {datos}\n\n"
+
+        if filas:
+            ultimo_envio = time.monotonic()
+            if len(filas) == EVENTOS_POR_LECTURA: continue # Hay más pendientes
+        elif time.monotonic() - ultimo_envio >= SEGUNDOS_LATIDO:
+            ultimo_envio = time.monotonic()
+            yield ": latido\n\n"
+        time.sleep(INTERVALO_CONSULTA)
@@ -1,17 +1,103 @@
-from models import db, Sabor, Insumo, Producto, Venta, ComboItem, Usuario, CierreCaja
+from models import db, Sabor, Insumo, Sucursal, StockSabor, StockInsumo, Producto, Venta, VentaItem, VentaItemSabor, ComboItem, Usuario, CierreCaja, CierreCajaMedio, TurnoAbierto, ResumenDiario, ResumenDiarioProducto
 from datetime import datetime
-from sqlalchemy import extract, func, desc
-import pandas as pd
-import io
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from sqlalchemy import extract, func, desc, delete, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import selectinload
+import tempfile
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Border, Side, NamedStyle
 from openpyxl.utils import get_column_letter
+from catalogo import CacheCatalogo
+from recetas import ComboConCiclo, compilar_recetas
+from stock import AcumuladorStock, registrar_movimiento, registrar_correccion, stock_de, stock_actual, stock_a_fecha, consolidar_stock, crear_filas_stock
+from resumenes import ResumenesDiarios
+from pronostico import PronosticoConsumo
+from sesiones import CacheUsuarios
+from base_datos import reintentar_si_bloqueada
+from archivo import FUENTES, en_ambas, archivar, ids_cliente_registrados
+from trabajos import invalidar_reportes
+import eventos
+import metricas
+
+# Prefijo de cada medio de pago en las métricas del reporte
+PREFIJOS_MEDIO_PAGO = {'Efectivo': 'efvo', 'Tarjeta': 'tarj', 'MercadoPago': 'qr'}
+
+# Estilos del reporte: se registran una vez por workbook como NamedStyle y cada celda
+# solo lleva el nombre (un único formato compartido en el archivo, sin estilar celda por celda)
+_BORDE_FINO = Side(style='thin')
+_BORDE_CAJA = Border(left=_BORDE_FINO, right=_BORDE_FINO, top=_BORDE_FINO, bottom=_BORDE_FINO)
+ESTILOS_REPORTE = {
+    'titulo_azul': dict(font=Font(size=18, bold=True, color="FFFFFF"), fill=PatternFill("solid", fgColor="0d6efd")),
+    'titulo_verde': dict(font=Font(size=18, bold=True, color="FFFFFF"), fill=PatternFill("solid", fgColor="198754")),
+    'etiqueta': dict(font=Font(bold=True), border=Border(bottom=_BORDE_FINO)),
+    'encabezado_tabla': dict(font=Font(bold=True), border=Border(bottom=_BORDE_FINO), fill=PatternFill("solid", fgColor="f8f9fa")),
+    'encabezado_ranking': dict(font=Font(bold=True), fill=PatternFill("solid", fgColor="f8f9fa")),
+    'detalle_encabezado': dict(font=Font(bold=True), fill=PatternFill("solid", fgColor="FFC000"), border=_BORDE_CAJA),
+    'detalle_item': dict(border=_BORDE_CAJA),
+    'detalle_subtotal': dict(font=Font(bold=True), fill=PatternFill("solid", fgColor="E2EFDA"), border=_BORDE_CAJA),
+    'detalle_total': dict(font=Font(bold=True, color="FFFFFF"), fill=PatternFill("solid", fgColor="000000"), border=_BORDE_CAJA),
+}
+
+def _registrar_estilos(wb):
+    for nombre, atributos in ESTILOS_REPORTE.items():
+        wb.add_named_style(NamedStyle(name=nombre, **atributos))
+
+def _celda(ws, valor, estilo):
+    """Celda con un estilo del reporte, para agregar con ws.append() (workbook write_only)"""
+    celda = WriteOnlyCell(ws, value=valor)
+    celda.style = estilo
+    return celda
+
+def _fecha_de_terminal(texto):
+    """Fecha ISO que manda la terminal offline (nunca en el futuro); None = ahora."""
+    if not texto: return None
+    fecha = datetime.fromisoformat(texto)
+    if fecha.tzinfo:
+        # Las ventas se guardan en hora local sin zona
+        fecha = fecha.astimezone().replace(tzinfo=None)
+    return min(fecha, datetime.now())
+
+def _titulo_hoja_sucursal(sucursal):
+    # Excel no admite más de 31 caracteres en el nombre de una hoja
+    return f"📍 {sucursal.nombre}"[:31]
+
+def _metricas_vacias():
+    return {
+        'total_monto': 0, 'total_cant': 0,
+        'efvo_monto': 0, 'efvo_cant': 0,
+        'tarj_monto': 0, 'tarj_cant': 0,
+        'qr_monto': 0, 'qr_cant': 0,
+    }
 
 class HeladeriaManager:
+    def __init__(self):
+        # Catálogo en memoria del worker (productos, combos, insumos asociados)
+        self.catalogo = CacheCatalogo()
+        self.resumenes = ResumenesDiarios()
+        self.pronostico = PronosticoConsumo(self.catalogo)
+        # Usuarios de la sesión (Flask-Login) sin ir a la base en cada request
+        self.usuarios = CacheUsuarios()
+
+    def invalidar_catalogo(self):
+        """
+        Llamar desde cualquier edición de productos/combos/insumos/sabores, antes del commit.
+        Recompila las recetas de los combos: si quedó un combo dentro de sí mismo lanza ComboConCiclo.
+        """
+        compilar_recetas()
+        self.catalogo.invalidar()
+
     # --- CONSULTAS (READ) ---
     def obtener_sabores_venta(self):
         # Solo activos para el vendedor
         return Sabor.query.filter_by(activo=True).order_by(Sabor.nombre.asc()).all()
 
+    def catalogo_venta(self):
+        """(version, json) del catálogo para las terminales; la versión sirve de ETag."""
+        catalogo = self.catalogo.obtener()
+        return catalogo.version, catalogo.json_venta()
+
     def obtener_todos_sabores(self):
         # Todos (incluso ocultos) para el admin
         return Sabor.query.order_by(Sabor.nombre.asc()).all()
@@ -28,272 +114,862 @@ class HeladeriaManager:
     def obtener_usuarios(self):
         return Usuario.query.all()
 
+    # --- USUARIOS ---
+    def usuario_sesion(self, id_usuario):
+        """Identidad y rol para current_user (cacheado; ver sesiones.py)."""
+        return self.usuarios.obtener(id_usuario)
+
+    def _validar_usuario(self, rol, sucursal):
+        if rol not in ('admin', 'vendedor'):
+            return f"Rol inválido: {rol}"
+        if sucursal != "General" and sucursal not in [s.nombre for s in self.obtener_sucursales()]:
+            return f"La sucursal {sucursal} no existe."
+        if rol == 'vendedor' and sucursal == "General":
+            return "Un vendedor necesita una sucursal."
+        return None
+
+    @reintentar_si_bloqueada
+    def crear_usuario(self, username, password, rol, sucursal):
+        if not username or not password:
+            return False, "Usuario y contraseña son obligatorios."
+        error = self._validar_usuario(rol, sucursal)
+        if error: return False, error
+        if Usuario.query.filter_by(username=username).first():
+            return False, f"El usuario {username} ya existe."
+        db.session.add(Usuario(username=username, password=password, rol=rol, sucursal=sucursal))
+        db.session.commit()
+        return True, f"Usuario {username} creado."
+
+    @reintentar_si_bloqueada
+    def actualizar_usuario(self, id_usuario, rol, sucursal, password=None):
+        usuario = db.session.get(Usuario, id_usuario)
+        if not usuario: return False, "Usuario no encontrado."
+        error = self._validar_usuario(rol, sucursal)
+        if error: return False, error
+        usuario.rol = rol
+        usuario.sucursal = sucursal
+        if password: usuario.password = password
+        self.usuarios.invalidar(id_usuario)
+        db.session.commit()
+        return True, f"Usuario {usuario.username} actualizado."
+
+    @reintentar_si_bloqueada
+    def eliminar_usuario(self, id_usuario):
+        usuario = db.session.get(Usuario, id_usuario)
+        if not usuario: return False, "Usuario no encontrado."
+        nombre = usuario.username
+        db.session.delete(usuario)
+        self.usuarios.invalidar(id_usuario)
+        db.session.commit()
+        return True, f"Usuario {nombre} eliminado."
+
+    # --- COMBOS / PROMOS ---
+    def obtener_items_de_promo(self, id_promo):
+        """[(ComboItem, nombre del producto)] de un combo, en orden de carga."""
+        return db.session.query(ComboItem, Producto.nombre)\
+                         .join(Producto, Producto.id == ComboItem.item_id)\
+                         .filter(ComboItem.promo_id == id_promo)\
+                         .order_by(ComboItem.id).all()
+
+    @reintentar_si_bloqueada
+    def agregar_item_a_promo(self, id_promo, id_producto, cantidad):
+        promo = db.session.get(Producto, int(id_promo))
+        if not promo or not promo.es_combo: return False, "Promo no encontrada."
+        hijo = db.session.get(Producto, int(id_producto))
+        if not hijo: return False, "Producto no encontrado."
+        cantidad = int(cantidad)
+        if cantidad < 1: return False, "La cantidad tiene que ser al menos 1."
+
+        # Si el producto ya estaba en la promo se suma la cantidad
+        item = ComboItem.query.filter_by(promo_id=promo.id, item_id=hijo.id).first()
+        if item:
+            item.cantidad += cantidad
+        else:
+            db.session.add(ComboItem(promo_id=promo.id, item_id=hijo.id, cantidad=cantidad))
+        try:
+            self.invalidar_catalogo()
+        except ComboConCiclo as e:
+            db.session.rollback()
+            return False, f"⚠️ No se agregó: {e}"
+        db.session.commit()
+        return True, f"{hijo.nombre} agregado a {promo.nombre}."
+
+    @reintentar_si_bloqueada
+    def eliminar_item_de_promo(self, id_combo_item):
+        item = db.session.get(ComboItem, int(id_combo_item))
+        if not item: return False, "Item no encontrado."
+        db.session.delete(item)
+        self.invalidar_catalogo()
+        db.session.commit()
+        return True, "Item quitado de la promo."
+
+    # --- SUCURSALES ---
+    def obtener_sucursales(self):
+        """Locales con stock propio, en orden de alta (para formularios y tableros)."""
+        return self.catalogo.obtener().sucursales_con_stock()
+
+    @reintentar_si_bloqueada
+    def crear_sucursal(self, nombre, etiqueta=None, color=None, tiene_stock=True):
+        if Sucursal.query.filter_by(nombre=nombre).first():
+            return False, f"La sucursal {nombre} ya existe."
+        db.session.add(Sucursal(nombre=nombre, etiqueta=etiqueta, color=color or "#6c757d", tiene_stock=tiene_stock))
+        db.session.flush()
+        crear_filas_stock()
+        self.invalidar_catalogo()
+        db.session.commit()
+        return True, f"Sucursal {nombre} creada."
+
+    def stock_por_sucursal(self, modelo, fecha=None):
+        """{id_item: {id_sucursal: cantidad}} de sabores (StockSabor) o insumos (StockInsumo), hoy o a una fecha."""
+        cantidades = stock_a_fecha(modelo, fecha) if fecha else stock_actual(modelo)
+        stock = {}
+        for (id_item, id_sucursal), cantidad in cantidades.items():
+            stock.setdefault(id_item, {})[id_sucursal] = cantidad
+        return stock
+
+    def pronostico_stock(self, modelo):
+        """
+        {id_item: {id_sucursal: horas hasta agotar}} con el historial tal como está (solo lectura).
+        Las ventas nuevas se suman con 'mantenimiento.py pronostico' (correrlo periódicamente).
+        """
+        return self.pronostico.horas_hasta_agotar(modelo)
+
+    @reintentar_si_bloqueada
+    def consolidar_stock(self):
+        """Pasa los movimientos nuevos al saldo y guarda una foto (correr periódicamente)."""
+        resultado = consolidar_stock()
+        db.session.commit()
+        return resultado
+
     # --- STOCK SABORES ---
+    @reintentar_si_bloqueada
     def reponer_stock_sabor(self, nombre_sabor, cantidad_gramos, sucursal_destino):
         sabor = Sabor.query.filter_by(nombre=nombre_sabor).first()
         if not sabor: return False, "Sabor no encontrado"
+        sucursal = self.catalogo.obtener().sucursal_por_nombre(sucursal_destino)
+        if not sucursal or not sucursal.tiene_stock: return False, "Sucursal desconocida"
 
-        if sucursal_destino == "Máximo Paz":
-            sabor.stock_maximo += cantidad_gramos
-        elif sucursal_destino == "Tristán Suárez":
-            sabor.stock_tristan += cantidad_gramos
-        else:
-            return False, "Sucursal desconocida"
-
+        registrar_movimiento(StockSabor, 'reposicion', sabor.id, sucursal.id, cantidad_gramos)
         db.session.commit()
         return True, f"Sabor repuesto en {sucursal_destino}."
 
+    @reintentar_si_bloqueada
     def corregir_stock_manual(self, nombre_sabor, baldes_reales, sucursal_destino):
         sabor = Sabor.query.filter_by(nombre=nombre_sabor).first()
         if not sabor: return False, "Sabor no encontrado"
+        sucursal = self.catalogo.obtener().sucursal_por_nombre(sucursal_destino)
+        if not sucursal or not sucursal.tiene_stock: return False, "Sucursal desconocida"
         gramos_reales = baldes_reales * 6000
 
-        if sucursal_destino == "Máximo Paz":
-            sabor.stock_maximo = gramos_reales
-        elif sucursal_destino == "Tristán Suárez":
-            sabor.stock_tristan = gramos_reales
-        
+        registrar_correccion(StockSabor, sabor.id, sucursal.id, gramos_reales)
         db.session.commit()
         return True, f"Corrección aplicada en {sucursal_destino}."
 
     # --- STOCK INSUMOS ---
+    @reintentar_si_bloqueada
     def reponer_stock_insumo(self, id_insumo, cantidad_unidades, sucursal_destino):
         insumo = Insumo.query.get(id_insumo)
         if not insumo: return False, "Insumo no encontrado"
+        sucursal = self.catalogo.obtener().sucursal_por_nombre(sucursal_destino)
+        if not sucursal or not sucursal.tiene_stock: return False, "Sucursal desconocida"
 
-        if sucursal_destino == "Máximo Paz":
-            insumo.stock_maximo += cantidad_unidades
-            msg = f"Stock MP: {insumo.stock_maximo}"
-        elif sucursal_destino == "Tristán Suárez":
-            insumo.stock_tristan += cantidad_unidades
-            msg = f"Stock TS: {insumo.stock_tristan}"
-        else:
-            return False, "Sucursal desconocida"
-
+        registrar_movimiento(StockInsumo, 'reposicion', insumo.id, sucursal.id, cantidad_unidades)
+        db.session.flush()
+        msg = f"Stock {sucursal.etiqueta}: {stock_de(StockInsumo, insumo.id, sucursal.id)}"
         db.session.commit()
         return True, f"Insumo repuesto en {sucursal_destino}. {msg}"
 
+    @reintentar_si_bloqueada
     def actualizar_precio(self, id_producto, nuevo_precio):
         prod = Producto.query.get(id_producto)
         if prod:
             prod.precio = nuevo_precio
+            self.invalidar_catalogo()
             db.session.commit()
             return True, "Precio actualizado."
         return False, "Producto no encontrado"
 
+    # --- ABM DE SABORES, INSUMOS Y PRODUCTOS ---
+    # Cada alta/baja es su propia unidad de trabajo con reintento (las vistas no reintentan:
+    # repetir la vista entera volvería a aplicar lo que ya se confirmó)
+    @reintentar_si_bloqueada
+    def crear_sabor(self, nombre):
+        db.session.add(Sabor(nombre=nombre))
+        db.session.flush()
+        crear_filas_stock()
+        self.invalidar_catalogo()
+        db.session.commit()
+        return True, f"Sabor {nombre} creado."
+
+    @reintentar_si_bloqueada
+    def alternar_sabor(self, nombre):
+        """Oculta / vuelve a mostrar un sabor en la pantalla de venta."""
+        sabor = Sabor.query.filter_by(nombre=nombre).first()
+        if not sabor: return False, "Sabor no encontrado"
+        sabor.activo = not sabor.activo
+        self.invalidar_catalogo()
+        db.session.commit()
+        return True, f"Sabor {nombre} {'activado' if sabor.activo else 'oculto'}."
+
+    @reintentar_si_bloqueada
+    def crear_insumo(self, nombre):
+        db.session.add(Insumo(nombre=nombre))
+        db.session.flush()
+        crear_filas_stock()
+        self.invalidar_catalogo()
+        db.session.commit()
+        return True, f"Insumo '{nombre}' creado."
+
+    @reintentar_si_bloqueada
+    def eliminar_insumo(self, id_insumo):
+        insumo = db.session.get(Insumo, int(id_insumo))
+        if not insumo: return False, "Insumo no encontrado."
+        nombre = insumo.nombre
+        try:
+            StockInsumo.query.filter_by(insumo_id=insumo.id).delete()
+            db.session.delete(insumo)
+            self.invalidar_catalogo()
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return False, "No se puede eliminar: está asociado a un producto activo."
+        return True, f"Insumo '{nombre}' eliminado."
+
+    @reintentar_si_bloqueada
+    def crear_producto(self, nombre, precio, tipo, peso=0, insumo_id=None, componentes=None):
+        """tipo: 'helado', 'combo' u otro (producto simple); componentes: {id_producto: cantidad} del combo."""
+        if tipo == 'combo':
+            producto = Producto(nombre=nombre, precio=precio, es_helado=True, es_combo=True, peso_helado=0)
+            db.session.add(producto)
+            db.session.flush()
+            for item_id, cantidad in (componentes or {}).items():
+                if cantidad > 0:
+                    db.session.add(ComboItem(promo_id=producto.id, item_id=item_id, cantidad=cantidad))
+            mensaje = f"Combo '{nombre}' creado con éxito."
+        else:
+            es_helado = tipo == 'helado'
+            db.session.add(Producto(nombre=nombre, precio=precio, es_helado=es_helado, peso_helado=peso if es_helado else 0,
+                                    es_combo=False, insumo_id=int(insumo_id) if insumo_id else None))
+            mensaje = f"Producto '{nombre}' creado."
+        self.invalidar_catalogo()
+        db.session.commit()
+        return True, mensaje
+
+    @reintentar_si_bloqueada
+    def eliminar_producto(self, id_producto):
+        prod = db.session.get(Producto, int(id_producto))
+        if not prod: return False, "Producto no encontrado"
+        nombre = prod.nombre
+        if prod.es_combo:
+            ComboItem.query.filter_by(promo_id=prod.id).delete()
+        db.session.delete(prod)
+        self.invalidar_catalogo()
+        db.session.commit()
+        return True, f"Producto '{nombre}' eliminado."
+
     # --- NUEVA LÓGICA DE TURNOS (CIERRE MANUAL) ---
-    def obtener_ventas_turno_actual(self, sucursal):
+    def obtener_ventas_turno_actual(self, sucursal, limite=None):
         """
         Devuelve las ventas realizadas DESDE el último cierre de caja hasta AHORA.
-        Si nunca hubo cierre, devuelve todas.
+        Si nunca hubo cierre, devuelve todas. Con 'limite', solo las N más recientes.
         """
-        ultimo_cierre = CierreCaja.query.filter_by(sucursal=sucursal)\
-                                        .order_by(CierreCaja.fecha_cierre.desc())\
-                                        .first()
-        
-        query = Venta.query.filter_by(sucursal=sucursal)
+        query = Venta.query.filter_by(sucursal=sucursal, importada=False)
         
-        if ultimo_cierre:
+        posteriores = self._despues_del_ultimo_cierre(sucursal)
+        if posteriores is not None:
             # Traer solo ventas posteriores al último cierre
-            query = query.filter(Venta.fecha > ultimo_cierre.fecha_cierre)
+            query = query.filter(posteriores)
+
+        if limite:
+            query = query.order_by(Venta.fecha.desc()).limit(limite)
             
         return query.all()
 
+    def resumen_turno_actual(self, sucursal):
+        """
+        Totales del turno abierto leídos de TurnoAbierto (una fila por medio de pago),
+        sin cargar las ventas.
+        """
+        filas = TurnoAbierto.query.filter_by(sucursal=sucursal).all()
+        por_medio = {f.medio_pago: (f.cantidad_ventas, f.monto_total) for f in filas}
+
+        total = sum(monto for _, monto in por_medio.values())
+        cantidad = sum(cant for cant, _ in por_medio.values())
+        cantidad_efectivo, efectivo = por_medio.get('Efectivo', (0, 0.0))
+
+        return {
+            'total': total, 'cantidad': cantidad,
+            'efectivo': efectivo, 'cantidad_efectivo': cantidad_efectivo,
+            'digital': total - efectivo,
+            'por_medio': por_medio,
+        }
+
+    def _despues_del_ultimo_cierre(self, sucursal):
+        """
+        Condición sobre Venta para "después del último cierre" (None si nunca se cerró).
+        Por id cuando el cierre lo tiene: una venta con la hora de la terminal atrasada igual cae en su turno.
+        Las importadas también reciben ids nuevos: quien la usa las excluye (Venta.importada).
+        """
+        ultimo = CierreCaja.query.filter_by(sucursal=sucursal).order_by(CierreCaja.fecha_cierre.desc()).first()
+        if not ultimo: return None
+        if ultimo.venta_hasta_id:
+            return Venta.id > ultimo.venta_hasta_id
+        return Venta.fecha > ultimo.fecha_cierre
+
+    def _sumar_venta_al_turno(self, sucursal, medio_pago, monto, venta_id):
+        """Suma la venta al turno abierto dentro de la misma transacción (upsert atómico)."""
+        stmt = insert(TurnoAbierto).values(sucursal=sucursal, medio_pago=medio_pago, cantidad_ventas=1, monto_total=monto,
+                                           venta_desde_id=venta_id, venta_hasta_id=venta_id)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[TurnoAbierto.sucursal, TurnoAbierto.medio_pago],
+            set_={
+                'cantidad_ventas': TurnoAbierto.cantidad_ventas + 1,
+                'monto_total': TurnoAbierto.monto_total + monto,
+                # MIN/MAX de dos valores (funciones escalares de SQLite)
+                'venta_desde_id': func.min(func.coalesce(TurnoAbierto.venta_desde_id, venta_id), venta_id),
+                'venta_hasta_id': func.max(func.coalesce(TurnoAbierto.venta_hasta_id, venta_id), venta_id),
+            }
+        )
+        db.session.execute(stmt)
+
+    @reintentar_si_bloqueada
+    def reconstruir_turnos_abiertos(self):
+        """Recalcula TurnoAbierto desde las ventas (para bases previas a la tabla o ante dudas)."""
+        db.session.execute(delete(TurnoAbierto))
+        sucursales = [s for (s,) in db.session.query(Venta.sucursal).distinct() if s]
+        for sucursal in sucursales:
+            query = db.session.query(Venta.medio_pago, func.count(Venta.id), func.sum(Venta.total), func.min(Venta.id), func.max(Venta.id))\
+                              .filter(Venta.sucursal == sucursal, Venta.importada.is_(False))
+            posteriores = self._despues_del_ultimo_cierre(sucursal)
+            if posteriores is not None:
+                query = query.filter(posteriores)
+            for medio_pago, cantidad, monto, desde_id, hasta_id in query.group_by(Venta.medio_pago):
+                db.session.add(TurnoAbierto(sucursal=sucursal, medio_pago=medio_pago, cantidad_ventas=cantidad, monto_total=monto,
+                                            venta_desde_id=desde_id, venta_hasta_id=hasta_id))
+        db.session.commit()
+
+    @reintentar_si_bloqueada
     def cerrar_caja_sucursal(self, sucursal):
         """
-        Realiza el corte: Guarda el registro y 'reinicia' visualmente el contador
-        al establecer una nueva marca de tiempo.
+        Realiza el corte: Guarda el registro y 'reinicia' el contador del turno.
+        Los totales salen de TurnoAbierto: se borran y se leen en la misma sentencia
+        (DELETE ... RETURNING), así no se pierde una venta que entre durante el cierre.
         """
-        # 1. Calculamos qué estamos cerrando
-        ventas_pendientes = self.obtener_ventas_turno_actual(sucursal)
+        # 1. Vaciamos el turno abierto y nos quedamos con lo que tenía
+        filas = db.session.execute(
+            delete(TurnoAbierto)
+            .where(TurnoAbierto.sucursal == sucursal)
+            .returning(TurnoAbierto.medio_pago, TurnoAbierto.cantidad_ventas, TurnoAbierto.monto_total,
+                       TurnoAbierto.venta_desde_id, TurnoAbierto.venta_hasta_id)
+        ).all()
+
+        total_plata = sum(f.monto_total for f in filas)
+        total_cantidad = sum(f.cantidad_ventas for f in filas)
         
-        if not ventas_pendientes:
+        if not total_cantidad:
+            db.session.rollback()
             return False, "No hay ventas nuevas para cerrar."
 
-        total_plata = sum(v.total for v in ventas_pendientes)
-        total_cantidad = len(ventas_pendientes)
-
-        # 2. Guardamos el Cierre
+        # 2. Guardamos el Cierre (con su desglose y su rango de ventas)
+        desdes = [f.venta_desde_id for f in filas if f.venta_desde_id]
+        hastas = [f.venta_hasta_id for f in filas if f.venta_hasta_id]
         nuevo_cierre = CierreCaja(
             sucursal=sucursal,
             fecha_cierre=datetime.now(),
             monto_total=total_plata,
-            cantidad_ventas=total_cantidad
+            cantidad_ventas=total_cantidad,
+            venta_desde_id=min(desdes, default=None),
+            venta_hasta_id=max(hastas, default=None),
+            medios=[CierreCajaMedio(medio_pago=f.medio_pago, cantidad_ventas=f.cantidad_ventas, monto_total=f.monto_total)
+                    for f in filas if f.cantidad_ventas]
         )
         db.session.add(nuevo_cierre)
+        eventos.publicar('cierre', sucursal, {
+            'sucursal': sucursal, 'monto_total': total_plata, 'cantidad_ventas': total_cantidad
+        })
+        eventos.purgar_viejos()
         db.session.commit()
 
         return True, f"Caja de {sucursal} cerrada. Se archivaron ${total_plata}."
 
+    # --- HISTORIAL DE TURNOS CERRADOS ---
+    def historial_cierres(self, sucursal=None, antes_de_id=None, limite=50):
+        """Cierres más nuevos primero, de a 'limite' (paginando por id), con el desglose por medio de pago."""
+        query = CierreCaja.query.options(selectinload(CierreCaja.medios))
+        if sucursal:
+            query = query.filter(CierreCaja.sucursal == sucursal)
+        if antes_de_id:
+            query = query.filter(CierreCaja.id < antes_de_id)
+        return query.order_by(CierreCaja.id.desc()).limit(limite).all()
+
+    def ventas_de_cierre(self, cierre):
+        """
+        Ventas de un turno cerrado: sucursal + rango de ids (índice sucursal/id, base caliente y archivo).
+        Las importadas caen dentro del rango por id pero no son del turno.
+        """
+        if not cierre.venta_hasta_id: return []
+        union = en_ambas(lambda V, *_: select(V.id.label('id'), V.fecha, V.medio_pago, V.total, V.detalle)
+                                       .where(V.sucursal == cierre.sucursal, V.importada.is_(False),
+                                              V.id.between(cierre.venta_desde_id, cierre.venta_hasta_id)))
+        return db.session.execute(union.order_by(union.selected_columns.id)).all()
+
+    @reintentar_si_bloqueada
+    def indexar_cierres(self, sucursal):
+        """
+        Completa rango de ids y desglose de los cierres anteriores a esas columnas,
+        con las ventas entre cada cierre y el anterior (por fecha, lo único que había).
+        Devuelve cuántos cierres se completaron.
+        """
+        cierres = CierreCaja.query.filter_by(sucursal=sucursal).order_by(CierreCaja.fecha_cierre, CierreCaja.id).all()
+        completados = 0
+        anterior = None
+        for cierre in cierres:
+            if cierre.venta_hasta_id is None:
+                def consulta(V, *_, desde=anterior, hasta=cierre.fecha_cierre):
+                    query = select(V.medio_pago, func.count(), func.sum(V.total), func.min(V.id), func.max(V.id))\
+                            .where(V.sucursal == sucursal, V.importada.is_(False), V.fecha <= hasta)
+                    if desde:
+                        query = query.where(V.fecha > desde)
+                    return query.group_by(V.medio_pago)
+
+                por_medio, desdes, hastas = {}, [], []
+                for medio_pago, cantidad, monto, desde_id, hasta_id in db.session.execute(en_ambas(consulta)):
+                    previo = por_medio.get(medio_pago, (0, 0.0))
+                    por_medio[medio_pago] = (previo[0] + cantidad, previo[1] + monto)
+                    desdes.append(desde_id)
+                    hastas.append(hasta_id)
+
+                if por_medio:
+                    cierre.venta_desde_id, cierre.venta_hasta_id = min(desdes), max(hastas)
+                    # Un cierre de un turno abierto antes de la actualización ya puede tener su desglose
+                    db.session.execute(insert(CierreCajaMedio).on_conflict_do_nothing(), [
+                        {'cierre_id': cierre.id, 'medio_pago': medio, 'cantidad_ventas': cantidad, 'monto_total': monto}
+                        for medio, (cantidad, monto) in por_medio.items()
+                    ])
+                    completados += 1
+            anterior = cierre.fecha_cierre
+        db.session.commit()
+        return completados
+
     # --- CORE VENTA ---
+    @metricas.paso('procesar_carrito')
     def procesar_carrito(self, datos_carrito, sucursal="General"):
+        if not datos_carrito.get('items', []): return False, "Carrito vacío."
+
+        try:
+            total = self._guardar_venta(datos_carrito, sucursal)
+            return True, f"Venta OK. Total: ${total}"
+        except Exception as e:
+            db.session.rollback()
+            return False, f"Error: {str(e)}"
+
+    @reintentar_si_bloqueada
+    def _guardar_venta(self, datos_carrito, sucursal):
+        """Registra y confirma la venta; si la base estaba ocupada se rehace entera. Devuelve el total."""
+        venta = self._registrar_venta(datos_carrito, sucursal)
+        total = venta.total
+        db.session.commit()
+        return total
+
+    @metricas.paso('procesar_lote_ventas')
+    @reintentar_si_bloqueada
+    def procesar_lote_ventas(self, carritos, sucursal="General"):
+        """
+        Registra muchas ventas (cola offline de una terminal) en una sola transacción.
+        Cada carrito trae un 'id_cliente' generado en la terminal: si ya se registró,
+        se saltea, así reenviar el lote nunca descuenta stock dos veces.
+        Devuelve ([{'id_cliente', 'estado': ok/duplicada/error, 'msg'}] en el mismo orden,
+        días pasados que recibieron ventas); esos días se pasan a rehacer_resumenes.
+        """
+        ids = [c.get('id_cliente') for c in carritos if c.get('id_cliente')]
+        ya_registradas = ids_cliente_registrados(ids)
+
+        resultados = []
+        dias_pasados = set()
+        hoy = datetime.now().date()
+        for carrito in carritos:
+            id_cliente = carrito.get('id_cliente')
+            if not id_cliente:
+                resultados.append({'id_cliente': None, 'estado': 'error', 'msg': "Falta id_cliente."})
+                continue
+            if id_cliente in ya_registradas:
+                resultados.append({'id_cliente': id_cliente, 'estado': 'duplicada', 'msg': "Ya estaba registrada."})
+                continue
+            if not carrito.get('items'):
+                resultados.append({'id_cliente': id_cliente, 'estado': 'error', 'msg': "Carrito vacío."})
+                continue
+            if not carrito.get('medio_pago'):
+                resultados.append({'id_cliente': id_cliente, 'estado': 'error', 'msg': "Falta el medio de pago."})
+                continue
+
+            try:
+                fecha = _fecha_de_terminal(carrito.get('fecha'))
+                # Los errores de un carrito (producto inexistente, etc.) saltan antes
+                # de tocar la base, así que no dejan nada a medias en la transacción
+                venta = self._registrar_venta(carrito, sucursal, fecha=fecha, id_cliente=id_cliente)
+            except (KeyError, TypeError, ValueError, LookupError) as e:
+                resultados.append({'id_cliente': id_cliente, 'estado': 'error', 'msg': f"Error: {str(e)}"})
+                continue
+
+            ya_registradas.add(id_cliente)
+            if venta.fecha.date() < hoy:
+                dias_pasados.add(venta.fecha.date())
+            resultados.append({'id_cliente': id_cliente, 'estado': 'ok', 'msg': f"Venta OK. Total: ${venta.total}"})
+
+        db.session.commit()
+        return resultados, dias_pasados
+
+    def rehacer_resumenes(self, dias):
+        """
+        Rehace los resúmenes de los días ya resumidos que recibieron ventas tarde.
+        Va aparte del lote: cada tramo se reintenta solo (ResumenesDiarios._materializar)
+        y un bloqueo acá nunca vuelve a correr las ventas ya confirmadas.
+        """
+        resumido_hasta = self.resumenes.hasta()
+        if resumido_hasta and dias and min(dias) <= resumido_hasta:
+            self.resumenes.recalcular(min(dias), min(max(dias), resumido_hasta))
+
+    def _registrar_venta(self, datos_carrito, sucursal, fecha=None, id_cliente=None):
+        """Arma la venta, descuenta stock y suma al turno en la transacción actual (sin commit)."""
         items = datos_carrito.get('items', [])
         medio_pago = datos_carrito.get('medio_pago')
-        
-        if not items: return False, "Carrito vacío."
 
         total_a_pagar = 0
         descripcion_venta = []
+        # Renglones agrupados: (id_producto, sabores) -> VentaItem
+        renglones = {}
 
-        try:
-            for item in items:
-                nombre_prod = item['formato']
-                sabores_elegidos = item['sabores'] 
-                
-                producto = Producto.query.filter_by(nombre=nombre_prod).first()
-                if not producto: raise Exception(f"Producto {nombre_prod} no existe")
-
-                total_a_pagar += producto.precio
-                
-                texto_detalle = f"{producto.nombre}"
-                
-                # Combos: guardar detalle inmutable
-                if producto.es_combo:
-                    componentes = ComboItem.query.filter_by(promo_id=producto.id).all()
-                    nombres_comp = []
-                    for comp in componentes:
-                        prod_hijo = Producto.query.get(comp.item_id)
-                        if prod_hijo:
-                            if comp.cantidad > 1:
-                                nombres_comp.append(f"{comp.cantidad}x {prod_hijo.nombre}")
-                            else:
-                                nombres_comp.append(prod_hijo.nombre)
-                    if nombres_comp:
-                        texto_detalle += f" [{ ' + '.join(nombres_comp) }]"
-
-                if sabores_elegidos:
-                    texto_detalle += f" ({', '.join(sabores_elegidos)})"
-                else:
-                    texto_detalle += " (Sin sabores)" 
-                
-                descripcion_venta.append(texto_detalle)
-                self._descontar_producto_recursivo(producto, sabores_elegidos, sucursal)
-
-            nueva_venta = Venta(
-                fecha=datetime.now(),
-                total=total_a_pagar,
-                medio_pago=medio_pago,
-                detalle="; ".join(descripcion_venta),
-                sucursal=sucursal
-            )
-            db.session.add(nueva_venta)
-            db.session.commit()
+        catalogo = self.catalogo.obtener()
+        # Todos los descuentos del carrito se suman y se aplican juntos al final
+        acumulador = AcumuladorStock()
+
+        for item in items:
+            nombre_prod = item['formato']
+            sabores_elegidos = item['sabores'] 
             
-            return True, f"Venta OK. Total: ${total_a_pagar}"
+            producto = catalogo.producto_por_nombre(nombre_prod)
+            if not producto: raise LookupError(f"Producto {nombre_prod} no existe")
 
-        except Exception as e:
-            db.session.rollback()
-            return False, f"Error: {str(e)}"
+            total_a_pagar += producto.precio
+            
+            texto_detalle = f"{producto.nombre}"
+            
+            # Combos: guardar detalle inmutable
+            if producto.es_combo:
+                nombres_comp = []
+                for prod_hijo, cantidad in catalogo.componentes(producto.id):
+                    if cantidad > 1:
+                        nombres_comp.append(f"{cantidad}x {prod_hijo.nombre}")
+                    else:
+                        nombres_comp.append(prod_hijo.nombre)
+                if nombres_comp:
+                    texto_detalle += f" [{ ' + '.join(nombres_comp) }]"
+
+            if sabores_elegidos:
+                texto_detalle += f" ({', '.join(sabores_elegidos)})"
+            else:
+                texto_detalle += " (Sin sabores)" 
+            
+            descripcion_venta.append(texto_detalle)
+            self._descontar_producto(producto, sabores_elegidos, acumulador, catalogo)
+
+            clave = (producto.id, tuple(sabores_elegidos))
+            if clave in renglones:
+                renglones[clave].cantidad += 1
+            else:
+                renglones[clave] = VentaItem(
+                    producto_id=producto.id,
+                    nombre_producto=producto.nombre,
+                    descripcion=texto_detalle,
+                    precio_unitario=producto.precio,
+                    cantidad=1
+                )
+
+        nueva_venta = Venta(
+            fecha=fecha or datetime.now(),
+            total=total_a_pagar,
+            medio_pago=medio_pago,
+            detalle="; ".join(descripcion_venta),
+            sucursal=sucursal,
+            id_cliente=id_cliente
+        )
+        nueva_venta.items = list(renglones.values())
+        for (id_producto, sabores), renglon in renglones.items():
+            renglon.sabores = self._sabores_del_renglon(catalogo.producto_por_id(id_producto), sabores, renglon.cantidad, catalogo)
+
+        # El ORM inserta todos los renglones de una vez (INSERT múltiple);
+        # el flush da el id de la venta para los movimientos de stock
+        db.session.add(nueva_venta)
+        db.session.flush()
+        acumulador.aplicar(catalogo.sucursal_por_nombre(sucursal), venta_id=nueva_venta.id, fecha=nueva_venta.fecha)
+        self._sumar_venta_al_turno(sucursal, medio_pago, total_a_pagar, nueva_venta.id)
+        eventos.publicar('venta', sucursal, {
+            'id': nueva_venta.id, 'fecha': nueva_venta.fecha.isoformat(timespec='seconds'),
+            'sucursal': sucursal, 'medio_pago': medio_pago, 'total': total_a_pagar,
+            'detalle': nueva_venta.detalle,
+        })
+        return nueva_venta
 
-    def _descontar_producto_recursivo(self, producto, lista_sabores_elegidos, sucursal):
-        if producto.es_combo:
-            items_combo = ComboItem.query.filter_by(promo_id=producto.id).all()
-            for comp in items_combo:
-                hijo = Producto.query.get(comp.item_id)
-                for _ in range(comp.cantidad):
-                    self._descontar_producto_recursivo(hijo, lista_sabores_elegidos, sucursal)
-            return
-
-        if producto.insumo_id:
-            insumo = Insumo.query.get(producto.insumo_id)
-            if insumo:
-                if sucursal == "Máximo Paz":
-                    if insumo.stock_maximo > 0: insumo.stock_maximo -= 1
-                elif sucursal == "Tristán Suárez":
-                    if insumo.stock_tristan > 0: insumo.stock_tristan -= 1
-
-        if producto.es_helado and producto.peso_helado > 0 and lista_sabores_elegidos:
-            peso_por_gusto = producto.peso_helado / len(lista_sabores_elegidos)
+    def _descontar_producto(self, producto, lista_sabores_elegidos, acumulador, catalogo):
+        # Receta compilada al editar el combo: una búsqueda, sin importar cuán anidado esté
+        receta = catalogo.receta(producto)
+        for id_insumo, unidades in receta.insumos.items():
+            acumulador.descontar_insumo(id_insumo, unidades)
+
+        if receta.gramos_helado > 0 and lista_sabores_elegidos:
+            peso_por_gusto = receta.gramos_helado / len(lista_sabores_elegidos)
             for nombre_sabor in lista_sabores_elegidos:
-                sabor_obj = Sabor.query.filter_by(nombre=nombre_sabor).first()
-                if sabor_obj:
-                    if sucursal == "Máximo Paz":
-                        sabor_obj.stock_maximo -= peso_por_gusto
-                    elif sucursal == "Tristán Suárez":
-                        sabor_obj.stock_tristan -= peso_por_gusto
+                acumulador.descontar_sabor(nombre_sabor, peso_por_gusto)
+
+    def _sabores_del_renglon(self, producto, sabores, cantidad, catalogo):
+        """Reparte los gramos de helado del renglón entre los sabores elegidos."""
+        if not sabores: return []
+        gramos_por_gusto = catalogo.gramos_helado(producto) * cantidad / len(sabores) if producto else 0.0
+        return [VentaItemSabor(sabor_nombre=nombre, gramos=gramos_por_gusto) for nombre in sabores]
+
+    # --- TOTALES AGREGADOS EN LA BASE (GROUP BY) ---
+    def totales_por_sucursal_y_medio(self, fecha_inicio=None, fecha_fin=None, sucursal=None):
+        """
+        [(sucursal, medio_pago, cantidad, monto)] del rango.
+        Los días terminados salen de ResumenDiario; solo lo no resumido (hoy) va a Venta.
+        """
+        acumulado = {}
+        def sumar(filas):
+            for suc, medio, cantidad, monto in filas:
+                clave = (suc or None, medio)
+                previo = acumulado.get(clave, (0, 0))
+                acumulado[clave] = (previo[0] + cantidad, previo[1] + (monto or 0))
+
+        dias, tramos = self.resumenes.dividir_rango(fecha_inicio, fecha_fin)
+        if dias:
+            query = db.session.query(ResumenDiario.sucursal, ResumenDiario.medio_pago,
+                                     func.sum(ResumenDiario.cantidad_ventas), func.sum(ResumenDiario.monto_total))\
+                              .filter(ResumenDiario.fecha <= dias[1])
+            if dias[0]:
+                query = query.filter(ResumenDiario.fecha >= dias[0])
+            if sucursal:
+                query = query.filter(ResumenDiario.sucursal == sucursal)
+            sumar(query.group_by(ResumenDiario.sucursal, ResumenDiario.medio_pago))
+
+        def tramo(desde, hasta):
+            def consulta(V, *_):
+                query = select(V.sucursal, V.medio_pago, func.count(), func.coalesce(func.sum(V.total), 0))
+                if desde:
+                    query = query.where(V.fecha >= desde)
+                if hasta:
+                    query = query.where(V.fecha < hasta)
+                if sucursal:
+                    query = query.where(V.sucursal == sucursal)
+                return query.group_by(V.sucursal, V.medio_pago)
+            return consulta
+
+        # Base caliente + archivo: cada una agrupa con sus índices y acá se suman
+        for desde, hasta in tramos:
+            sumar(db.session.execute(en_ambas(tramo(desde, hasta))))
+
+        return [(suc, medio, cantidad, monto) for (suc, medio), (cantidad, monto) in acumulado.items()]
+
+    def metricas_ventas(self, fecha_inicio=None, fecha_fin=None):
+        """{'global': {...}, '<sucursal>': {...}} con monto y cantidad total y por medio de pago."""
+        metricas = {'global': _metricas_vacias()}
+        for sucursal, medio_pago, cantidad, monto in self.totales_por_sucursal_y_medio(fecha_inicio, fecha_fin):
+            for clave in ('global', sucursal):
+                m = metricas.setdefault(clave, _metricas_vacias())
+                m['total_monto'] += monto
+                m['total_cant'] += cantidad
+                prefijo = PREFIJOS_MEDIO_PAGO.get(medio_pago)
+                if prefijo:
+                    m[f'{prefijo}_monto'] += monto
+                    m[f'{prefijo}_cant'] += cantidad
+        return metricas
+
+    # --- ARCHIVO DE VENTAS VIEJAS ---
+    def archivar_ventas(self, dias, tamanio_lote=5000, al_avanzar=None):
+        """
+        Mueve al archivo adjunto las ventas de cajas cerradas con más de 'dias' días.
+        Antes pone al día resúmenes y pronóstico, que solo leen ventas nuevas de la base caliente.
+        """
+        self.resumenes.actualizar()
+        self.pronostico.actualizar()
+        hasta_dia = self.resumenes.hasta()
+        if not hasta_dia: return 0
+        return archivar(dias, self.pronostico.hasta(), hasta_dia, tamanio_lote, al_avanzar)
+
+    # --- MIGRACIÓN: Venta.detalle -> VentaItem ---
+    @reintentar_si_bloqueada
+    def migrar_detalle_a_items(self, desde_id=0, tamanio_lote=2000, recalcular_resumenes=True):
+        """
+        Crea los VentaItem de un lote de ventas viejas (las que solo tienen 'detalle').
+        Los días ya resumidos del lote se recalculan (el resumen por producto sale de los renglones),
+        salvo con recalcular_resumenes=False: entonces lo hace quien llama.
+        Devuelve (ventas_procesadas, ultimo_id) para seguir desde ahí.
+        """
+        catalogo = self.catalogo.obtener()
+        nombres_por_largo = sorted(catalogo.productos_por_nombre, key=len, reverse=True)
+
+        ventas = Venta.query.filter(Venta.id > desde_id)\
+                            .filter(~Venta.items.any())\
+                            .order_by(Venta.id.asc())\
+                            .limit(tamanio_lote).all()
+        if not ventas: return 0, desde_id
+
+        for v in ventas:
+            textos = [t.strip() for t in v.detalle.split(";") if t.strip()]
+            renglones = []
+            for texto in textos:
+                nombre_prod, sabores = self._parsear_renglon_detalle(texto, nombres_por_largo)
+                producto = catalogo.producto_por_nombre(nombre_prod)
+                # El precio histórico solo se conoce si la venta tuvo un único renglón
+                if len(textos) == 1:
+                    precio = v.total
+                else:
+                    precio = producto.precio if producto else None
+                renglon = VentaItem(
+                    producto_id=producto.id if producto else None,
+                    nombre_producto=nombre_prod,
+                    descripcion=texto,
+                    precio_unitario=precio,
+                    cantidad=1
+                )
+                renglon.sabores = self._sabores_del_renglon(producto, sabores, 1, catalogo)
+                renglones.append(renglon)
+            v.items = renglones
+
+        # El detalle por producto de los reportes cambia para esas fechas
+        invalidar_reportes()
+        db.session.commit()
+
+        if recalcular_resumenes:
+            resumido_hasta = self.resumenes.hasta()
+            desde_dia = min(v.fecha for v in ventas).date()
+            if resumido_hasta and desde_dia <= resumido_hasta:
+                self.resumenes.recalcular(desde_dia, min(max(v.fecha for v in ventas).date(), resumido_hasta))
+        return len(ventas), ventas[-1].id
+
+    def _parsear_renglon_detalle(self, texto, nombres_por_largo):
+        """'Promo 2 Kilos [2x 1 kg] (Chocolate, Limon)' -> ('Promo 2 Kilos', ['Chocolate', 'Limon'])"""
+        sabores = []
+        resto = texto
+        if texto.endswith(")") and " (" in texto:
+            resto, dentro = texto.rsplit(" (", 1)
+            dentro = dentro[:-1]
+            if dentro != "Sin sabores":
+                sabores = [s.strip() for s in dentro.split(",") if s.strip()]
+
+        # Primero buscamos un producto conocido (el nombre más largo que encaje)
+        for nombre in nombres_por_largo:
+            if resto == nombre or resto.startswith(nombre + " ["):
+                return nombre, sabores
+
+        return resto.split(" [", 1)[0].strip(), sabores
+
+    # --- ANALÍTICA (SQL SOBRE VentaItem) ---
+    def ranking_productos(self, fecha_inicio, fecha_fin, sucursal=None):
+        """[(producto, unidades, monto)] ordenado por unidades vendidas (días cerrados desde ResumenDiarioProducto)."""
+        acumulado = {}
+        def sumar(filas):
+            for nombre, unidades, monto in filas:
+                previo = acumulado.get(nombre, (0, None))
+                # monto queda en None solo si nunca hubo precio conocido (igual que SUM en SQL)
+                total = previo[1] if monto is None else (previo[1] or 0) + monto
+                acumulado[nombre] = (previo[0] + unidades, total)
+
+        dias, tramos = self.resumenes.dividir_rango(fecha_inicio, fecha_fin)
+        if dias:
+            query = db.session.query(ResumenDiarioProducto.nombre_producto,
+                                     func.sum(ResumenDiarioProducto.unidades), func.sum(ResumenDiarioProducto.monto))\
+                              .filter(ResumenDiarioProducto.fecha.between(dias[0], dias[1]))
+            if sucursal:
+                query = query.filter(ResumenDiarioProducto.sucursal == sucursal)
+            sumar(query.group_by(ResumenDiarioProducto.nombre_producto))
+
+        def tramo(desde, hasta):
+            def consulta(V, I, _):
+                query = select(I.nombre_producto, func.sum(I.cantidad), func.sum(I.cantidad * I.precio_unitario))\
+                        .join(V, V.id == I.venta_id)\
+                        .where(V.fecha >= desde, V.fecha < hasta)
+                if sucursal:
+                    query = query.where(V.sucursal == sucursal)
+                return query.group_by(I.nombre_producto)
+            return consulta
+
+        for desde, hasta in tramos:
+            sumar(db.session.execute(en_ambas(tramo(desde, hasta))))
+
+        ranking = [(nombre, unidades, monto) for nombre, (unidades, monto) in acumulado.items()]
+        return sorted(ranking, key=lambda r: r[1], reverse=True)
+
+    def ranking_sabores(self, fecha_inicio, fecha_fin, sucursal=None):
+        """[(sabor, gramos, veces_elegido)] ordenado por gramos vendidos."""
+        def consulta(V, I, S):
+            query = select(S.sabor_nombre.label('sabor'), func.sum(S.gramos).label('gramos'), func.sum(I.cantidad).label('veces'))\
+                    .join(I, I.id == S.venta_item_id)\
+                    .join(V, V.id == I.venta_id)\
+                    .where(V.fecha >= fecha_inicio, V.fecha <= fecha_fin)
+            if sucursal:
+                query = query.where(V.sucursal == sucursal)
+            return query.group_by(S.sabor_nombre)
+
+        # Cada base agrupa por su lado; la suma final es sobre ~un renglón por sabor
+        parciales = en_ambas(consulta).subquery()
+        gramos = func.sum(parciales.c.gramos)
+        return db.session.execute(
+            select(parciales.c.sabor, gramos, func.sum(parciales.c.veces))
+            .group_by(parciales.c.sabor).order_by(gramos.desc())
+        ).all()
 
     # --- REPORTE EXCEL MULTI-HOJA ---
+    @metricas.paso('reporte_excel')
     def generar_reporte_excel(self, fecha_inicio, fecha_fin):
-        # 1. Obtener todas las ventas del rango
-        ventas_totales = Venta.query.filter(Venta.fecha >= fecha_inicio).filter(Venta.fecha <= fecha_fin).order_by(Venta.fecha.desc()).all()
-        
-        if not ventas_totales: return None
-
-        # 2. Separar por sucursal
-        ventas_mp = [v for v in ventas_totales if v.sucursal == "Máximo Paz"]
-        ventas_ts = [v for v in ventas_totales if v.sucursal == "Tristán Suárez"]
+        """
+        Reporte multi-hoja con el workbook 'write_only' de openpyxl: las ventas se leen
+        de a lotes y cada fila se escribe (ya con su estilo) a disco apenas se genera.
+        El tiempo crece lineal con las ventas y la memoria no crece con el largo del rango.
+        """
+        hay_ventas = any(
+            db.session.execute(select(V.id).where(V.fecha >= fecha_inicio, V.fecha <= fecha_fin).limit(1)).first()
+            for V, *_ in FUENTES
+        )
+        if not hay_ventas: return None
 
-        # 3. Crear DataFrames de Detalle
-        df_global = self._generar_dataframe_detalle(ventas_totales)
-        df_mp = self._generar_dataframe_detalle(ventas_mp)
-        df_ts = self._generar_dataframe_detalle(ventas_ts)
+        wb = Workbook(write_only=True)
+        _registrar_estilos(wb)
+        self._crear_hoja_dashboard(wb.create_sheet("📊 Dashboard"), fecha_inicio, fecha_fin)
+        self._crear_hoja_ranking(wb.create_sheet("🏆 Ranking"), fecha_inicio, fecha_fin)
 
-        # 4. Crear Buffer de Excel
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            
-            # --- HOJA 1: DASHBOARD ---
-            self._crear_hoja_dashboard(writer, ventas_totales, ventas_mp, ventas_ts)
-
-            # --- HOJA 2: DETALLE GLOBAL ---
-            if not df_global.empty:
-                df_global.to_excel(writer, sheet_name='🌎 Detalle Global', index=False)
-                self._estilar_hoja_detalle(writer.sheets['🌎 Detalle Global'], df_global)
-
-            # --- HOJA 3: DETALLE MÁXIMO ---
-            if not df_mp.empty:
-                df_mp.to_excel(writer, sheet_name='📍 Máximo Paz', index=False)
-                self._estilar_hoja_detalle(writer.sheets['📍 Máximo Paz'], df_mp)
-            
-            # --- HOJA 4: DETALLE TRISTÁN ---
-            if not df_ts.empty:
-                df_ts.to_excel(writer, sheet_name='📍 Tristán Suárez', index=False)
-                self._estilar_hoja_detalle(writer.sheets['📍 Tristán Suárez'], df_ts)
+        # Una pasada por hoja: no hace falta guardar las ventas para reutilizarlas
+        self._escribir_hoja_detalle(wb, '🌎 Detalle Global', fecha_inicio, fecha_fin, None)
+        for sucursal in self.obtener_sucursales():
+            self._escribir_hoja_detalle(wb, _titulo_hoja_sucursal(sucursal), fecha_inicio, fecha_fin, sucursal.nombre)
 
+        output = tempfile.TemporaryFile()
+        with metricas.paso('reporte_guardar'):
+            wb.save(output)
         output.seek(0)
         return output
 
     # --- MÉTODOS PRIVADOS AUXILIARES PARA EL REPORTE ---
 
-    def _crear_hoja_dashboard(self, writer, ventas_global, ventas_mp, ventas_ts):
+    @metricas.paso('reporte_dashboard')
+    def _crear_hoja_dashboard(self, ws, fecha_inicio, fecha_fin):
         """Crea la pestaña de resumen visual con emojis y totales"""
         
-        def calcular_metricas(lista_ventas):
-            total = sum(v.total for v in lista_ventas)
-            cantidad = len(lista_ventas)
-            
-            efvo = [v for v in lista_ventas if v.medio_pago == 'Efectivo']
-            tarj = [v for v in lista_ventas if v.medio_pago == 'Tarjeta']
-            qr = [v for v in lista_ventas if v.medio_pago == 'MercadoPago']
-            
-            return {
-                'total_monto': total, 'total_cant': cantidad,
-                'efvo_monto': sum(v.total for v in efvo), 'efvo_cant': len(efvo),
-                'tarj_monto': sum(v.total for v in tarj), 'tarj_cant': len(tarj),
-                'qr_monto': sum(v.total for v in qr), 'qr_cant': len(qr),
-            }
-
-        m_global = calcular_metricas(ventas_global)
-        m_mp = calcular_metricas(ventas_mp)
-        m_ts = calcular_metricas(ventas_ts)
+        # Totales calculados por la base (GROUP BY sucursal, medio_pago)
+        metricas = self.metricas_ventas(fecha_inicio, fecha_fin)
+        m_global = metricas['global']
+        sucursales = self.obtener_sucursales()
+        m_sucursales = [metricas.get(suc.nombre, _metricas_vacias()) for suc in sucursales]
 
-        wb = writer.book
-        ws = wb.create_sheet("📊 Dashboard", 0) 
         ws.sheet_view.showGridLines = False
-
-        # Estilos
-        titulo_font = Font(size=18, bold=True, color="FFFFFF")
-        negrita = Font(bold=True)
-        fill_azul = PatternFill("solid", fgColor="0d6efd")
-        fill_verde = PatternFill("solid", fgColor="198754")
-        fill_gris = PatternFill("solid", fgColor="f8f9fa")
-        borde = Border(bottom=Side(style='thin'))
+        ws.column_dimensions['B'].width = 25
+        for i in range(max(2, len(sucursales))):
+            ws.column_dimensions[get_column_letter(3 + i)].width = 20
 
         # --- SECCIÓN 1: TOTAL EMPRESA ---
-        ws['B2'] = "RESUMEN GLOBAL DE VENTAS 🌎"
-        ws['B2'].font = titulo_font
-        ws['B2'].fill = fill_azul
-        ws.merge_cells('B2:E2')
+        ws.append([])
+        ws.append([None, _celda(ws, "RESUMEN GLOBAL DE VENTAS 🌎", 'titulo_azul')])
+        ws.merged_cells.add('B2:E2')
+        ws.append([])
         
         data_rows = [
             ("💰 Total Recaudado", f"$ {m_global['total_monto']:,}", f"{m_global['total_cant']} ventas"),
@@ -302,129 +978,119 @@ class HeladeriaManager:
             ("📱 QR / MP", f"$ {m_global['qr_monto']:,}", f"{m_global['qr_cant']} ventas"),
         ]
         
-        row = 4
         for label, monto, cant in data_rows:
-            ws[f'B{row}'] = label
-            ws[f'C{row}'] = monto
-            ws[f'D{row}'] = cant
-            ws[f'B{row}'].font = negrita
-            ws[f'B{row}'].border = borde
-            row += 1
+            ws.append([None, _celda(ws, label, 'etiqueta'), monto, cant])
 
         # --- SECCIÓN 2: COMPARATIVA POR SUCURSAL ---
-        ws['B10'] = "DESGLOSE POR SUCURSAL 🏢"
-        ws['B10'].font = titulo_font
-        ws['B10'].fill = fill_verde
-        ws.merge_cells('B10:E10')
-
-        headers = ["Concepto", "📍 Máximo Paz", "📍 Tristán Suárez"]
-        for i, h in enumerate(headers):
-            col = get_column_letter(2 + i)
-            cell = ws[f'{col}12']
-            cell.value = h
-            cell.font = negrita
-            cell.border = borde
-            cell.fill = fill_gris
+        ws.append([])
+        ws.append([])
+        ws.append([None, _celda(ws, "DESGLOSE POR SUCURSAL 🏢", 'titulo_verde')])
+        ws.merged_cells.add('B10:E10')
+        ws.append([])
+
+        headers = ["Concepto"] + [f"📍 {suc.nombre}" for suc in sucursales]
+        ws.append([None] + [_celda(ws, h, 'encabezado_tabla') for h in headers])
 
         comparativa = [
-            ("💰 Total ($)", f"$ {m_mp['total_monto']:,}", f"$ {m_ts['total_monto']:,}"),
-            ("🛒 Cant. Ventas", m_mp['total_cant'], m_ts['total_cant']),
-            ("💵 Efectivo ($)", f"$ {m_mp['efvo_monto']:,}", f"$ {m_ts['efvo_monto']:,}"),
-            ("💳 Tarjeta ($)", f"$ {m_mp['tarj_monto']:,}", f"$ {m_ts['tarj_monto']:,}"),
-            ("📱 QR ($)", f"$ {m_mp['qr_monto']:,}", f"$ {m_ts['qr_monto']:,}"),
+            ("💰 Total ($)", 'total_monto'),
+            ("🛒 Cant. Ventas", 'total_cant'),
+            ("💵 Efectivo ($)", 'efvo_monto'),
+            ("💳 Tarjeta ($)", 'tarj_monto'),
+            ("📱 QR ($)", 'qr_monto'),
         ]
 
-        row = 13
-        for concepto, val_mp, val_ts in comparativa:
-            ws[f'B{row}'] = concepto
-            ws[f'C{row}'] = val_mp
-            ws[f'D{row}'] = val_ts
-            row += 1
+        for concepto, clave in comparativa:
+            if clave.endswith('_monto'):
+                valores = [f"$ {m[clave]:,}" for m in m_sucursales]
+            else:
+                valores = [m[clave] for m in m_sucursales]
+            ws.append([None, concepto] + valores)
 
-        ws.column_dimensions['B'].width = 25
-        ws.column_dimensions['C'].width = 20
-        ws.column_dimensions['D'].width = 20
+    @metricas.paso('reporte_ranking')
+    def _crear_hoja_ranking(self, ws, fecha_inicio, fecha_fin):
+        """Productos y sabores más vendidos del rango (agregados en SQL)"""
+        ws.sheet_view.showGridLines = False
+        ws.column_dimensions['B'].width = 30
+        ws.column_dimensions['F'].width = 25
+
+        productos = self.ranking_productos(fecha_inicio, fecha_fin)
+        sabores = [(nombre, round((gramos or 0) / 1000, 2), veces) for nombre, gramos, veces in self.ranking_sabores(fecha_inicio, fecha_fin)]
 
-    def _generar_dataframe_detalle(self, lista_ventas):
-        """Genera el DataFrame detallado para una lista de ventas dada"""
-        if not lista_ventas: return pd.DataFrame()
+        ws.append([])
+        headers = ["🍨 Producto", "Unidades", "Monto ($)", None, "🍦 Sabor", "Kilos", "Veces elegido"]
+        ws.append([None] + [_celda(ws, h, 'encabezado_ranking') if h else None for h in headers])
+        # Las dos tablas van lado a lado (B:D y F:H)
+        for i in range(max(len(productos), len(sabores))):
+            fila_prod = list(productos[i]) if i < len(productos) else [None, None, None]
+            fila_sabor = list(sabores[i]) if i < len(sabores) else [None, None, None]
+            ws.append([None] + fila_prod + [None] + fila_sabor)
 
-        data_detalle = []
+    @metricas.paso('reporte_detalle')
+    def _escribir_hoja_detalle(self, wb, titulo, fecha_inicio, fecha_fin, sucursal):
+        """Hoja de detalle con los estilos aplicados al escribir (sin columna auxiliar ni segunda pasada)"""
+        ws = None
         gran_total = 0
-        mapa_precios = {p.nombre: p.precio for p in Producto.query.all()}
-
-        for v in lista_ventas:
-            items_texto = v.detalle.split(";")
-            for item_raw in items_texto:
-                item_raw = item_raw.strip()
-                if not item_raw: continue
-
-                nombre_prod = item_raw
-                if "(" in item_raw:
-                    parts = item_raw.split("(", 1)
-                    nombre_prod = parts[0].strip()
-                
-                fila_item = {
-                    "Fecha": v.fecha.strftime("%d/%m/%Y"),
-                    "Hora": v.fecha.strftime("%H:%M"),
-                    "Sucursal": v.sucursal,
-                    "Producto / Items": item_raw,
-                    "Medio Pago": v.medio_pago,
-                    "Monto ($)": "", 
-                    "Tipo Fila": "Item"
-                }
-                data_detalle.append(fila_item)
-            
-            fila_subtotal = {
-                "Fecha": "", "Hora": "", "Sucursal": "", 
-                "Producto / Items": "TOTAL VENTA",
-                "Medio Pago": "", "Monto ($)": v.total, "Tipo Fila": "Subtotal"
-            }
-            data_detalle.append(fila_subtotal)
+        for v, textos in self._iterar_ventas_con_items(fecha_inicio, fecha_fin, sucursal):
+            if ws is None:
+                # La hoja se crea recién con la primera venta (sucursal sin ventas = sin hoja)
+                ws = wb.create_sheet(titulo)
+                ws.column_dimensions['D'].width = 50
+                ws.column_dimensions['F'].width = 15
+                ws.append([_celda(ws, h, 'detalle_encabezado')
+                           for h in ["Fecha", "Hora", "Sucursal", "Producto / Items", "Medio Pago", "Monto ($)"]])
+
+            fecha, hora = v.fecha.strftime("%d/%m/%Y"), v.fecha.strftime("%H:%M")
+            for texto in textos:
+                ws.append([_celda(ws, valor, 'detalle_item') for valor in (fecha, hora, v.sucursal, texto, v.medio_pago, None)])
+            ws.append([_celda(ws, valor, 'detalle_subtotal') for valor in (None, None, None, "TOTAL VENTA", None, v.total)])
             gran_total += v.total
 
-        fila_final = {
-            "Fecha": "", "Hora": "", "Sucursal": "", 
-            "Producto / Items": "TOTAL RECAUDADO",
-            "Medio Pago": "", "Monto ($)": gran_total, "Tipo Fila": "GranTotal"
-        }
-        data_detalle.append(fila_final)
-        return pd.DataFrame(data_detalle)
-
-    def _estilar_hoja_detalle(self, ws, df):
-        """Aplica colores y bordes a las hojas de detalle"""
-        borde = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-        fill_header = PatternFill("solid", fgColor="FFC000")
-        fill_subtotal = PatternFill("solid", fgColor="E2EFDA")
-        fill_grantotal = PatternFill("solid", fgColor="000000")
-        font_grantotal = Font(bold=True, color="FFFFFF")
-        font_bold = Font(bold=True)
-
-        for cell in ws[1]:
-            cell.fill = fill_header
-            cell.font = font_bold
-            cell.border = borde
-
-        col_tipo_fila = None
-        for cell in ws[1]:
-            if cell.value == "Tipo Fila":
-                col_tipo_fila = cell.column 
-
-        if col_tipo_fila:
-            for row in ws.iter_rows(min_row=2, max_row=ws.max_row):
-                tipo = row[col_tipo_fila-1].value 
-                for cell in row:
-                    cell.border = borde
-                if tipo == "Subtotal":
-                    for cell in row:
-                        cell.fill = fill_subtotal
-                        cell.font = font_bold
-                elif tipo == "GranTotal":
-                    for cell in row:
-                        cell.fill = fill_grantotal
-                        cell.font = font_grantotal
-
-            ws.delete_cols(col_tipo_fila)
-
-        ws.column_dimensions['D'].width = 50
-        ws.column_dimensions['F'].width = 15
\ No newline at end of file
+        if ws is not None:
+            ws.append([_celda(ws, valor, 'detalle_total') for valor in (None, None, None, "TOTAL RECAUDADO", None, gran_total)])
+
+    def _iterar_ventas_con_items(self, fecha_inicio, fecha_fin, sucursal=None, tamanio_lote=1000):
+        """
+        Recorre las ventas del rango (más nuevas primero) de a lotes, con paginación por
+        (fecha, id). Devuelve (venta, [textos de renglones]) sin retener lotes anteriores.
+        """
+        ultimo = None
+        def consulta(V, *_):
+            # Con alias: el ORDER BY de un UNION se resuelve por nombre de columna
+            query = select(V.id.label('id'), V.fecha.label('fecha'), V.sucursal, V.medio_pago, V.total, V.detalle)\
+                    .where(V.fecha >= fecha_inicio, V.fecha <= fecha_fin)
+            if sucursal:
+                query = query.where(V.sucursal == sucursal)
+            if ultimo:
+                query = query.where(tuple_(V.fecha, V.id) < tuple_(*ultimo))
+            return query
+
+        while True:
+            # Base caliente + archivo en una sola consulta: SQLite mezcla las dos mitades ya ordenadas
+            union = en_ambas(consulta)
+            columnas = union.selected_columns
+            lote = db.session.execute(
+                union.order_by(columnas.fecha.desc(), columnas.id.desc()).limit(tamanio_lote)
+            ).all()
+            if not lote: return
+
+            items = self._items_de_ventas([v.id for v in lote])
+            for v in lote:
+                # Ventas todavía sin migrar: se usa el texto libre
+                textos = items.get(v.id) or [t.strip() for t in v.detalle.split(";") if t.strip()]
+                yield v, textos
+            ultimo = (lote[-1].fecha, lote[-1].id)
+
+    def _items_de_ventas(self, ids_ventas):
+        """{venta_id: [texto de cada renglón]} para un lote de ventas"""
+        union = en_ambas(lambda V, I, S: select(I.venta_id.label('venta_id'), I.descripcion, I.cantidad, I.id.label('item_id'))
+                                         .where(I.venta_id.in_(ids_ventas)))
+        columnas = union.selected_columns
+        filas = db.session.execute(union.order_by(columnas.venta_id, columnas.item_id))
+        return self._agrupar_textos_items((venta_id, descripcion, cantidad) for venta_id, descripcion, cantidad, _ in filas)
+
+    def _agrupar_textos_items(self, filas):
+        items = {}
+        for venta_id, descripcion, cantidad in filas:
+            texto = f"{cantidad}x {descripcion}" if cantidad > 1 else descripcion
+            items.setdefault(venta_id, []).append(texto)
+        return items
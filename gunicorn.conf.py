@@ -0,0 +1,26 @@
+# gunicorn.conf.py - CONFIGURACIÓN DEL SERVIDOR (gunicorn -c gunicorn.conf.py app:app)
+import os
+
+bind = os.environ.get('HELADERIA_BIND', '0.0.0.0:8000')
+
+# Workers con hilos: cada panel en vivo (SSE, ver eventos.py) ocupa un hilo mientras dura la
+# conexión, no un worker entero, así las ventas de las terminales no quedan esperando detrás.
+# Pocos procesos (SQLite escribe de a uno) y varios hilos por proceso para las conexiones abiertas
+worker_class = 'gthread'
+workers = int(os.environ.get('HELADERIA_WORKERS', 2))
+threads = int(os.environ.get('HELADERIA_HILOS', 16))
+
+# Con gthread el timeout es el latido del worker, no el largo de cada pedido: un SSE no lo dispara
+timeout = 60
+keepalive = 5
+
+
+def on_starting(server):
+    """
+    Solo en el master, antes de crear los workers: borra los volcados de métricas de la corrida
+    anterior (los de workers muertos se seguirían sumando). Misma carpeta que metricas.instrumentar.
+    """
+    import metricas
+    directorio = os.environ.get('HELADERIA_METRICAS_DIR') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'instance', 'metricas')
+    metricas.limpiar_directorio(directorio)
@@ -0,0 +1,188 @@
+# importacion.py - CARGA MASIVA DE VENTAS HISTÓRICAS (CSV / XLSX)
+import csv
+import os
+import re
+from datetime import datetime
+from openpyxl import load_workbook
+
+from models import db, Venta, Sucursal
+from archivo import ids_cliente_registrados
+from trabajos import invalidar_reportes
+
+# Columnas esperadas en la primera fila (las demás se ignoran)
+COLUMNAS_OBLIGATORIAS = ('fecha', 'sucursal', 'medio_pago', 'total')
+# Además de ISO (AAAA-MM-DD HH:MM:SS) se acepta DD/MM/AAAA [HH:MM[:SS]]
+FECHA_ARGENTINA = re.compile(r'(\d{1,2})/(\d{1,2})/(\d{4})(?:[ T](\d{1,2}):(\d{2})(?::(\d{2}))?)?$')
+
+# Dígitos con separadores '.' / ',' (sin signo ni '$': se sacan antes)
+IMPORTE = re.compile(r'\d+(?:[.,]\d+)*$')
+
+MEDIOS_PAGO_VALIDOS = ["Efectivo", "Tarjeta", "MercadoPago"]
+
+
+class ErrorFila(ValueError):
+    pass
+
+
+class ImportadorVentas:
+    """
+    Lee el archivo de a una fila (nunca entero en memoria), valida y mete las ventas
+    con INSERT ... executemany en lotes, sin crear objetos del ORM.
+    Cada fila lleva un id_cliente 'importacion:<archivo>:<fila>' (si no trae uno propio):
+    volver a importar el mismo archivo no duplica nada.
+    Entran marcadas como importadas: TurnoAbierto no las suma y los turnos las excluyen de su rango de ids.
+    """
+
+    def __init__(self, ruta, tamanio_lote=5000):
+        self.ruta = ruta
+        self.tamanio_lote = tamanio_lote
+        self.insertadas = 0
+        self.rechazadas = []   # [(numero_fila, motivo)]
+        self.fecha_min = None
+        self.fecha_max = None
+        self._sucursales = {nombre.lower(): nombre for (nombre,) in db.session.query(Sucursal.nombre)}
+        self._medios_pago = {m.lower(): m for m in MEDIOS_PAGO_VALIDOS}
+
+    def importar(self, al_avanzar=None):
+        # Sentencia armada una vez y ejecutada directo por el driver (executemany con tuplas):
+        # a este volumen, el procesamiento por fila de SQLAlchemy pesa más que el INSERT
+        tabla = Venta.__table__
+        # importada = 1: reciben ids nuevos pero no son de ningún turno (ni abierto ni cerrado)
+        columnas = ('fecha', 'total', 'medio_pago', 'detalle', 'sucursal', 'id_cliente', 'importada')
+        stmt = f"INSERT OR IGNORE INTO {tabla.name} ({', '.join(columnas)}) VALUES ({', '.join('?' * len(columnas))})"
+        prefijo_id = f"importacion:{os.path.basename(self.ruta)}"
+        lote = []
+
+        for numero_fila, fila in self._leer_filas():
+            try:
+                venta = self._validar(fila)
+            except ErrorFila as e:
+                self.rechazadas.append((numero_fila, str(e)))
+                continue
+            venta['id_cliente'] = venta['id_cliente'] or f"{prefijo_id}:{numero_fila}"
+            lote.append(venta)
+
+            if len(lote) >= self.tamanio_lote:
+                self._insertar(stmt, lote)
+                lote = []
+                if al_avanzar: al_avanzar(self)
+
+        if lote:
+            self._insertar(stmt, lote)
+            if al_avanzar: al_avanzar(self)
+        return self
+
+    # --- INTERNOS ---
+    def _insertar(self, stmt, lote):
+        # OR IGNORE solo ve la base caliente: las ya archivadas se descartan antes
+        archivadas = ids_cliente_registrados([v['id_cliente'] for v in lote])
+        lote = [v for v in lote if v['id_cliente'] not in archivadas]
+        if not lote: return
+        # Mismo formato de texto que usa SQLAlchemy para DateTime en SQLite (con microsegundos),
+        # si no, las comparaciones de rango por string fallan en los bordes
+        filas = [
+            (v['fecha'].isoformat(' ', 'microseconds'), v['total'], v['medio_pago'], v['detalle'], v['sucursal'], v['id_cliente'], True)
+            for v in lote
+        ]
+        resultado = db.session.connection().exec_driver_sql(stmt, filas)
+        # Pueden caer dentro de un rango que ya tenía su Excel en caché
+        invalidar_reportes()
+        db.session.commit()
+        # Con OR IGNORE, las repetidas no cuentan
+        self.insertadas += resultado.rowcount if resultado.rowcount >= 0 else len(lote)
+        fechas = [v['fecha'] for v in lote]
+        self.fecha_min = min(fechas + ([self.fecha_min] if self.fecha_min else []))
+        self.fecha_max = max(fechas + ([self.fecha_max] if self.fecha_max else []))
+
+    def _leer_filas(self):
+        """Genera (numero_fila, {columna: valor}) con los encabezados en minúscula."""
+        if self.ruta.lower().endswith(('.xlsx', '.xlsm')):
+            libro = load_workbook(self.ruta, read_only=True, data_only=True)
+            try:
+                filas = libro.active.iter_rows(values_only=True)
+                yield from self._con_encabezado(filas)
+            finally:
+                libro.close()
+        else:
+            with open(self.ruta, newline='', encoding='utf-8-sig') as archivo:
+                # Acepta exportaciones con ';' (Excel en español) o ','
+                dialecto = csv.Sniffer().sniff(archivo.read(4096), delimiters=',;')
+                archivo.seek(0)
+                yield from self._con_encabezado(csv.reader(archivo, dialecto))
+
+    def _con_encabezado(self, filas):
+        encabezado = [str(c or '').strip().lower() for c in next(filas, [])]
+        faltantes = [c for c in COLUMNAS_OBLIGATORIAS if c not in encabezado]
+        if faltantes:
+            raise ValueError(f"Faltan columnas: {', '.join(faltantes)}")
+        for numero_fila, valores in enumerate(filas, start=2):
+            if not any(v not in (None, '') for v in valores): continue
+            yield numero_fila, dict(zip(encabezado, valores))
+
+    def _validar(self, fila):
+        sucursal = self._sucursales.get(str(fila.get('sucursal') or '').strip().lower())
+        if not sucursal:
+            raise ErrorFila(f"Sucursal desconocida: {fila.get('sucursal')!r}")
+        medio_pago = self._medios_pago.get(str(fila.get('medio_pago') or '').strip().lower())
+        if not medio_pago:
+            raise ErrorFila(f"Medio de pago desconocido: {fila.get('medio_pago')!r}")
+
+        return {
+            'fecha': _leer_fecha(fila.get('fecha')),
+            'total': _leer_importe(fila.get('total')),
+            'medio_pago': medio_pago,
+            'sucursal': sucursal,
+            # Sin detalle no hay renglones: 'migrar-items' los arma después si viene
+            'detalle': str(fila.get('detalle') or '').strip() or "Venta importada",
+            'id_cliente': str(fila.get('id_cliente') or '').strip() or None,
+        }
+
+def _leer_fecha(valor):
+    if isinstance(valor, datetime): return _hora_local(valor)
+    texto = str(valor or '').strip()
+    try:
+        return _hora_local(datetime.fromisoformat(texto))
+    except ValueError:
+        pass
+    m = FECHA_ARGENTINA.match(texto)
+    if m:
+        dia, mes, anio, hora, minuto, segundo = (int(g) if g else 0 for g in m.groups())
+        try:
+            return datetime(anio, mes, dia, hora, minuto, segundo)
+        except ValueError:
+            pass
+    raise ErrorFila(f"Fecha inválida: {valor!r}")
+
+
+def _hora_local(fecha):
+    """Las ventas se guardan en hora local sin zona: una fecha con offset se convierte antes de quitárselo."""
+    if fecha.tzinfo is None: return fecha
+    return fecha.astimezone().replace(tzinfo=None)
+
+
+def _leer_importe(valor):
+    """
+    Acepta '.' o ',' como separador de miles y de decimales: "1.234,50", "1,234.50", "12.000", "4000,5".
+    Un separador solo seguido de exactamente 3 dígitos es de miles ("12.000" = 12000).
+    Lo que no se puede leer sin adivinar (grupos mal armados) se rechaza en vez de cargar otro total.
+    """
+    if isinstance(valor, (int, float)): return float(valor)
+    texto = str(valor or '').strip().replace('$', '').replace(' ', '')
+    signo, texto = ('-', texto[1:]) if texto.startswith('-') else ('', texto)
+    if not IMPORTE.match(texto):
+        raise ErrorFila(f"Total inválido: {valor!r}")
+
+    entero, decimales = texto, '0'
+    separadores = [c for c in texto if c in '.,']
+    if separadores:
+        ultimo = separadores[-1]
+        posicion = texto.rfind(ultimo)
+        # El último es decimal si difiere de los anteriores, o si es el único y no deja un grupo de 3
+        if len(set(separadores)) > 1 or (len(separadores) == 1 and len(texto) - posicion - 1 != 3):
+            entero, decimales = texto[:posicion], texto[posicion + 1:]
+
+    grupos = re.split(r'[.,]', entero)
+    if len(grupos) > 1 and (len(set(c for c in entero if c in '.,')) > 1 or not 1 <= len(grupos[0]) <= 3
+                            or grupos[0].startswith('0') or any(len(g) != 3 for g in grupos[1:])):
+        raise ErrorFila(f"Total ambiguo o mal escrito: {valor!r}")
+    return float(f"{signo}{''.join(grupos)}.{decimales}")
@@ -1,16 +1,29 @@
 # init_db.py - ACTUALIZADO FASE 1 & 2
-from app import app, db
-from models import Usuario, Producto, Insumo, Sabor, ComboItem
+from app import app, db, gestor
+from models import Usuario, Producto, Insumo, Sabor, ComboItem, Sucursal, StockInsumo
+from stock import crear_filas_stock
+from recetas import compilar_recetas
+import archivo
 
 def cargar_datos_completos():
     with app.app_context():
         # 1. BORRÓN Y CUENTA NUEVA
         print("🗑️ Borrando base de datos antigua...")
         db.drop_all()
+        archivo.metadata_archivo.drop_all(db.engine)
         print("🏗️ Creando nuevas tablas con Stock Separado...")
         db.create_all()
+        archivo.crear_tablas(db.engine)
 
-        # 2. CREAR USUARIOS (Uno para cada Rol/Sucursal)
+        # 2. CREAR SUCURSALES (el stock se guarda por sucursal)
+        print("🏢 Creando Sucursales...")
+        suc_mp = Sucursal(nombre="Máximo Paz", etiqueta="Máx. Paz", color="#3498db")
+        suc_ts = Sucursal(nombre="Tristán Suárez", etiqueta="T. Suárez", color="#27ae60")
+        suc_gral = Sucursal(nombre="General", etiqueta="Gral", tiene_stock=False)
+        db.session.add_all([suc_mp, suc_ts, suc_gral])
+        db.session.flush()
+
+        # CREAR USUARIOS (Uno para cada Rol/Sucursal)
         print("👤 Creando Usuarios...")
         # Admin Global (Ve todo)
         u1 = Usuario(username="admin", password="123", rol="admin", sucursal="General")
@@ -37,11 +50,13 @@ def cargar_datos_completos():
         insumos_objs = {} 
 
         for nombre, stock_mp, stock_ts in insumos_data:
-            insumo = Insumo(nombre=nombre, stock_maximo=stock_mp, stock_tristan=stock_ts)
+            insumo = Insumo(nombre=nombre)
             db.session.add(insumo)
             # Hacemos flush para que se genere el ID sin commitear todavía
             db.session.flush() 
             insumos_objs[nombre] = insumo.id
+            db.session.add(StockInsumo(insumo_id=insumo.id, sucursal_id=suc_mp.id, unidades=stock_mp))
+            db.session.add(StockInsumo(insumo_id=insumo.id, sucursal_id=suc_ts.id, unidades=stock_ts))
 
         # 4. CREAR LISTA DE PRECIOS (PRODUCTOS)
         print("💲 Creando Lista de Precios...")
@@ -84,6 +99,8 @@ def cargar_datos_completos():
         
         # Agregamos 2 items de "1 kg" a la promo
         db.session.add(ComboItem(promo_id=id_promo, item_id=id_item, cantidad=2))
+        # Receta plana de cada combo (lo que descuenta la venta)
+        compilar_recetas()
 
         # 6. CREAR SABORES (Con stock separado en 0)
         print("🍦 Creando Sabores...")
@@ -95,8 +112,13 @@ def cargar_datos_completos():
         ]
 
         for s in sabores_lista:
-            # Aquí está el CAMBIO CLAVE: stock_maximo y stock_tristan en vez de stock_gramos
-            db.session.add(Sabor(nombre=s, stock_maximo=0, stock_tristan=0, activo=True))
+            db.session.add(Sabor(nombre=s, activo=True))
+        db.session.flush()
+        # Stock en 0 de cada sabor en cada sucursal
+        crear_filas_stock()
+
+        # Versión del catálogo al azar: las tablets no confunden esta base con la anterior
+        gestor.catalogo.invalidar()
 
         # GUARDAR TODO
         db.session.commit()
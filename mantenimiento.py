@@ -0,0 +1,260 @@
+# mantenimiento.py - COMANDOS DE MANTENIMIENTO SOBRE UNA BASE EXISTENTE
+# Uso: python mantenimiento.py <comando> [opciones]
+# (A diferencia de init_db.py, nunca borra datos)
+import argparse
+from datetime import date
+from sqlalchemy import inspect, text, func
+from sqlalchemy.schema import CreateColumn
+
+from app import app, db, gestor
+from archivo import compactar, metadata_archivo
+from importacion import ImportadorVentas
+from models import Venta, Sucursal, CierreCaja
+from stock import crear_filas_stock
+from recetas import ComboConCiclo
+
+# Sucursales de antes de la tabla Sucursal: (nombre, etiqueta, color, columna vieja de stock)
+SUCURSALES_LEGADAS = [
+    ("Máximo Paz", "Máx. Paz", "#3498db", "stock_maximo"),
+    ("Tristán Suárez", "T. Suárez", "#27ae60", "stock_tristan"),
+]
+
+
+def actualizar_esquema():
+    """Crea las tablas e índices nuevos que todavía no existan en la base."""
+    with app.app_context():
+        print("🏗️ Creando tablas faltantes...")
+        db.create_all()
+        # create_all tampoco agrega columnas nuevas a tablas que ya existían
+        print("🧱 Agregando columnas faltantes...")
+        agregadas = _agregar_columnas_faltantes()
+        if 'importada' in agregadas.get('venta', ()):
+            # Las importadas antes de la columna se reconocen por el id_cliente que les puso el importador
+            for tabla in ('venta', 'archivo.venta'):
+                db.session.execute(text(f"UPDATE {tabla} SET importada = 1 WHERE id_cliente LIKE 'importacion:%'"))
+            db.session.commit()
+        # create_all no agrega índices nuevos a tablas que ya existían (tampoco en el archivo de ventas)
+        print("🗂️ Creando índices faltantes...")
+        for tabla in db.metadata.sorted_tables + metadata_archivo.sorted_tables:
+            for indice in tabla.indexes:
+                indice.create(db.engine, checkfirst=True)
+        # Las recetas compiladas de los combos pueden faltar o estar viejas
+        print("🎁 Compilando recetas de combos...")
+        try:
+            gestor.invalidar_catalogo()
+            db.session.commit()
+        except ComboConCiclo as e:
+            db.session.rollback()
+            print(f"   ⚠️ {e} (corregirlo en /admin/promos)")
+        print("✅ Esquema actualizado.")
+
+
+def _agregar_columnas_faltantes():
+    """Devuelve {tabla: [columnas agregadas]} (misma tabla en la base caliente y el archivo)."""
+    agregadas = {}
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conexion:
+        # También las tablas del archivo de ventas (mismas columnas que las de la base caliente)
+        for tabla in db.metadata.sorted_tables + metadata_archivo.sorted_tables:
+            existentes = {c['name'] for c in inspector.get_columns(tabla.name, schema=tabla.schema)}
+            nombre = f'{tabla.schema}."{tabla.name}"' if tabla.schema else f'"{tabla.name}"'
+            for columna in tabla.columns:
+                if columna.name in existentes: continue
+                definicion = CreateColumn(columna).compile(dialect=db.engine.dialect)
+                conexion.exec_driver_sql(f'ALTER TABLE {nombre} ADD COLUMN {definicion}')
+                print(f"   + {nombre}.{columna.name}")
+                agregadas.setdefault(tabla.name, []).append(columna.name)
+    return agregadas
+
+
+def migrar_items(tamanio_lote=2000):
+    """Completa VentaItem/VentaItemSabor a partir del texto de Venta.detalle."""
+    with app.app_context():
+        print("🧾 Migrando detalle de ventas a renglones...")
+        ultimo_id = 0
+        total = 0
+        while True:
+            procesadas, ultimo_id = gestor.migrar_detalle_a_items(ultimo_id, tamanio_lote)
+            if not procesadas: break
+            total += procesadas
+            print(f"   ... {total} ventas migradas (hasta id {ultimo_id})")
+        print(f"✅ Migración terminada: {total} ventas.")
+
+
+def reconstruir_turnos():
+    """Recalcula los totales del turno abierto de cada sucursal desde las ventas."""
+    with app.app_context():
+        print("🧮 Reconstruyendo turnos abiertos...")
+        gestor.reconstruir_turnos_abiertos()
+        print("✅ Turnos abiertos al día.")
+
+
+def resumenes(desde=None, hasta=None):
+    """Completa los resúmenes diarios hasta ayer (correr una vez por día, ej: desde cron)."""
+    with app.app_context():
+        if desde:
+            # Recalcular a mano un período (ej: se cargaron ventas viejas)
+            hasta = hasta or gestor.resumenes.hasta() or desde
+            print(f"📅 Recalculando resúmenes del {desde} al {hasta}...")
+            gestor.resumenes.recalcular(desde, hasta)
+            print("✅ Resúmenes recalculados.")
+            return
+
+        print("📅 Actualizando resúmenes diarios...")
+        procesado = gestor.resumenes.actualizar(hasta)
+        if procesado:
+            print(f"✅ Resumidos los días del {procesado[0]} al {procesado[1]}.")
+        else:
+            print("✅ Los resúmenes ya estaban al día.")
+
+
+def indexar_cierres():
+    """Completa rango de ventas y desglose por medio de pago de los cierres de caja viejos."""
+    actualizar_esquema()
+    with app.app_context():
+        print("🧾 Indexando cierres de caja...")
+        for (sucursal,) in db.session.query(CierreCaja.sucursal).distinct().all():
+            completados = gestor.indexar_cierres(sucursal)
+            print(f"   {sucursal}: {completados} cierres")
+        print("✅ Cierres indexados.")
+
+
+def migrar_sucursales():
+    """Pasa el stock de las columnas stock_maximo/stock_tristan a StockSabor/StockInsumo."""
+    actualizar_esquema()
+    with app.app_context():
+        print("🏢 Migrando stock a la tabla por sucursal...")
+        if not Sucursal.query.first():
+            for nombre, etiqueta, color, _ in SUCURSALES_LEGADAS:
+                db.session.add(Sucursal(nombre=nombre, etiqueta=etiqueta, color=color, tiene_stock=True))
+            db.session.add(Sucursal(nombre="General", etiqueta="Gral", tiene_stock=False))
+            db.session.flush()
+
+        inspector = inspect(db.engine)
+        for tabla, tabla_stock, columna_item, columna_cantidad in (('sabor', 'stock_sabor', 'sabor_id', 'gramos'),
+                                                                    ('insumo', 'stock_insumo', 'insumo_id', 'unidades')):
+            existentes = {c['name'] for c in inspector.get_columns(tabla)}
+            for nombre, _, _, columna in SUCURSALES_LEGADAS:
+                if columna not in existentes: continue
+                id_sucursal = Sucursal.query.filter_by(nombre=nombre).first().id
+                db.session.execute(text(
+                    f"INSERT OR REPLACE INTO {tabla_stock} ({columna_item}, sucursal_id, {columna_cantidad}) "
+                    f"SELECT id, :sucursal, COALESCE({columna}, 0) FROM {tabla}"
+                ), {'sucursal': id_sucursal})
+                db.session.execute(text(f"ALTER TABLE {tabla} DROP COLUMN {columna}"))
+                print(f"   {tabla}.{columna} -> {tabla_stock} ({nombre})")
+
+        crear_filas_stock()
+        gestor.invalidar_catalogo()
+        db.session.commit()
+        print("✅ Stock por sucursal listo.")
+
+
+def consolidar_stock():
+    """Suma los movimientos de stock nuevos a los saldos y guarda una foto (ej: cada noche, desde cron)."""
+    with app.app_context():
+        print("📦 Consolidando movimientos de stock...")
+        cantidad, hasta = gestor.consolidar_stock()
+        print(f"✅ {cantidad} movimientos consolidados (hasta el #{hasta}).")
+
+
+def pronostico(lote=20000):
+    """Suma las ventas nuevas al historial de consumo por hora (correr periódicamente: las pantallas de stock solo lo leen)."""
+    with app.app_context():
+        print(f"📈 Procesando ventas desde la #{gestor.pronostico.hasta() + 1}...")
+        total = gestor.pronostico.actualizar(lote, al_avanzar=lambda n: print(f"   ... {n} ventas"))
+        print(f"✅ Historial de consumo al día ({total} ventas nuevas).")
+
+
+def crear_sucursal(nombre, etiqueta=None, color=None, sin_stock=False):
+    """Da de alta una sucursal nueva (con stock en 0 para todos los sabores e insumos)."""
+    with app.app_context():
+        exito, msg = gestor.crear_sucursal(nombre, etiqueta, color, tiene_stock=not sin_stock)
+        print(("✅ " if exito else "⚠️ ") + msg)
+
+
+def importar_ventas(archivo, lote=5000):
+    """Carga ventas históricas desde un CSV/XLSX (fecha, sucursal, medio_pago, total[, detalle, id_cliente])."""
+    with app.app_context():
+        print(f"📥 Importando ventas de {archivo}...")
+        importador = ImportadorVentas(archivo, tamanio_lote=lote)
+        hasta_id = db.session.query(func.max(Venta.id)).scalar() or 0
+        importador.importar(al_avanzar=lambda imp: print(f"   ... {imp.insertadas} ventas insertadas"))
+
+        for numero_fila, motivo in importador.rechazadas[:20]:
+            print(f"   ⚠️ Fila {numero_fila}: {motivo}")
+        if len(importador.rechazadas) > 20:
+            print(f"   ⚠️ ... y {len(importador.rechazadas) - 20} filas rechazadas más")
+
+        # Renglones de las importadas (las ventas nuevas de las cajas ya los tienen y se saltean)
+        if importador.insertadas:
+            print("🧾 Armando renglones de las ventas importadas...")
+            while True:
+                procesadas, hasta_id = gestor.migrar_detalle_a_items(hasta_id, recalcular_resumenes=False)
+                if not procesadas: break
+
+        # Si entraron días que ya estaban resumidos, se rehacen (ya con los renglones)
+        resumido_hasta = gestor.resumenes.hasta()
+        if importador.insertadas and resumido_hasta and importador.fecha_min.date() <= resumido_hasta:
+            print("📅 Recalculando resúmenes diarios del período importado...")
+            gestor.resumenes.recalcular(importador.fecha_min.date(), min(importador.fecha_max.date(), resumido_hasta))
+
+        print(f"✅ Importación terminada: {importador.insertadas} ventas nuevas, {len(importador.rechazadas)} filas rechazadas.")
+
+
+def archivar(dias=365, lote=5000, vacuum=False):
+    """Mueve las ventas de cajas cerradas con más de N días a la base de archivo (los reportes la siguen leyendo)."""
+    with app.app_context():
+        print(f"🗄️ Archivando ventas de más de {dias} días en {app.config['ARCHIVO_VENTAS']}...")
+        total = gestor.archivar_ventas(dias, lote, al_avanzar=lambda n: print(f"   ... {n} ventas"))
+        print(f"✅ {total} ventas archivadas.")
+        if vacuum and total:
+            print("🧹 Compactando la base (VACUUM)...")
+            compactar()
+            print("✅ Base compactada.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mantenimiento de la base de la heladería")
+    comandos = parser.add_subparsers(dest='comando', required=True)
+
+    comandos.add_parser('actualizar-esquema', help=actualizar_esquema.__doc__).set_defaults(funcion=actualizar_esquema)
+    comandos.add_parser('migrar-items', help=migrar_items.__doc__).set_defaults(funcion=migrar_items)
+    comandos.add_parser('reconstruir-turnos', help=reconstruir_turnos.__doc__).set_defaults(funcion=reconstruir_turnos)
+
+    p = comandos.add_parser('resumenes', help=resumenes.__doc__)
+    p.add_argument('--desde', type=date.fromisoformat, help="Recalcular desde este día (AAAA-MM-DD)")
+    p.add_argument('--hasta', type=date.fromisoformat, help="Último día a resumir (por defecto, ayer)")
+    p.set_defaults(funcion=resumenes)
+
+    comandos.add_parser('indexar-cierres', help=indexar_cierres.__doc__).set_defaults(funcion=indexar_cierres)
+
+    comandos.add_parser('migrar-sucursales', help=migrar_sucursales.__doc__).set_defaults(funcion=migrar_sucursales)
+
+    comandos.add_parser('consolidar-stock', help=consolidar_stock.__doc__).set_defaults(funcion=consolidar_stock)
+
+    p = comandos.add_parser('pronostico', help=pronostico.__doc__)
+    p.add_argument('--lote', type=int, default=20000, help="Ventas por transacción")
+    p.set_defaults(funcion=pronostico)
+
+    p = comandos.add_parser('crear-sucursal', help=crear_sucursal.__doc__)
+    p.add_argument('nombre')
+    p.add_argument('--etiqueta', help="Nombre corto para los badges")
+    p.add_argument('--color', help="Color del badge (#rrggbb)")
+    p.add_argument('--sin-stock', action='store_true', help="Sucursal administrativa, sin depósito")
+    p.set_defaults(funcion=crear_sucursal)
+
+    p = comandos.add_parser('importar-ventas', help=importar_ventas.__doc__)
+    p.add_argument('archivo')
+    p.add_argument('--lote', type=int, default=5000, help="Filas por INSERT/commit")
+    p.set_defaults(funcion=importar_ventas)
+
+    p = comandos.add_parser('archivar', help=archivar.__doc__)
+    p.add_argument('--dias', type=int, default=365, help="Antigüedad mínima de las ventas a archivar")
+    p.add_argument('--lote', type=int, default=5000, help="Ventas movidas por transacción")
+    p.add_argument('--vacuum', action='store_true', help="Compactar la base caliente al terminar")
+    p.set_defaults(funcion=archivar)
+
+    args = vars(parser.parse_args())
+    args.pop('comando')
+    args.pop('funcion')(**args)
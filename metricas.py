@@ -0,0 +1,258 @@
+# metricas.py - INSTRUMENTACIÓN POR PEDIDO (LATENCIA, SQL, PASOS) + TEXTO PROMETHEUS
+import bisect
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import request
+from sqlalchemy import event
+
+log = logging.getLogger('heladeria.metricas')
+
+# Buckets (segundos / cantidad de consultas)
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BUCKETS_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+# Pedidos más lentos que esto (segundos) se loguean con sus consultas más caras
+UMBRAL_LENTO = 1.0
+CONSULTAS_EN_LOG = 5
+LARGO_SQL_EN_LOG = 300
+
+# Pedido en curso del hilo/contexto actual (None fuera de un request: pool de reportes, CLI)
+_pedido_actual = ContextVar('_pedido_actual', default=None)
+
+# Varios workers: cada proceso vuelca sus histogramas a <METRICAS_DIR>/<pid>.json (como mucho
+# cada tantos segundos, al terminar un pedido) y /admin/metrics suma los archivos de todos.
+# Los de workers muertos se siguen sumando (los histogramas son acumulativos): vaciar la carpeta
+# al arrancar el servidor, antes de crear los workers (lo hace on_starting en gunicorn.conf.py)
+SEGUNDOS_ENTRE_VOLCADOS = 1.0
+_directorio = None
+_ultimo_volcado = 0.0
+_lock_volcado = threading.Lock()
+
+
+class Histograma:
+    """Histograma acumulativo al estilo Prometheus, con etiquetas. Seguro entre hilos."""
+
+    def __init__(self, nombre, ayuda, buckets, etiquetas):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.buckets = tuple(buckets)
+        self.etiquetas = tuple(etiquetas)
+        self._series = {} # valores de etiquetas -> [conteos por bucket (+Inf al final), suma]
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *valores_etiquetas):
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(valores_etiquetas)
+            if serie is None:
+                serie = self._series[valores_etiquetas] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][indice] += 1
+            serie[1] += valor
+
+    def estado(self):
+        """[[valores de etiquetas, conteos por bucket, suma], ...] (lo que va al archivo del worker)."""
+        with self._lock:
+            return [[list(clave), list(conteos), suma] for clave, (conteos, suma) in self._series.items()]
+
+    def exportar(self, estados=None):
+        """Líneas de texto de este proceso o, con 'estados' (varios estado()), de su suma."""
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        sumadas = {}
+        for estado in (estados if estados is not None else [self.estado()]):
+            for clave, conteos, suma in estado:
+                if len(conteos) != len(self.buckets) + 1: continue # Volcado con otros buckets (versión anterior)
+                previa = sumadas.setdefault(tuple(clave), [[0] * len(conteos), 0.0])
+                previa[0] = [a + b for a, b in zip(previa[0], conteos)]
+                previa[1] += suma
+        series = [(clave, conteos, suma) for clave, (conteos, suma) in sorted(sumadas.items())]
+        for clave, conteos, suma in series:
+            base = [f'{etiqueta}="{_escapar(valor)}"' for etiqueta, valor in zip(self.etiquetas, clave)]
+            acumulado = 0
+            for limite, conteo in zip(self.buckets + ('+Inf',), conteos):
+                acumulado += conteo
+                etiquetas = ",".join(base + [f'le="{limite}"'])
+                lineas.append(f"{self.nombre}_bucket{{{etiquetas}}} {acumulado}")
+            etiquetas = "{" + ",".join(base) + "}" if base else ""
+            lineas.append(f"{self.nombre}_sum{etiquetas} {suma:.6f}")
+            lineas.append(f"{self.nombre}_count{etiquetas} {acumulado}")
+        return lineas
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+LATENCIA = Histograma('heladeria_request_segundos', "Duración de cada pedido HTTP", BUCKETS_SEGUNDOS, ('ruta', 'metodo', 'estado'))
+CONSULTAS = Histograma('heladeria_request_sql_consultas', "Sentencias SQL por pedido", BUCKETS_CONSULTAS, ('ruta', 'metodo'))
+TIEMPO_SQL = Histograma('heladeria_request_sql_segundos', "Tiempo total en SQL por pedido", BUCKETS_SEGUNDOS, ('ruta', 'metodo'))
+PASOS = Histograma('heladeria_paso_segundos', "Duración de pasos internos (venta, hojas del reporte)", BUCKETS_SEGUNDOS, ('paso',))
+HISTOGRAMAS = (LATENCIA, CONSULTAS, TIEMPO_SQL, PASOS)
+
+
+class _Pedido:
+    """Lo que se va juntando durante un request."""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tiempo_sql = 0.0
+        self.pasos = []
+        self._mas_lentas = [] # heap de (segundos, orden, sql): solo las CONSULTAS_EN_LOG peores
+        self._orden = itertools.count()
+
+    def sumar_consulta(self, segundos, sql):
+        self.consultas += 1
+        self.tiempo_sql += segundos
+        entrada = (segundos, next(self._orden), sql)
+        if len(self._mas_lentas) < CONSULTAS_EN_LOG:
+            heapq.heappush(self._mas_lentas, entrada)
+        elif segundos > self._mas_lentas[0][0]:
+            heapq.heapreplace(self._mas_lentas, entrada)
+
+    def mas_lentas(self):
+        return sorted(self._mas_lentas, reverse=True)
+
+
+# --- PASOS INTERNOS ---
+@contextmanager
+def paso(nombre):
+    """
+    Mide un bloque (o una función, usado como decorador) en heladeria_paso_segundos.
+    Funciona también fuera de un request (reportes en segundo plano).
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracion = time.perf_counter() - inicio
+        PASOS.observar(duracion, nombre)
+        pedido = _pedido_actual.get()
+        if pedido is not None:
+            pedido.pasos.append((nombre, duracion))
+
+
+# --- ENGANCHE CON FLASK Y SQLALCHEMY ---
+def instrumentar(app, engine):
+    """Registra los hooks de request y los eventos del engine."""
+    global _directorio
+    app.config.setdefault('METRICAS_UMBRAL_LENTO', UMBRAL_LENTO)
+    app.config.setdefault('METRICAS_DIR', os.environ.get('HELADERIA_METRICAS_DIR') or os.path.join(app.instance_path, 'metricas'))
+    _directorio = app.config['METRICAS_DIR']
+    os.makedirs(_directorio, exist_ok=True)
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _antes_de_consulta(conexion, cursor, sql, parametros, contexto, executemany):
+        conexion.info.setdefault('metricas_inicio', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _despues_de_consulta(conexion, cursor, sql, parametros, contexto, executemany):
+        inicio = conexion.info['metricas_inicio'].pop()
+        pedido = _pedido_actual.get()
+        if pedido is not None:
+            pedido.sumar_consulta(time.perf_counter() - inicio, sql)
+
+    @event.listens_for(engine, 'handle_error')
+    def _consulta_fallida(contexto):
+        # Sin after_cursor_execute: se descarta la marca de inicio
+        if contexto.connection is not None and contexto.connection.info.get('metricas_inicio'):
+            contexto.connection.info['metricas_inicio'].pop()
+
+    @app.before_request
+    def _iniciar_pedido():
+        _pedido_actual.set(_Pedido())
+
+    @app.after_request
+    def _registrar_pedido(respuesta):
+        # En respuestas streaming (SSE, descargas) se mide hasta que empieza el envío
+        pedido = _pedido_actual.get()
+        if pedido is None: return respuesta
+        _pedido_actual.set(None)
+
+        duracion = time.perf_counter() - pedido.inicio
+        ruta = request.url_rule.rule if request.url_rule else 'sin_ruta' # 404: no abrir una serie por URL
+        LATENCIA.observar(duracion, ruta, request.method, str(respuesta.status_code))
+        CONSULTAS.observar(pedido.consultas, ruta, request.method)
+        TIEMPO_SQL.observar(pedido.tiempo_sql, ruta, request.method)
+
+        if duracion >= app.config['METRICAS_UMBRAL_LENTO']:
+            _loguear_lento(request.method, request.full_path.rstrip('?'), duracion, pedido)
+        if time.monotonic() - _ultimo_volcado >= SEGUNDOS_ENTRE_VOLCADOS:
+            volcar(esperar=False)
+        return respuesta
+
+    @app.teardown_request
+    def _descartar_pedido(error=None):
+        _pedido_actual.set(None)
+
+
+def _loguear_lento(metodo, url, duracion, pedido):
+    lineas = [f"Pedido lento: {metodo} {url} {duracion * 1000:.0f} ms "
+              f"({pedido.consultas} consultas, {pedido.tiempo_sql * 1000:.0f} ms en SQL)"]
+    for nombre, segundos in pedido.pasos:
+        lineas.append(f"  paso {nombre}: {segundos * 1000:.0f} ms")
+    for segundos, _, sql in pedido.mas_lentas():
+        texto = " ".join(sql.split())
+        if len(texto) > LARGO_SQL_EN_LOG: texto = texto[:LARGO_SQL_EN_LOG] + "..."
+        lineas.append(f"  {segundos * 1000:.1f} ms  {texto}")
+    log.warning("\n".join(lineas))
+
+
+# --- VARIOS WORKERS (ARCHIVO POR PROCESO) ---
+def volcar(esperar=True):
+    """Guarda los histogramas de este proceso en su archivo (tmp + replace: quien lee nunca ve uno a medias)."""
+    global _ultimo_volcado
+    if _directorio is None: return
+    if not _lock_volcado.acquire(blocking=esperar): return # Otro hilo ya está volcando
+    try:
+        estado = {histograma.nombre: histograma.estado() for histograma in HISTOGRAMAS}
+        # El pid se toma en cada volcado: con gunicorn --preload el módulo se importa antes del fork
+        ruta = os.path.join(_directorio, f"{os.getpid()}.json")
+        with open(ruta + '.tmp', 'w', encoding='utf-8') as archivo:
+            json.dump(estado, archivo, ensure_ascii=False)
+        os.replace(ruta + '.tmp', ruta)
+        _ultimo_volcado = time.monotonic()
+    except OSError:
+        log.exception("No se pudieron volcar las métricas a %s", _directorio)
+    finally:
+        _lock_volcado.release()
+
+
+def _leer_volcados():
+    for nombre in os.listdir(_directorio):
+        if not nombre.endswith('.json'): continue
+        try:
+            with open(os.path.join(_directorio, nombre), encoding='utf-8') as archivo:
+                yield json.load(archivo)
+        except (OSError, ValueError):
+            continue # Borrado o a medio escribir por otro proceso: entra en el próximo scrape
+
+
+def limpiar_directorio(directorio):
+    """Borra los volcados de una corrida anterior (llamar una sola vez al arrancar, antes de los workers)."""
+    if not os.path.isdir(directorio): return
+    for nombre in os.listdir(directorio):
+        if nombre.endswith(('.json', '.tmp')):
+            os.remove(os.path.join(directorio, nombre))
+
+
+def exportar():
+    """
+    Texto de exposición de Prometheus con la suma de todos los workers (cualquiera que atienda
+    el scrape devuelve lo mismo, con hasta SEGUNDOS_ENTRE_VOLCADOS de atraso de los otros).
+    Sin carpeta de volcados (fuera de la app) son solo los valores de este proceso.
+    """
+    volcados = None
+    if _directorio is not None:
+        volcar()
+        volcados = list(_leer_volcados())
+    lineas = []
+    for histograma in HISTOGRAMAS:
+        estados = None if volcados is None else [v.get(histograma.nombre, []) for v in volcados]
+        lineas.extend(histograma.exportar(estados))
+    return "\n".join(lineas) + "\n"
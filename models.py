@@ -4,13 +4,21 @@ from flask_login import UserMixin
 
 db = SQLAlchemy()
 
+# --- SUCURSALES ---
+class Sucursal(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    nombre = db.Column(db.String(50), unique=True, nullable=False) # Venta.sucursal / Usuario.sucursal guardan este nombre
+    etiqueta = db.Column(db.String(20)) # Nombre corto para badges
+    color = db.Column(db.String(7), default="#6c757d")
+    tiene_stock = db.Column(db.Boolean, default=True) # "General" (admin) no tiene depósito propio
+
+    def __repr__(self):
+        return f"<Sucursal {self.nombre}>"
+
 # --- TABLAS DE PRODUCTOS Y SABORES ---
 class Sabor(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(100), unique=True, nullable=False)
-    # STOCK SEPARADO POR SUCURSAL
-    stock_maximo = db.Column(db.Float, default=0.0)  # Gramos en MP
-    stock_tristan = db.Column(db.Float, default=0.0) # Gramos en TS
     activo = db.Column(db.Boolean, default=True)
 
     def __repr__(self):
@@ -19,9 +27,61 @@ class Sabor(db.Model):
 class Insumo(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(100), unique=True, nullable=False)
-    # STOCK SEPARADO POR SUCURSAL (CORREGIDO)
-    stock_maximo = db.Column(db.Integer, default=0) # Unidades en MP
-    stock_tristan = db.Column(db.Integer, default=0) # Unidades en TS
+
+# --- STOCK POR SUCURSAL (UNA FILA POR ÍTEM Y SUCURSAL) ---
+# Saldo consolidado hasta el movimiento 'stock_consolidado' de ContadorVersion.
+# Stock actual = este saldo + los MovimientoStock posteriores.
+class StockSabor(db.Model):
+    sabor_id = db.Column(db.Integer, db.ForeignKey('sabor.id'), primary_key=True)
+    sucursal_id = db.Column(db.Integer, db.ForeignKey('sucursal.id'), primary_key=True)
+    gramos = db.Column(db.Float, nullable=False, default=0.0)
+
+    # Las lecturas son "todo el stock de UNA sucursal"
+    __table_args__ = (
+        db.Index('ix_stock_sabor_sucursal', 'sucursal_id', 'sabor_id'),
+    )
+
+class StockInsumo(db.Model):
+    insumo_id = db.Column(db.Integer, db.ForeignKey('insumo.id'), primary_key=True)
+    sucursal_id = db.Column(db.Integer, db.ForeignKey('sucursal.id'), primary_key=True)
+    unidades = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_stock_insumo_sucursal', 'sucursal_id', 'insumo_id'),
+    )
+
+# --- LIBRO DE MOVIMIENTOS DE STOCK (SOLO INSERT) ---
+class MovimientoStock(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    fecha = db.Column(db.DateTime, nullable=False)
+    tipo = db.Column(db.String(20), nullable=False) # venta / reposicion / correccion
+    tipo_item = db.Column(db.String(10), nullable=False) # sabor / insumo
+    item_id = db.Column(db.Integer, nullable=False)
+    sucursal_id = db.Column(db.Integer, db.ForeignKey('sucursal.id'), nullable=False)
+    delta = db.Column(db.Float, nullable=False) # Gramos o unidades (negativo = sale)
+    venta_id = db.Column(db.Integer, db.ForeignKey('venta.id'), nullable=True, index=True)
+
+    __table_args__ = (
+        db.Index('ix_movimiento_fecha', 'fecha'),
+        db.Index('ix_movimiento_item', 'tipo_item', 'item_id', 'sucursal_id', 'fecha'),
+    )
+
+# Foto del stock de todas las sucursales en cada consolidación (para "stock al día X")
+class SnapshotStock(db.Model):
+    hasta_movimiento_id = db.Column(db.Integer, primary_key=True)
+    tipo_item = db.Column(db.String(10), primary_key=True)
+    item_id = db.Column(db.Integer, primary_key=True)
+    sucursal_id = db.Column(db.Integer, primary_key=True)
+    fecha = db.Column(db.DateTime, nullable=False, index=True)
+    cantidad = db.Column(db.Float, nullable=False)
+
+# --- PRONÓSTICO: CONSUMO ACUMULADO POR HORA DE LA SEMANA ---
+class ConsumoHorario(db.Model):
+    tipo_item = db.Column(db.String(10), primary_key=True) # sabor / insumo
+    item_id = db.Column(db.Integer, primary_key=True)
+    sucursal_id = db.Column(db.Integer, primary_key=True)
+    hora_semana = db.Column(db.Integer, primary_key=True) # 0 = lunes de 0 a 1 hs ... 167 = domingo 23 hs
+    cantidad = db.Column(db.Float, nullable=False, default=0.0) # Gramos o unidades vendidos en toda la historia
 
 class Producto(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -38,14 +98,53 @@ class ComboItem(db.Model):
     item_id = db.Column(db.Integer, db.ForeignKey('producto.id'), nullable=False)
     cantidad = db.Column(db.Integer, default=1)
 
+# --- RECETA COMPILADA DE CADA COMBO (COMBOS ANIDADOS YA DESARMADOS, SE REHACE AL EDITAR) ---
+class RecetaCombo(db.Model):
+    producto_id = db.Column(db.Integer, db.ForeignKey('producto.id'), primary_key=True)
+    gramos_helado = db.Column(db.Float, nullable=False, default=0.0) # Por unidad vendida
+
+class RecetaComboInsumo(db.Model):
+    producto_id = db.Column(db.Integer, db.ForeignKey('producto.id'), primary_key=True)
+    insumo_id = db.Column(db.Integer, db.ForeignKey('insumo.id'), primary_key=True)
+    unidades = db.Column(db.Integer, nullable=False) # Por unidad vendida
+
 # --- TABLAS DE VENTAS Y USUARIOS ---
 class Venta(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     fecha = db.Column(db.DateTime, nullable=False)
     total = db.Column(db.Float, nullable=False)
     medio_pago = db.Column(db.String(50), nullable=False) 
-    detalle = db.Column(db.Text, nullable=False)
+    detalle = db.Column(db.Text, nullable=False) # Texto para mostrar; los reportes usan VentaItem
     sucursal = db.Column(db.String(50)) # Fundamental para los reportes
+    id_cliente = db.Column(db.String(64)) # Id generado por la terminal (envíos por lote); evita duplicados
+    importada = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false()) # Carga masiva: no es de ningún turno
+    items = db.relationship('VentaItem', backref='venta', lazy=True)
+
+    # Índices "cubrientes": los totales por rango de fechas se resuelven sin leer la tabla
+    __table_args__ = (
+        db.Index('ix_venta_fecha_cubre', 'fecha', 'sucursal', 'medio_pago', 'total'),
+        db.Index('ix_venta_sucursal_fecha', 'sucursal', 'fecha', 'medio_pago', 'total'),
+        db.Index('ux_venta_id_cliente', 'id_cliente', unique=True),
+        # Ventas de un turno cerrado: rango de ids dentro de la sucursal
+        db.Index('ix_venta_sucursal_id', 'sucursal', 'id'),
+    )
+
+# --- RENGLONES DE VENTA (DETALLE ESTRUCTURADO) ---
+class VentaItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    venta_id = db.Column(db.Integer, db.ForeignKey('venta.id'), nullable=False, index=True)
+    producto_id = db.Column(db.Integer, db.ForeignKey('producto.id'), nullable=True, index=True)
+    nombre_producto = db.Column(db.String(100), nullable=False) # Copia: el producto puede cambiar o borrarse
+    descripcion = db.Column(db.Text, nullable=False) # Igual al texto del renglón en Venta.detalle
+    precio_unitario = db.Column(db.Float) # Puede faltar en ventas migradas desde 'detalle'
+    cantidad = db.Column(db.Integer, nullable=False, default=1)
+    sabores = db.relationship('VentaItemSabor', backref='item', lazy=True)
+
+class VentaItemSabor(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    venta_item_id = db.Column(db.Integer, db.ForeignKey('venta_item.id'), nullable=False, index=True)
+    sabor_nombre = db.Column(db.String(100), nullable=False, index=True)
+    gramos = db.Column(db.Float, default=0.0) # Total del renglón (ya multiplicado por cantidad)
 
 class Usuario(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -60,6 +159,74 @@ class CierreCaja(db.Model):
     fecha_cierre = db.Column(db.DateTime, nullable=False)
     monto_total = db.Column(db.Float, nullable=False)
     cantidad_ventas = db.Column(db.Integer, nullable=False)
+    # Primera y última Venta.id del turno (las ventas del turno = sucursal + ese rango de ids)
+    venta_desde_id = db.Column(db.Integer)
+    venta_hasta_id = db.Column(db.Integer)
+    medios = db.relationship('CierreCajaMedio', backref='cierre', lazy=True, cascade='all, delete-orphan')
+
+    # Para buscar rápido el último cierre de cada sucursal
+    __table_args__ = (
+        db.Index('ix_cierre_sucursal_fecha', 'sucursal', 'fecha_cierre'),
+    )
     
 def __repr__(self):
-    return f"<Cierre {self.sucursal} - {self.fecha_cierre}>"
\ No newline at end of file
+    return f"<Cierre {self.sucursal} - {self.fecha_cierre}>"
+
+# --- DESGLOSE DE CADA CIERRE POR MEDIO DE PAGO ---
+class CierreCajaMedio(db.Model):
+    cierre_id = db.Column(db.Integer, db.ForeignKey('cierre_caja.id'), primary_key=True)
+    medio_pago = db.Column(db.String(50), primary_key=True)
+    cantidad_ventas = db.Column(db.Integer, nullable=False)
+    monto_total = db.Column(db.Float, nullable=False)
+
+# --- CONTADORES DE VERSIÓN (INVALIDAN CACHÉS EN TODOS LOS WORKERS) ---
+class ContadorVersion(db.Model):
+    clave = db.Column(db.String(50), primary_key=True)
+    valor = db.Column(db.Integer, nullable=False, default=0)
+
+# --- TURNO ABIERTO (TOTALES ACUMULADOS DESDE EL ÚLTIMO CIERRE) ---
+class TurnoAbierto(db.Model):
+    sucursal = db.Column(db.String(50), primary_key=True)
+    medio_pago = db.Column(db.String(50), primary_key=True)
+    cantidad_ventas = db.Column(db.Integer, nullable=False, default=0)
+    monto_total = db.Column(db.Float, nullable=False, default=0.0)
+    # Rango de Venta.id del turno: pasa tal cual al CierreCaja
+    venta_desde_id = db.Column(db.Integer)
+    venta_hasta_id = db.Column(db.Integer)
+
+# --- EVENTOS EN VIVO DEL PANEL (VENTAS Y CIERRES, LOS LEE EL SSE DE CADA WORKER) ---
+class EventoPanel(db.Model):
+    id = db.Column(db.Integer, primary_key=True) # Es el "id:" del evento SSE (Last-Event-ID)
+    fecha = db.Column(db.DateTime, nullable=False)
+    tipo = db.Column(db.String(20), nullable=False) # venta / cierre
+    sucursal = db.Column(db.String(50))
+    datos = db.Column(db.Text, nullable=False) # JSON tal cual se manda al navegador
+
+# --- REPORTES EN SEGUNDO PLANO ---
+class TrabajoReporte(db.Model):
+    id = db.Column(db.String(32), primary_key=True) # uuid4 hex
+    fecha_inicio = db.Column(db.DateTime, nullable=False)
+    fecha_fin = db.Column(db.DateTime, nullable=False)
+    max_venta_id = db.Column(db.Integer) # Última venta incluida (clave de la caché)
+    version_ventas = db.Column(db.Integer) # ContadorVersion 'ventas' al pedirlo (también es clave de la caché)
+    proceso = db.Column(db.String(80)) # 'host:pid' del worker que lo genera (el pool vive en su memoria)
+    estado = db.Column(db.String(20), nullable=False, default='pendiente') # pendiente/procesando/listo/sin_datos/error
+    archivo = db.Column(db.String(255))
+    error = db.Column(db.Text)
+    creado = db.Column(db.DateTime, nullable=False)
+    terminado = db.Column(db.DateTime)
+
+# --- RESÚMENES DIARIOS (SOLO DÍAS YA TERMINADOS) ---
+class ResumenDiario(db.Model):
+    fecha = db.Column(db.Date, primary_key=True)
+    sucursal = db.Column(db.String(50), primary_key=True) # '' si la venta no tenía sucursal
+    medio_pago = db.Column(db.String(50), primary_key=True)
+    cantidad_ventas = db.Column(db.Integer, nullable=False, default=0)
+    monto_total = db.Column(db.Float, nullable=False, default=0.0)
+
+class ResumenDiarioProducto(db.Model):
+    fecha = db.Column(db.Date, primary_key=True)
+    sucursal = db.Column(db.String(50), primary_key=True)
+    nombre_producto = db.Column(db.String(100), primary_key=True)
+    unidades = db.Column(db.Integer, nullable=False, default=0)
+    monto = db.Column(db.Float) # NULL si ningún renglón del día tenía precio conocido
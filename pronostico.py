@@ -0,0 +1,232 @@
+# pronostico.py - PRONÓSTICO DE CONSUMO (HORAS HASTA QUEDARSE SIN STOCK)
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, func
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, Venta, VentaItem, VentaItemSabor, Sabor, ConsumoHorario, ContadorVersion
+from stock import TIPOS_ITEM, stock_actual
+from base_datos import reintentar_si_bloqueada
+from archivo import en_ambas
+
+# Última Venta.id ya sumada a ConsumoHorario
+CLAVE_PRONOSTICO = 'pronostico_hasta_venta'
+HORAS_SEMANA = 7 * 24
+# Ventas leídas por transacción (la carga histórica avanza de a lotes)
+VENTAS_POR_LOTE = 20000
+
+
+class PronosticoConsumo:
+    """
+    Consumo de cada sabor / insumo por sucursal y hora de la semana (lunes 0 hs ... domingo 23 hs).
+    ConsumoHorario guarda lo acumulado de toda la historia; cada actualización solo
+    lee las ventas con id mayor a la marca, así la pantalla no recorre años de ventas.
+    """
+
+    def __init__(self, catalogo):
+        self.catalogo = catalogo # CacheCatalogo del manager
+
+    def hasta(self):
+        valor = db.session.execute(
+            select(ContadorVersion.valor).where(ContadorVersion.clave == CLAVE_PRONOSTICO)
+        ).scalar()
+        return valor or 0
+
+    def actualizar(self, tamanio_lote=VENTAS_POR_LOTE, al_avanzar=None):
+        """Suma las ventas nuevas a los acumulados. Devuelve cuántas ventas procesó."""
+        total = 0
+        while True:
+            procesadas = self._procesar_lote(tamanio_lote)
+            if not procesadas: return total
+            total += procesadas
+            if al_avanzar: al_avanzar(total)
+
+    def horas_hasta_agotar(self, modelo, ahora=None):
+        """
+        {id_item: {id_sucursal: horas}} partiendo del stock actual y consumiendo
+        al ritmo promedio de cada hora de la semana desde la hora actual.
+        None = el ítem nunca se vendió en esa sucursal (no se agota).
+        """
+        ahora = ahora or datetime.now()
+        tipo_item = TIPOS_ITEM[modelo][0]
+        stock = stock_actual(modelo)
+        resultado = {}
+        for item, suc in stock:
+            resultado.setdefault(item, {})[suc] = None
+
+        consumo = pd.DataFrame(db.session.execute(
+            select(ConsumoHorario.item_id, ConsumoHorario.sucursal_id, ConsumoHorario.hora_semana, ConsumoHorario.cantidad)
+            .where(ConsumoHorario.tipo_item == tipo_item)
+        ).all(), columns=['item_id', 'sucursal_id', 'hora_semana', 'cantidad'])
+        if consumo.empty: return resultado
+
+        # Promedio por hora = acumulado / semanas de historia de la sucursal
+        semanas = pd.Series(self._semanas_de_historia(ahora))
+        consumo['cantidad'] /= consumo['sucursal_id'].map(semanas).fillna(1.0)
+        tasas = consumo.pivot_table(index=['item_id', 'sucursal_id'], columns='hora_semana',
+                                    values='cantidad', aggfunc='sum', fill_value=0.0)\
+                       .reindex(columns=range(HORAS_SEMANA), fill_value=0.0)
+
+        # Columna 0 = la hora en curso
+        hora_actual = ahora.weekday() * 24 + ahora.hour
+        matriz = np.roll(tasas.to_numpy(dtype=float), -hora_actual, axis=1)
+        cantidades = np.array([stock.get(clave, 0.0) for clave in tasas.index], dtype=float)
+        horas = _horas_hasta_agotar(cantidades, matriz)
+
+        for (item, suc), valor in zip(tasas.index, horas):
+            resultado.setdefault(int(item), {})[int(suc)] = None if np.isnan(valor) else float(valor)
+        return resultado
+
+    # --- INTERNOS ---
+    def _semanas_de_historia(self, ahora):
+        """{id_sucursal: semanas desde su primera venta} (mínimo 1, para no inflar locales nuevos)."""
+        semanas = {}
+        for sucursal in self.catalogo.obtener().sucursales_con_stock():
+            # MIN por sucursal en cada base: lo resuelve el índice (sucursal, fecha) sin recorrer la tabla
+            primeras = db.session.execute(en_ambas(
+                lambda V, *_: select(func.min(V.fecha)).where(V.sucursal == sucursal.nombre)
+            )).scalars()
+            primera = min((f for f in primeras if f), default=None)
+            if primera:
+                semanas[sucursal.id] = max((ahora - primera) / timedelta(weeks=1), 1.0)
+        return semanas
+
+    @reintentar_si_bloqueada
+    def _procesar_lote(self, tamanio_lote):
+        desde = self.hasta()
+        ventas = pd.DataFrame(db.session.execute(
+            select(Venta.id, Venta.fecha, Venta.sucursal, Venta.detalle)
+            .where(Venta.id > desde).order_by(Venta.id).limit(tamanio_lote)
+        ).all(), columns=['venta_id', 'fecha', 'sucursal', 'detalle'])
+        if ventas.empty: return 0
+        hasta = int(ventas['venta_id'].iloc[-1])
+
+        consumo = self._consumo_del_lote(ventas, desde, hasta)
+        if not consumo.empty:
+            tabla = ConsumoHorario.__table__
+            stmt = insert(tabla)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['tipo_item', 'item_id', 'sucursal_id', 'hora_semana'],
+                set_={'cantidad': tabla.c.cantidad + stmt.excluded.cantidad}
+            )
+            db.session.execute(stmt, consumo.to_dict('records'))
+
+        stmt = insert(ContadorVersion).values(clave=CLAVE_PRONOSTICO, valor=hasta)
+        stmt = stmt.on_conflict_do_update(index_elements=[ContadorVersion.clave], set_={'valor': hasta})
+        db.session.execute(stmt)
+        db.session.commit()
+        return len(ventas)
+
+    def _consumo_del_lote(self, ventas, desde, hasta):
+        """DataFrame (tipo_item, item_id, sucursal_id, hora_semana, cantidad) ya agrupado."""
+        catalogo = self.catalogo.obtener()
+
+        # Renglones estructurados (VentaItem) cuando existen...
+        renglones = pd.DataFrame(db.session.execute(
+            select(VentaItem.venta_id, VentaItem.producto_id, VentaItem.cantidad)
+            .where(VentaItem.venta_id > desde, VentaItem.venta_id <= hasta)
+        ).all(), columns=['venta_id', 'producto_id', 'cantidad'])
+        sabores = pd.DataFrame(db.session.execute(
+            select(VentaItem.venta_id, VentaItemSabor.sabor_nombre, VentaItemSabor.gramos)
+            .join(VentaItem, VentaItem.id == VentaItemSabor.venta_item_id)
+            .where(VentaItem.venta_id > desde, VentaItem.venta_id <= hasta)
+        ).all(), columns=['venta_id', 'sabor_nombre', 'gramos'])
+
+        # ...y si no, el texto de Venta.detalle
+        sin_items = ventas[~ventas['venta_id'].isin(renglones['venta_id'])]
+        if not sin_items.empty:
+            renglones_texto, sabores_texto = _parsear_detalles(sin_items, catalogo)
+            renglones = pd.concat([renglones, renglones_texto], ignore_index=True)
+            sabores = pd.concat([sabores, sabores_texto], ignore_index=True)
+
+        # Renglones sin producto (ventas importadas sin detalle) no descuentan insumos; si todos
+        # vienen en NULL la columna queda 'object' y el merge con los ids (float64) falla
+        renglones = renglones.astype({'producto_id': 'float64'}).dropna(subset=['producto_id'])
+
+        # Insumos: unidades de cada renglón por el insumo de cada producto (combos desarmados)
+        insumos = renglones.merge(_insumos_por_producto(catalogo), on='producto_id')
+        insumos = pd.DataFrame({
+            'venta_id': insumos['venta_id'], 'tipo_item': 'insumo',
+            'item_id': insumos['insumo_id'], 'cantidad': insumos['cantidad'] * insumos['unidades'],
+        })
+
+        ids_sabor = pd.Series(dict(db.session.execute(select(Sabor.nombre, Sabor.id)).all()), dtype='float64')
+        sabores = pd.DataFrame({
+            'venta_id': sabores['venta_id'], 'tipo_item': 'sabor',
+            'item_id': sabores['sabor_nombre'].map(ids_sabor), 'cantidad': sabores['gramos'],
+        })
+
+        consumo = pd.concat([sabores, insumos], ignore_index=True).dropna(subset=['item_id'])
+        if consumo.empty: return consumo
+
+        # Sucursal y hora de la semana de cada venta
+        ids_sucursal = pd.Series({s.nombre: s.id for s in catalogo.sucursales_con_stock()}, dtype='float64')
+        ventas = ventas.assign(
+            sucursal_id=ventas['sucursal'].map(ids_sucursal),
+            hora_semana=lambda df: pd.to_datetime(df['fecha']).dt.dayofweek * 24 + pd.to_datetime(df['fecha']).dt.hour,
+        )
+        consumo = consumo.merge(ventas[['venta_id', 'sucursal_id', 'hora_semana']], on='venta_id')\
+                         .dropna(subset=['sucursal_id'])
+        consumo = consumo.groupby(['tipo_item', 'item_id', 'sucursal_id', 'hora_semana'], as_index=False)['cantidad'].sum()
+        return consumo.astype({'item_id': int, 'sucursal_id': int, 'hora_semana': int, 'cantidad': float})
+
+
+def _parsear_detalles(ventas, catalogo):
+    """
+    Mismo formato que arma la venta: 'Promo [2x 1 kg] (Chocolate, Limon); Vasito (Sin sabores)'.
+    Devuelve (renglones, sabores) con las columnas de los estructurados; todo por columna, sin bucles por venta.
+    """
+    textos = ventas[['venta_id']].assign(texto=ventas['detalle'].str.split(';')).explode('texto', ignore_index=True)
+    textos['texto'] = textos['texto'].str.strip()
+    textos = textos[textos['texto'].fillna('') != ''].reset_index(drop=True)
+
+    partes = textos['texto'].str.extract(r'^(?P<resto>.*?)(?: \((?P<sabores>[^()]*)\))?$')
+    nombres = partes['resto'].str.replace(r' \[.*$', '', regex=True).str.strip()
+    ids_producto = pd.Series({nombre: p.id for nombre, p in catalogo.productos_por_nombre.items()}, dtype='float64')
+    renglones = pd.DataFrame({'venta_id': textos['venta_id'], 'producto_id': nombres.map(ids_producto), 'cantidad': 1})
+
+    elegidos = partes['sabores'].where(partes['sabores'] != 'Sin sabores').str.split(',')
+    sabores = renglones.assign(sabor_nombre=elegidos).explode('sabor_nombre')
+    sabores['sabor_nombre'] = sabores['sabor_nombre'].str.strip()
+    sabores = sabores[sabores['sabor_nombre'].fillna('') != '']
+    # Los gramos del producto se reparten entre los sabores del renglón (el índice es el renglón)
+    gramos = pd.Series({p.id: catalogo.gramos_helado(p) for p in catalogo.productos_por_id.values()}, dtype='float64')
+    cantidad_sabores = sabores.groupby(level=0)['sabor_nombre'].transform('size')
+    sabores = sabores.assign(gramos=sabores['producto_id'].map(gramos).fillna(0.0) / cantidad_sabores)
+    return renglones.dropna(subset=['producto_id']), sabores[['venta_id', 'sabor_nombre', 'gramos']]
+
+
+def _insumos_por_producto(catalogo):
+    """DataFrame (producto_id, insumo_id, unidades) por unidad vendida, con los combos desarmados."""
+    # Mismas recetas que descuenta la venta (combos ya compilados)
+    filas = [(producto.id, id_insumo, unidades)
+             for producto in catalogo.productos_por_id.values()
+             for id_insumo, unidades in catalogo.receta(producto).insumos.items()]
+    mapa = pd.DataFrame(filas, columns=['producto_id', 'insumo_id', 'unidades'])
+    return mapa.groupby(['producto_id', 'insumo_id'], as_index=False)['unidades'].sum().astype({'producto_id': 'float64'})
+
+
+def _horas_hasta_agotar(stock, tasas):
+    """
+    stock: (n,) cantidades actuales; tasas: (n, 168) consumo por hora empezando por la actual.
+    Devuelve (n,) horas hasta que el consumo acumulado alcanza el stock (NaN = nunca).
+    """
+    acumulado = tasas.cumsum(axis=1)
+    por_semana = acumulado[:, -1]
+    con_consumo = por_semana > 0
+    por_semana_seguro = np.where(con_consumo, por_semana, 1.0)
+
+    # Semanas completas que alcanzan y lo que queda para la última (0, por_semana]
+    semanas = np.maximum(np.ceil(stock / por_semana_seguro) - 1, 0)
+    resto = stock - semanas * por_semana
+    hora = np.minimum((acumulado < resto[:, None]).sum(axis=1), HORAS_SEMANA - 1)
+
+    filas = np.arange(len(stock))
+    antes = np.where(hora > 0, acumulado[filas, np.maximum(hora - 1, 0)], 0.0)
+    tasa = tasas[filas, hora]
+    fraccion = np.clip(np.divide(resto - antes, tasa, out=np.ones_like(tasa), where=tasa > 0), 0.0, 1.0)
+
+    horas = semanas * HORAS_SEMANA + hora + fraccion
+    horas = np.where(con_consumo, horas, np.nan)
+    return np.where(stock <= 0, 0.0, horas)
@@ -0,0 +1,102 @@
+# recetas.py - RECETAS COMPILADAS DE LOS COMBOS (LISTA DE MATERIALES PLANA)
+from collections import defaultdict, namedtuple
+from sqlalchemy import select, delete
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, Producto, ComboItem, RecetaCombo, RecetaComboInsumo
+
+# Lo que descuenta una unidad vendida: gramos de helado (a repartir entre los gustos) y {insumo_id: unidades}
+Receta = namedtuple('Receta', 'gramos_helado insumos')
+RECETA_VACIA = Receta(0.0, {})
+
+
+class ComboConCiclo(ValueError):
+    """Un combo que se contiene a sí mismo (directo o a través de otros combos)."""
+
+    def __init__(self, camino):
+        self.camino = camino
+        super().__init__("El combo se contiene a sí mismo: " + " → ".join(camino))
+
+
+def receta_simple(producto):
+    """Receta de un producto que no es combo: su peso de helado y su insumo."""
+    gramos = (producto.peso_helado or 0.0) if producto.es_helado else 0.0
+    return Receta(gramos, {producto.insumo_id: 1} if producto.insumo_id else {})
+
+
+def compilar(productos, combo_items):
+    """
+    {id_combo: Receta} con cada combo desarmado hasta productos simples (cantidades multiplicadas).
+    Igual que el descuento de siempre: el combo no descuenta su propio insumo.
+    Lanza ComboConCiclo si algún combo se contiene a sí mismo.
+    """
+    por_id = {p.id: p for p in productos}
+    hijos = defaultdict(list)
+    for ci in combo_items:
+        if ci.item_id in por_id:
+            hijos[ci.promo_id].append((por_id[ci.item_id], ci.cantidad))
+
+    recetas = {}
+    en_curso = [] # Camino de combos que se están resolviendo
+
+    def resolver(producto):
+        if not producto.es_combo: return receta_simple(producto)
+        if producto.id in recetas: return recetas[producto.id]
+        if producto.id in en_curso:
+            camino = en_curso[en_curso.index(producto.id):] + [producto.id]
+            raise ComboConCiclo([por_id[i].nombre for i in camino])
+
+        en_curso.append(producto.id)
+        gramos, insumos = 0.0, defaultdict(int)
+        for hijo, cantidad in hijos[producto.id]:
+            receta = resolver(hijo)
+            gramos += receta.gramos_helado * cantidad
+            for id_insumo, unidades in receta.insumos.items():
+                insumos[id_insumo] += unidades * cantidad
+        en_curso.pop()
+
+        recetas[producto.id] = Receta(gramos, dict(insumos))
+        return recetas[producto.id]
+
+    for producto in productos:
+        if producto.es_combo:
+            resolver(producto)
+    return recetas
+
+
+def compilar_recetas():
+    """
+    Recompila y guarda las recetas de todos los combos en la transacción actual
+    (llamar antes del commit de cualquier edición de productos o combos).
+    Lanza ComboConCiclo sin tocar nada: quien llama hace rollback.
+    """
+    productos = db.session.execute(select(Producto)).scalars().all()
+    combo_items = db.session.execute(select(ComboItem)).scalars().all()
+    recetas = compilar(productos, combo_items)
+
+    db.session.execute(delete(RecetaComboInsumo))
+    db.session.execute(delete(RecetaCombo))
+    if recetas:
+        db.session.execute(insert(RecetaCombo), [
+            {'producto_id': id_combo, 'gramos_helado': receta.gramos_helado} for id_combo, receta in recetas.items()
+        ])
+    filas_insumo = [
+        {'producto_id': id_combo, 'insumo_id': id_insumo, 'unidades': unidades}
+        for id_combo, receta in recetas.items() for id_insumo, unidades in receta.insumos.items()
+    ]
+    if filas_insumo:
+        db.session.execute(insert(RecetaComboInsumo), filas_insumo)
+    return recetas
+
+
+def cargar_recetas():
+    """{id_combo: Receta} tal como quedaron guardadas (para el catálogo en memoria)."""
+    insumos = defaultdict(dict)
+    for id_combo, id_insumo, unidades in db.session.execute(
+        select(RecetaComboInsumo.producto_id, RecetaComboInsumo.insumo_id, RecetaComboInsumo.unidades)
+    ):
+        insumos[id_combo][id_insumo] = unidades
+    return {
+        id_combo: Receta(gramos, insumos.get(id_combo, {}))
+        for id_combo, gramos in db.session.execute(select(RecetaCombo.producto_id, RecetaCombo.gramos_helado))
+    }
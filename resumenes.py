@@ -0,0 +1,142 @@
+# resumenes.py - RESÚMENES DIARIOS (ROLLUPS) DE DÍAS YA TERMINADOS
+from datetime import date, datetime, time, timedelta
+from sqlalchemy import func, select, delete
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, ResumenDiario, ResumenDiarioProducto, ContadorVersion
+from base_datos import reintentar_si_bloqueada
+from archivo import en_ambas
+
+# Último día materializado (guardado como date.toordinal())
+CLAVE_RESUMENES = 'resumenes_hasta'
+# La carga histórica se hace en transacciones de a un mes
+DIAS_POR_TRANSACCION = 31
+
+
+class ResumenesDiarios:
+    """
+    Totales por día / sucursal / medio de pago (y por producto) de los días cerrados.
+    Los reportes y el panel leen estas tablas para los días completos del rango y
+    solo van a Venta para el pedazo que todavía no está resumido (hoy).
+    """
+
+    def hasta(self):
+        """Último día resumido (o None si nunca se corrió)."""
+        valor = db.session.execute(
+            select(ContadorVersion.valor).where(ContadorVersion.clave == CLAVE_RESUMENES)
+        ).scalar()
+        return date.fromordinal(valor) if valor else None
+
+    def actualizar(self, hasta=None):
+        """
+        Resume los días nuevos hasta ayer (incremental). La primera vez arranca
+        desde la venta más vieja, o sea que también sirve de carga histórica.
+        Devuelve (desde, hasta) procesado o None si no había nada que hacer.
+        """
+        hasta = hasta or (date.today() - timedelta(days=1))
+        ultimo = self.hasta()
+        if ultimo:
+            desde = ultimo + timedelta(days=1)
+        else:
+            primeras = [f for f in db.session.execute(en_ambas(lambda V, *_: select(func.min(V.fecha)))).scalars() if f]
+            if not primeras: return None
+            primera = min(primeras)
+            desde = primera.date()
+
+        if desde > hasta: return None
+        self.recalcular(desde, hasta)
+        return desde, hasta
+
+    def recalcular(self, desde, hasta):
+        """Rehace los resúmenes de [desde, hasta] (ej: después de importar ventas viejas)."""
+        dia = desde
+        while dia <= hasta:
+            fin_tramo = min(dia + timedelta(days=DIAS_POR_TRANSACCION - 1), hasta)
+            self._materializar(dia, fin_tramo)
+            dia = fin_tramo + timedelta(days=1)
+
+    def dividir_rango(self, fecha_inicio, fecha_fin):
+        """
+        Separa [fecha_inicio, fecha_fin] en:
+          - (primer_dia, ultimo_dia) que se pueden leer de los resúmenes (o None)
+          - tramos [desde, hasta) que hay que leer de Venta
+        Cualquiera de las dos fechas puede ser None (sin límite).
+        """
+        fin_exclusivo = fecha_fin + timedelta(microseconds=1) if fecha_fin else None
+        resumido_hasta = self.hasta()
+        if not resumido_hasta:
+            return None, [(fecha_inicio, fin_exclusivo)]
+
+        # Solo días enteros dentro del rango
+        if fecha_inicio is None:
+            primer_dia = None
+        elif fecha_inicio.time() == time.min:
+            primer_dia = fecha_inicio.date()
+        else:
+            primer_dia = fecha_inicio.date() + timedelta(days=1)
+
+        ultimo_dia = resumido_hasta
+        if fin_exclusivo is not None:
+            ultimo_dia = min(ultimo_dia, fin_exclusivo.date() - timedelta(days=1))
+
+        if primer_dia is not None and primer_dia > ultimo_dia:
+            return None, [(fecha_inicio, fin_exclusivo)]
+
+        tramos = []
+        if primer_dia is not None and fecha_inicio < _inicio_del_dia(primer_dia):
+            tramos.append((fecha_inicio, _inicio_del_dia(primer_dia)))
+        inicio_cola = _inicio_del_dia(ultimo_dia + timedelta(days=1))
+        if fin_exclusivo is None or inicio_cola < fin_exclusivo:
+            tramos.append((inicio_cola, fin_exclusivo))
+        return (primer_dia, ultimo_dia), tramos
+
+    @reintentar_si_bloqueada
+    def _materializar(self, desde, hasta):
+        inicio, fin = _inicio_del_dia(desde), _inicio_del_dia(hasta + timedelta(days=1))
+
+        # Base caliente + archivo: cada mitad agrupa con sus índices y el total suma los parciales
+        def por_medio(V, *_):
+            return select(func.date(V.fecha).label('fecha'), func.coalesce(V.sucursal, '').label('sucursal'),
+                          V.medio_pago, func.count().label('cantidad'), func.sum(V.total).label('monto'))\
+                   .where(V.fecha >= inicio, V.fecha < fin)\
+                   .group_by(func.date(V.fecha), func.coalesce(V.sucursal, ''), V.medio_pago)
+
+        def por_producto(V, I, _):
+            return select(func.date(V.fecha).label('fecha'), func.coalesce(V.sucursal, '').label('sucursal'),
+                          I.nombre_producto, func.sum(I.cantidad).label('unidades'),
+                          func.sum(I.cantidad * I.precio_unitario).label('monto'))\
+                   .join(I, I.venta_id == V.id)\
+                   .where(V.fecha >= inicio, V.fecha < fin)\
+                   .group_by(func.date(V.fecha), func.coalesce(V.sucursal, ''), I.nombre_producto)
+
+        medios = en_ambas(por_medio).subquery()
+        productos = en_ambas(por_producto).subquery()
+
+        db.session.execute(delete(ResumenDiario).where(ResumenDiario.fecha.between(desde, hasta)))
+        db.session.execute(delete(ResumenDiarioProducto).where(ResumenDiarioProducto.fecha.between(desde, hasta)))
+
+        # INSERT ... SELECT: la agregación la hace SQLite, no Python
+        db.session.execute(insert(ResumenDiario).from_select(
+            ['fecha', 'sucursal', 'medio_pago', 'cantidad_ventas', 'monto_total'],
+            select(medios.c.fecha, medios.c.sucursal, medios.c.medio_pago, func.sum(medios.c.cantidad), func.sum(medios.c.monto))
+            .group_by(medios.c.fecha, medios.c.sucursal, medios.c.medio_pago)
+        ))
+        db.session.execute(insert(ResumenDiarioProducto).from_select(
+            ['fecha', 'sucursal', 'nombre_producto', 'unidades', 'monto'],
+            select(productos.c.fecha, productos.c.sucursal, productos.c.nombre_producto,
+                   func.sum(productos.c.unidades), func.sum(productos.c.monto))
+            .group_by(productos.c.fecha, productos.c.sucursal, productos.c.nombre_producto)
+        ))
+
+        # Solo se avanza la marca; recalcular días viejos no la mueve para atrás
+        stmt = insert(ContadorVersion).values(clave=CLAVE_RESUMENES, valor=hasta.toordinal())
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ContadorVersion.clave],
+            set_={'valor': func.max(ContadorVersion.valor, hasta.toordinal())}
+        )
+        db.session.execute(stmt)
+        db.session.commit()
+
+
+def _inicio_del_dia(dia):
+    return datetime.combine(dia, time.min)
@@ -0,0 +1,94 @@
+# sesiones.py - CACHÉ DE USUARIOS PARA FLASK-LOGIN (LRU POR WORKER + VERSIÓN POR USUARIO)
+import threading
+import time
+from collections import OrderedDict
+from flask_login import UserMixin
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, Usuario, ContadorVersion
+
+# Un contador por usuario en ContadorVersion ('usuario:<id>'), subido al editarlo o borrarlo
+PREFIJO_VERSION = 'usuario:'
+# Cada cuánto un worker mira los contadores (lo más que tarda en enterarse de un cambio hecho en otro)
+SEGUNDOS_ENTRE_CONTROLES = 5
+MAX_USUARIOS = 256
+
+
+class UsuarioSesion(UserMixin):
+    """Lo que los requests usan de current_user: identidad, rol y sucursal (sin la contraseña)."""
+
+    def __init__(self, usuario):
+        self.id = usuario.id
+        self.username = usuario.username
+        self.rol = usuario.rol
+        self.sucursal = usuario.sucursal
+
+
+class CacheUsuarios:
+    """
+    Evita el SELECT de Usuario en cada request (cada venta, cada consulta del panel).
+    Guarda copias sueltas (no objetos de la sesión) así se pueden compartir entre hilos.
+    Como mucho cada SEGUNDOS_ENTRE_CONTROLES lee los contadores de versión de los usuarios
+    (una consulta para todos) y descarta solo los que cambiaron: un admin degradado o borrado
+    pierde el rol en todos los workers en ese plazo; en el worker que hizo el cambio, al instante.
+    """
+
+    def __init__(self, maximo=MAX_USUARIOS, intervalo=SEGUNDOS_ENTRE_CONTROLES):
+        self.maximo = maximo
+        self.intervalo = intervalo
+        self._usuarios = OrderedDict() # id -> UsuarioSesion
+        self._versiones = {} # id -> último valor visto de su contador
+        self._proximo_control = 0.0
+        self._lock = threading.Lock()
+
+    def obtener(self, id_usuario):
+        self._controlar_versiones()
+        with self._lock:
+            sesion = self._usuarios.get(id_usuario)
+            if sesion is not None:
+                self._usuarios.move_to_end(id_usuario)
+                return sesion
+            version = self._versiones.get(id_usuario)
+
+        usuario = db.session.get(Usuario, id_usuario)
+        if usuario is None: return None
+
+        sesion = UsuarioSesion(usuario)
+        with self._lock:
+            # Si otro hilo vio un cambio mientras tanto, esta copia puede ser vieja: no se guarda
+            if self._versiones.get(id_usuario) != version: return sesion
+            self._usuarios[id_usuario] = sesion
+            self._usuarios.move_to_end(id_usuario)
+            while len(self._usuarios) > self.maximo:
+                self._usuarios.popitem(last=False)
+        return sesion
+
+    def invalidar(self, id_usuario):
+        """Sube la versión del usuario dentro de la transacción actual (el que llama hace el commit)."""
+        stmt = insert(ContadorVersion).values(clave=f"{PREFIJO_VERSION}{id_usuario}", valor=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ContadorVersion.clave],
+            set_={'valor': ContadorVersion.valor + 1}
+        )
+        db.session.execute(stmt)
+        with self._lock:
+            self._usuarios.pop(id_usuario, None)
+
+    def _controlar_versiones(self):
+        ahora = time.monotonic()
+        if ahora < self._proximo_control: return
+        with self._lock:
+            if ahora < self._proximo_control: return # Otro hilo ya lo está haciendo
+            self._proximo_control = ahora + self.intervalo
+
+        versiones = db.session.execute(
+            select(ContadorVersion.clave, ContadorVersion.valor).where(ContadorVersion.clave.startswith(PREFIJO_VERSION))
+        ).all()
+        with self._lock:
+            for clave, valor in versiones:
+                id_usuario = int(clave[len(PREFIJO_VERSION):])
+                if self._versiones.get(id_usuario) != valor:
+                    # Una copia guardada antes de este cambio (o antes de conocer el contador) puede ser vieja
+                    self._usuarios.pop(id_usuario, None)
+                    self._versiones[id_usuario] = valor
@@ -0,0 +1,229 @@
+# stock.py - LIBRO DE MOVIMIENTOS DE STOCK (SALDOS CONSOLIDADOS + DELTAS)
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import select, func, bindparam, literal, exists
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm.exc import StaleDataError
+
+from models import db, Sabor, Insumo, Sucursal, StockSabor, StockInsumo, MovimientoStock, SnapshotStock, ContadorVersion
+
+# Último MovimientoStock ya sumado a StockSabor/StockInsumo
+CLAVE_CONSOLIDADO = 'stock_consolidado'
+
+# modelo de saldo -> (tipo_item en el libro, columna del ítem, columna de cantidad)
+TIPOS_ITEM = {
+    StockSabor: ('sabor', 'sabor_id', 'gramos'),
+    StockInsumo: ('insumo', 'insumo_id', 'unidades'),
+}
+
+
+class AcumuladorStock:
+    """
+    Junta los descuentos de un carrito entero (gramos por sabor, unidades por insumo)
+    y los registra como movimientos del libro: solo INSERT, ninguna venta actualiza
+    una fila compartida, así dos workers vendiendo a la vez no se esperan.
+    """
+
+    def __init__(self):
+        self.gramos_por_sabor = defaultdict(float)
+        self.unidades_por_insumo = defaultdict(int)
+
+    def descontar_sabor(self, nombre_sabor, gramos):
+        self.gramos_por_sabor[nombre_sabor] += gramos
+
+    def descontar_insumo(self, id_insumo, unidades=1):
+        self.unidades_por_insumo[id_insumo] += unidades
+
+    def aplicar(self, sucursal, venta_id=None, fecha=None):
+        """Inserta los movimientos en la transacción actual (el commit lo hace quien llama)."""
+        if sucursal is None or not sucursal.tiene_stock:
+            # Ej: "General" (admin) no tiene stock propio
+            return
+        fecha = fecha or datetime.now()
+        tabla = MovimientoStock.__table__ # Core: executemany sin pasar por el ORM
+        columnas = ['fecha', 'tipo', 'tipo_item', 'item_id', 'sucursal_id', 'delta', 'venta_id']
+
+        if self.gramos_por_sabor:
+            # El id del sabor se resuelve en el mismo INSERT ... SELECT (índice único por nombre)
+            filas = select(
+                literal(fecha, MovimientoStock.fecha.type), literal('venta'), literal('sabor'), Sabor.id,
+                literal(sucursal.id), -bindparam('b_gramos', type_=MovimientoStock.delta.type), literal(venta_id)
+            ).where(Sabor.nombre == bindparam('b_nombre'))
+            db.session.execute(insert(tabla).from_select(columnas, filas), [
+                {'b_nombre': nombre, 'b_gramos': gramos}
+                for nombre, gramos in self.gramos_por_sabor.items()
+            ])
+
+        if self.unidades_por_insumo:
+            db.session.execute(insert(tabla), [
+                {'fecha': fecha, 'tipo': 'venta', 'tipo_item': 'insumo', 'item_id': id_insumo,
+                 'sucursal_id': sucursal.id, 'delta': -unidades, 'venta_id': venta_id}
+                for id_insumo, unidades in self.unidades_por_insumo.items()
+            ])
+
+
+# --- MOVIMIENTOS MANUALES (REPOSICIÓN / CORRECCIÓN) ---
+def registrar_movimiento(modelo, tipo, id_item, id_sucursal, delta):
+    """Agrega un movimiento al libro (dentro de la transacción de quien llama)."""
+    tipo_item = TIPOS_ITEM[modelo][0]
+    db.session.add(MovimientoStock(fecha=datetime.now(), tipo=tipo, tipo_item=tipo_item,
+                                   item_id=id_item, sucursal_id=id_sucursal, delta=delta))
+
+
+def registrar_correccion(modelo, id_item, id_sucursal, cantidad_real):
+    """
+    El conteo real entra como un movimiento por la diferencia con el stock calculado.
+    Control optimista: el INSERT solo pasa si nadie movió ese ítem desde la lectura;
+    si una venta se coló en el medio, StaleDataError (y reintentar_si_bloqueada rehace todo).
+    Devuelve la diferencia registrada.
+    """
+    tipo_item = TIPOS_ITEM[modelo][0]
+    del_item = (MovimientoStock.tipo_item == tipo_item, MovimientoStock.item_id == id_item,
+                MovimientoStock.sucursal_id == id_sucursal)
+    marca = db.session.execute(select(func.max(MovimientoStock.id)).where(*del_item)).scalar() or 0
+    diferencia = cantidad_real - stock_de(modelo, id_item, id_sucursal)
+
+    fila = select(
+        literal(datetime.now(), MovimientoStock.fecha.type), literal('correccion'), literal(tipo_item),
+        literal(id_item), literal(id_sucursal), literal(diferencia, MovimientoStock.delta.type)
+    ).where(~exists().where(*del_item, MovimientoStock.id > marca))
+    resultado = db.session.execute(insert(MovimientoStock.__table__).from_select(
+        ['fecha', 'tipo', 'tipo_item', 'item_id', 'sucursal_id', 'delta'], fila
+    ))
+    if resultado.rowcount != 1:
+        raise StaleDataError(f"El stock de {tipo_item} {id_item} cambió durante la corrección")
+    return diferencia
+
+
+# --- LECTURAS ---
+def consolidado_hasta():
+    valor = db.session.execute(
+        select(ContadorVersion.valor).where(ContadorVersion.clave == CLAVE_CONSOLIDADO)
+    ).scalar()
+    return valor or 0
+
+
+def stock_actual(modelo, id_sucursal=None):
+    """{(id_item, id_sucursal): cantidad} = saldo consolidado + movimientos posteriores."""
+    tipo_item, columna_item, columna_cantidad = TIPOS_ITEM[modelo]
+    saldos = select(getattr(modelo, columna_item), modelo.sucursal_id, getattr(modelo, columna_cantidad))
+    if id_sucursal:
+        saldos = saldos.where(modelo.sucursal_id == id_sucursal)
+    stock = {(item, suc): cantidad for item, suc, cantidad in db.session.execute(saldos)}
+
+    # Movimientos sin consolidar: rango corto sobre la clave primaria
+    for (item, suc), delta in _sumar_movimientos(tipo_item, id_sucursal, MovimientoStock.id > consolidado_hasta()).items():
+        stock[(item, suc)] = stock.get((item, suc), 0) + delta
+    return stock
+
+
+def stock_de(modelo, id_item, id_sucursal):
+    tipo_item, columna_item, columna_cantidad = TIPOS_ITEM[modelo]
+    saldo = db.session.execute(
+        select(getattr(modelo, columna_cantidad))
+        .where(getattr(modelo, columna_item) == id_item, modelo.sucursal_id == id_sucursal)
+    ).scalar() or 0
+    pendiente = db.session.execute(
+        select(func.sum(MovimientoStock.delta))
+        .where(MovimientoStock.id > consolidado_hasta(), MovimientoStock.tipo_item == tipo_item,
+               MovimientoStock.item_id == id_item, MovimientoStock.sucursal_id == id_sucursal)
+    ).scalar() or 0
+    return saldo + pendiente
+
+
+def stock_a_fecha(modelo, fecha, id_sucursal=None):
+    """
+    {(id_item, id_sucursal): cantidad} al momento 'fecha'.
+    Parte de la última foto anterior y suma los movimientos hasta 'fecha';
+    si no hay foto previa, parte del stock actual y resta lo posterior.
+    """
+    tipo_item = TIPOS_ITEM[modelo][0]
+    id_foto = db.session.execute(
+        select(func.max(SnapshotStock.hasta_movimiento_id)).where(SnapshotStock.fecha <= fecha)
+    ).scalar()
+
+    if id_foto is None:
+        stock = stock_actual(modelo, id_sucursal)
+        posteriores = _sumar_movimientos(tipo_item, id_sucursal, MovimientoStock.fecha > fecha)
+        for clave, delta in posteriores.items():
+            stock[clave] = stock.get(clave, 0) - delta
+        return stock
+
+    foto = select(SnapshotStock.item_id, SnapshotStock.sucursal_id, SnapshotStock.cantidad)\
+        .where(SnapshotStock.hasta_movimiento_id == id_foto, SnapshotStock.tipo_item == tipo_item)
+    if id_sucursal:
+        foto = foto.where(SnapshotStock.sucursal_id == id_sucursal)
+    stock = {(item, suc): cantidad for item, suc, cantidad in db.session.execute(foto)}
+    siguientes = _sumar_movimientos(tipo_item, id_sucursal, MovimientoStock.id > id_foto, MovimientoStock.fecha <= fecha)
+    for clave, delta in siguientes.items():
+        stock[clave] = stock.get(clave, 0) + delta
+    return stock
+
+
+def _sumar_movimientos(tipo_item, id_sucursal, *condiciones):
+    query = select(MovimientoStock.item_id, MovimientoStock.sucursal_id, func.sum(MovimientoStock.delta))\
+        .where(MovimientoStock.tipo_item == tipo_item, *condiciones)
+    if id_sucursal:
+        query = query.where(MovimientoStock.sucursal_id == id_sucursal)
+    query = query.group_by(MovimientoStock.item_id, MovimientoStock.sucursal_id)
+    return {(item, suc): delta for item, suc, delta in db.session.execute(query)}
+
+
+# --- CONSOLIDACIÓN (PERIÓDICA, FUERA DEL CAMINO DE LA VENTA) ---
+def consolidar_stock():
+    """
+    Suma los movimientos nuevos a los saldos, guarda una foto de todos los saldos
+    y avanza la marca. Devuelve (movimientos_consolidados, hasta_movimiento_id).
+    El commit lo hace quien llama. Si otro proceso consolidó el mismo rango a la vez,
+    la marca ya no coincide: StaleDataError y se rehace desde la marca nueva.
+    """
+    desde = consolidado_hasta()
+    hasta = db.session.query(func.max(MovimientoStock.id)).scalar() or 0
+    if hasta <= desde:
+        return 0, desde
+
+    cantidad = db.session.query(func.count(MovimientoStock.id))\
+                         .filter(MovimientoStock.id > desde, MovimientoStock.id <= hasta).scalar()
+    # La marca hace de número de versión: solo avanza si sigue donde la leímos.
+    # Es la primera escritura, así nadie más consolida hasta el commit.
+    stmt = insert(ContadorVersion).values(clave=CLAVE_CONSOLIDADO, valor=hasta)
+    stmt = stmt.on_conflict_do_update(index_elements=[ContadorVersion.clave], set_={'valor': hasta},
+                                      where=ContadorVersion.valor == desde)
+    if db.session.execute(stmt).rowcount != 1:
+        raise StaleDataError("Otro proceso consolidó el stock al mismo tiempo")
+
+    ahora = datetime.now()
+    for modelo, (tipo_item, columna_item, columna_cantidad) in TIPOS_ITEM.items():
+        sumas = select(MovimientoStock.item_id, MovimientoStock.sucursal_id, func.sum(MovimientoStock.delta))\
+            .where(MovimientoStock.id > desde, MovimientoStock.id <= hasta, MovimientoStock.tipo_item == tipo_item)\
+            .group_by(MovimientoStock.item_id, MovimientoStock.sucursal_id)
+        stmt = insert(modelo).from_select([columna_item, 'sucursal_id', columna_cantidad], sumas)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[columna_item, 'sucursal_id'],
+            set_={columna_cantidad: getattr(modelo, columna_cantidad) + stmt.excluded[columna_cantidad]}
+        )
+        db.session.execute(stmt)
+
+        foto = select(literal(hasta), literal(tipo_item), getattr(modelo, columna_item), modelo.sucursal_id,
+                      literal(ahora, SnapshotStock.fecha.type), getattr(modelo, columna_cantidad))
+        db.session.execute(insert(SnapshotStock).from_select(
+            ['hasta_movimiento_id', 'tipo_item', 'item_id', 'sucursal_id', 'fecha', 'cantidad'], foto
+        ))
+
+    return cantidad, hasta
+
+
+def crear_filas_stock():
+    """
+    Asegura una fila de saldo en 0 para cada (sabor/insumo, sucursal con stock) que falte,
+    así las pantallas muestran todas las combinaciones. Se llama al crear sabores,
+    insumos o sucursales (dentro de la transacción de quien llama).
+    """
+    sucursales = select(Sucursal.id).where(Sucursal.tiene_stock == True).subquery()
+    for modelo, item in ((StockSabor, Sabor), (StockInsumo, Insumo)):
+        _, columna_item, columna_cantidad = TIPOS_ITEM[modelo]
+        faltantes = select(item.id, sucursales.c.id, 0).join(sucursales, db.true())
+        db.session.execute(
+            insert(modelo).from_select([columna_item, 'sucursal_id', columna_cantidad], faltantes)
+                          .on_conflict_do_nothing()
+        )
@@ -0,0 +1,27 @@
+# conftest.py - APP CONTRA UNA BASE TEMPORAL CON LOS DATOS DE init_db
+import os
+import tempfile
+
+import pytest
+
+# Antes de importar 'app': nunca tocar heladeria.db ni instance/
+_carpeta = tempfile.mkdtemp(prefix='heladeria_tests_')
+os.environ['HELADERIA_DB_URI'] = f"sqlite:///{os.path.join(_carpeta, 'heladeria.db')}?timeout=15"
+os.environ['HELADERIA_ARCHIVO'] = os.path.join(_carpeta, 'heladeria_archivo.db')
+os.environ['HELADERIA_METRICAS_DIR'] = os.path.join(_carpeta, 'metricas')
+
+
+@pytest.fixture
+def app():
+    from app import app as aplicacion
+    from init_db import cargar_datos_completos
+    cargar_datos_completos()
+    aplicacion.config['TESTING'] = True
+    yield aplicacion
+
+
+@pytest.fixture
+def admin(app):
+    cliente = app.test_client()
+    cliente.post('/login', data={'username': 'admin', 'password': '123'})
+    return cliente
@@ -0,0 +1,43 @@
+# test_abm.py - PANTALLAS DE ADMINISTRACIÓN (SABORES, INSUMOS, PRECIOS)
+from sqlalchemy import select, func
+
+from models import db, MovimientoStock, Producto, ComboItem, Sabor
+
+
+def test_reponer_sabor_registra_un_solo_movimiento(app, admin):
+    respuesta = admin.post('/admin/sabores', data={'accion': 'agregar_stock', 'sabor_nombre': 'Chocolate',
+                                                   'cant_baldes': '1', 'sucursal_destino': 'Máximo Paz'})
+    assert respuesta.status_code == 200
+    with app.app_context():
+        movimientos = db.session.execute(select(MovimientoStock.delta).where(MovimientoStock.tipo == 'reposicion')).scalars().all()
+    assert movimientos == [6000]
+
+
+def test_pantallas_de_stock_no_actualizan_el_pronostico(app, admin):
+    from app import gestor
+    admin.post('/vender', json={'items': [{'formato': '1/4 kg', 'sabores': ['Limon']}], 'medio_pago': 'Efectivo'})
+    assert admin.get('/admin/sabores').status_code == 200
+    assert admin.get('/admin/insumos').status_code == 200
+    with app.app_context():
+        # Lo suma 'mantenimiento.py pronostico', no el GET
+        assert gestor.pronostico.hasta() == 0
+
+
+def test_alta_y_baja_de_sabores_y_productos(app, admin):
+    admin.post('/admin/sabores', data={'accion': 'crear', 'nombre': 'Menta'})
+    admin.post('/admin/sabores', data={'accion': 'cambiar_estado', 'sabor_nombre': 'Menta'})
+    with app.app_context():
+        assert db.session.execute(select(Sabor.activo).where(Sabor.nombre == 'Menta')).scalar() is False
+        id_hijo = db.session.execute(select(Producto.id).where(Producto.nombre == '1/4 kg')).scalar()
+
+    admin.post('/admin/precios', data={'accion': 'crear', 'nombre': 'Promo Test', 'precio': '9000', 'tipo': 'combo',
+                                       'componentes': [str(id_hijo)], f'cantidad_{id_hijo}': '2'})
+    with app.app_context():
+        promo = db.session.execute(select(Producto).where(Producto.nombre == 'Promo Test')).scalar_one()
+        assert [(c.item_id, c.cantidad) for c in ComboItem.query.filter_by(promo_id=promo.id)] == [(id_hijo, 2)]
+        id_promo = promo.id
+
+    admin.post('/admin/precios', data={'accion': 'eliminar', 'id_producto': str(id_promo)})
+    with app.app_context():
+        assert db.session.get(Producto, id_promo) is None
+        assert db.session.execute(select(func.count()).select_from(ComboItem).where(ComboItem.promo_id == id_promo)).scalar() == 0
@@ -0,0 +1,67 @@
+# test_archivo.py - VENTAS ARCHIVADAS (BASE ADJUNTA)
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, update
+
+import archivo
+from importacion import ImportadorVentas
+from models import db, Venta
+
+SUCURSAL = 'Máximo Paz'
+CARRITO = {'items': [{'formato': '1/4 kg', 'sabores': ['Limon']}], 'medio_pago': 'Efectivo'}
+
+
+def _ventas_con_id_cliente(id_cliente):
+    return sum(db.session.execute(archivo.en_ambas(
+        lambda V, *_: select(func.count()).select_from(V).where(V.id_cliente == id_cliente)
+    )).scalars())
+
+
+def _archivar_todo(gestor):
+    """Lleva las ventas a hace 60 días, cierra la caja y archiva (queda la centinela)."""
+    db.session.execute(update(Venta).values(fecha=datetime.now() - timedelta(days=60)))
+    db.session.commit()
+    gestor.cerrar_caja_sucursal(SUCURSAL)
+    gestor.procesar_carrito(CARRITO, SUCURSAL) # Centinela: la venta de id más alto no se archiva
+    return gestor.archivar_ventas(30)
+
+
+def test_reenviar_venta_archivada_no_la_duplica(app):
+    from app import gestor
+    with app.app_context():
+        lote = [dict(CARRITO, id_cliente=f'tablet-{n}') for n in range(3)]
+        assert [r['estado'] for r in gestor.procesar_lote_ventas(lote, SUCURSAL)[0]] == ['ok'] * 3
+        assert _archivar_todo(gestor) == 3
+
+        assert [r['estado'] for r in gestor.procesar_lote_ventas(lote, SUCURSAL)[0]] == ['duplicada'] * 3
+        assert _ventas_con_id_cliente('tablet-0') == 1
+
+
+
+def test_reimportar_archivo_con_ventas_archivadas_no_duplica(app, tmp_path):
+    from app import gestor
+    ruta = tmp_path / 'ventas.csv'
+    ruta.write_text("fecha,sucursal,medio_pago,total,detalle\n"
+                    "2024-03-01 15:00:00,Máximo Paz,Efectivo,4000,1/4 kg (Limon)\n"
+                    "2024-03-02 16:30:00,Máximo Paz,Tarjeta,6500,1/4 kg (Limon)\n", encoding='utf-8')
+    with app.app_context():
+        assert ImportadorVentas(str(ruta)).importar().insertadas == 2
+        gestor.migrar_detalle_a_items()
+        assert _archivar_todo(gestor) == 2
+
+        assert ImportadorVentas(str(ruta)).importar().insertadas == 0
+        assert _ventas_con_id_cliente('importacion:ventas.csv:2') == 1
+
+
+def test_no_archiva_ventas_del_turno_abierto_aunque_la_hora_sea_vieja(app):
+    from app import gestor
+    with app.app_context():
+        gestor.procesar_carrito(CARRITO, SUCURSAL)
+        gestor.cerrar_caja_sucursal(SUCURSAL)
+        # Turno abierto con la hora de la terminal atrasada (anterior al cierre)
+        for _ in range(2):
+            gestor.procesar_carrito(CARRITO, SUCURSAL)
+        db.session.execute(update(Venta).values(fecha=datetime.now() - timedelta(days=60)))
+        db.session.commit()
+
+        assert gestor.archivar_ventas(30) == 1
+        assert db.session.execute(select(func.count()).select_from(Venta)).scalar() == 2
@@ -0,0 +1,13 @@
+# test_catalogo.py - CATÁLOGO PARA LAS TERMINALES (ETAG)
+from init_db import cargar_datos_completos
+
+
+def test_etag_no_se_repite_despues_de_init_db(app, admin):
+    respuesta = admin.get('/api/catalogo')
+    etag = respuesta.headers['ETag']
+    assert admin.get('/api/catalogo', headers={'If-None-Match': etag}).status_code == 304
+
+    # Base nueva con el mismo contenido: la tablet igual tiene que volver a bajarlo
+    cargar_datos_completos()
+    admin.post('/login', data={'username': 'admin', 'password': '123'})
+    assert admin.get('/api/catalogo', headers={'If-None-Match': etag}).status_code == 200
@@ -0,0 +1,19 @@
+# test_importacion.py - LECTURA DE IMPORTES Y FECHAS DE LA CARGA MASIVA
+import pytest
+
+from importacion import ErrorFila, _leer_importe
+
+
+@pytest.mark.parametrize('texto, total', [
+    ("12.000", 12000.0), ("12,000", 12000.0), ("1.000.000", 1000000.0),
+    ("1.234,50", 1234.5), ("1,234.50", 1234.5), ("1.234.567,89", 1234567.89),
+    ("4000,50", 4000.5), ("4000.5", 4000.5), ("$ 2.500", 2500.0), ("-1,5", -1.5), ("7", 7.0),
+])
+def test_leer_importe(texto, total):
+    assert _leer_importe(texto) == total
+
+
+@pytest.mark.parametrize('texto', ["1.5.3", "1234.567", "0.500", "1,234,5", "abc", ""])
+def test_leer_importe_rechaza_lo_ambiguo(texto):
+    with pytest.raises(ErrorFila):
+        _leer_importe(texto)
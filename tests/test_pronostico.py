@@ -0,0 +1,20 @@
+# test_pronostico.py - PRONÓSTICO CON VENTAS IMPORTADAS
+from importacion import ImportadorVentas
+
+
+def test_importacion_sin_detalle_no_rompe_el_pronostico(app, admin, tmp_path):
+    # Sin columna 'detalle': migrar-items arma renglones sin producto ("Venta importada")
+    ruta = tmp_path / 'ventas.csv'
+    ruta.write_text("fecha,sucursal,medio_pago,total\n"
+                    "2024-03-01 15:00:00,Máximo Paz,Efectivo,4000\n"
+                    "2024-03-02 16:30:00,Máximo Paz,Tarjeta,6500\n", encoding='utf-8')
+
+    from app import gestor
+    with app.app_context():
+        importador = ImportadorVentas(str(ruta)).importar()
+        assert importador.insertadas == 2
+        assert gestor.migrar_detalle_a_items()[0] == 2
+        assert gestor.pronostico.actualizar() == 2
+
+    assert admin.get('/admin/sabores').status_code == 200
+    assert admin.get('/admin/insumos').status_code == 200
@@ -0,0 +1,33 @@
+# test_resumenes.py - RESÚMENES DIARIOS CON VENTAS QUE LLEGAN TARDE
+from datetime import datetime, timedelta
+from sqlalchemy import select, func
+
+from models import db, ResumenDiario
+
+SUCURSAL = 'Máximo Paz'
+CARRITO = {'items': [{'formato': '1/4 kg', 'sabores': ['Limon']}], 'medio_pago': 'Efectivo'}
+
+
+def _ventas_resumidas(dia):
+    return db.session.execute(
+        select(func.coalesce(func.sum(ResumenDiario.cantidad_ventas), 0)).where(ResumenDiario.fecha == dia)
+    ).scalar()
+
+
+def test_lote_con_ventas_de_ayer_rehace_el_resumen(app):
+    from app import gestor
+    ayer = datetime.now() - timedelta(days=1)
+    vendedor = app.test_client()
+    vendedor.post('/login', data={'username': 'maximo', 'password': '123'})
+    # Una venta vieja para que haya algo resumido hasta ayer
+    vendedor.post('/vender/lote', json={'ventas': [dict(CARRITO, id_cliente='tablet-vieja', fecha=(ayer - timedelta(days=1)).isoformat())]})
+    with app.app_context():
+        assert gestor.resumenes.actualizar()[1] == ayer.date()
+        antes = _ventas_resumidas(ayer.date())
+
+    lote = [dict(CARRITO, id_cliente=f'tablet-ayer-{n}', fecha=ayer.isoformat()) for n in range(2)]
+    respuesta = vendedor.post('/vender/lote', json={'ventas': lote})
+    assert [r['estado'] for r in respuesta.get_json()['resultados']] == ['ok'] * 2
+
+    with app.app_context():
+        assert _ventas_resumidas(ayer.date()) == antes + 2
@@ -0,0 +1,45 @@
+# test_sesiones.py - CACHÉ DE USUARIOS ENTRE WORKERS
+from sqlalchemy import event, select
+
+from models import db, Usuario
+from sesiones import CacheUsuarios
+
+
+def _id_admin():
+    return db.session.execute(select(Usuario.id).where(Usuario.username == 'admin')).scalar()
+
+
+def test_usuario_en_cache_no_consulta_la_base(app):
+    cache = CacheUsuarios(intervalo=3600)
+    with app.app_context():
+        id_admin = _id_admin()
+        cache.obtener(id_admin)
+        consultas = []
+
+        def anotar(conexion, cursor, sql, *args):
+            consultas.append(sql)
+
+        event.listen(db.engine, 'before_cursor_execute', anotar)
+        try:
+            assert cache.obtener(id_admin).rol == 'admin'
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', anotar)
+        assert consultas == []
+
+
+def test_otro_worker_ve_el_cambio_de_rol_y_la_baja(app):
+    from app import gestor
+    otro_worker = CacheUsuarios(intervalo=0)
+    with app.app_context():
+        id_admin = _id_admin()
+        id_vendedor = db.session.execute(select(Usuario.id).where(Usuario.username == 'maximo')).scalar()
+        otro_worker.obtener(id_vendedor)
+        assert otro_worker.obtener(id_admin).rol == 'admin'
+
+        gestor.actualizar_usuario(id_admin, 'vendedor', 'Máximo Paz')
+        assert otro_worker.obtener(id_admin).rol == 'vendedor'
+        # Los demás usuarios siguen en caché
+        assert id_vendedor in otro_worker._usuarios
+
+        gestor.eliminar_usuario(id_admin)
+        assert otro_worker.obtener(id_admin) is None
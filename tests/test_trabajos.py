@@ -0,0 +1,33 @@
+# test_trabajos.py - REPORTES EN SEGUNDO PLANO Y SU CACHÉ EN DISCO
+import os
+import time
+from datetime import datetime, timedelta
+
+SUCURSAL = 'Máximo Paz'
+CARRITO = {'items': [{'formato': '1/4 kg', 'sabores': ['Limon']}], 'medio_pago': 'Efectivo'}
+
+
+def _esperar(app, trabajos, id_trabajo):
+    for _ in range(600):
+        # Contexto nuevo en cada vuelta: la sesión anterior tendría el trabajo en caché
+        with app.app_context():
+            estado = trabajos.obtener(id_trabajo).estado
+        if estado not in ('pendiente', 'procesando'): return estado
+        time.sleep(0.05)
+    raise AssertionError("El reporte no terminó")
+
+
+def test_un_solo_excel_por_rango_en_cache(app, tmp_path):
+    from app import gestor, trabajos_reporte
+    directorio_original = trabajos_reporte.directorio
+    trabajos_reporte.directorio = str(tmp_path)
+    try:
+        inicio, fin = datetime.now() - timedelta(days=1), datetime.now() + timedelta(days=1)
+        for _ in range(3):
+            with app.app_context():
+                gestor.procesar_carrito(CARRITO, SUCURSAL)
+                id_trabajo = trabajos_reporte.enviar(inicio, fin).id
+            assert _esperar(app, trabajos_reporte, id_trabajo) == 'listo'
+        assert len(os.listdir(tmp_path)) == 1
+    finally:
+        trabajos_reporte.directorio = directorio_original
@@ -0,0 +1,185 @@
+# trabajos.py - REPORTES EN SEGUNDO PLANO (POOL LOCAL + CACHÉ EN DISCO)
+import glob
+import os
+import shutil
+import time
+from fnmatch import fnmatch
+import socket
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, TrabajoReporte, ContadorVersion
+from archivo import en_ambas
+
+# Sube con cualquier cambio a ventas que no sea una venta nueva (importación, renglones migrados...):
+# el último id del rango no alcanza para saber que el Excel guardado quedó viejo
+CLAVE_VENTAS = 'ventas'
+# Excel en caché que nadie regeneró en este tiempo se borran (cualquier rango)
+DIAS_CACHE = 30
+# Un trabajo sin terminar más viejo que esto se da por perdido aunque su pid siga existiendo (pid reusado)
+HORAS_MAXIMAS_TRABAJO = 2
+
+
+def invalidar_reportes():
+    """Incrementa la versión de las ventas dentro de la transacción actual (el que llama hace el commit)."""
+    stmt = insert(ContadorVersion).values(clave=CLAVE_VENTAS, valor=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ContadorVersion.clave],
+        set_={'valor': ContadorVersion.valor + 1}
+    )
+    db.session.execute(stmt)
+
+
+def _version_ventas():
+    valor = db.session.execute(
+        select(ContadorVersion.valor).where(ContadorVersion.clave == CLAVE_VENTAS)
+    ).scalar()
+    return valor or 0
+
+
+def _este_proceso():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _proceso_vivo(proceso):
+    """¿Sigue corriendo el worker 'host:pid'? (de otro host no se puede saber: se asume que sí)"""
+    host, _, pid = (proceso or '').rpartition(':')
+    if not pid.isdigit(): return False # Pedido antes de guardar el proceso: ya hubo un reinicio
+    if host != socket.gethostname(): return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass # Existe, pero es de otro usuario
+    return True
+
+
+class GestorTrabajosReporte:
+    """
+    Genera los Excel fuera del request. El estado de cada trabajo vive en la tabla
+    TrabajoReporte, así cualquier worker de gunicorn puede responder el "¿ya está?".
+    Los archivos terminados quedan en disco con clave (rango, último Venta.id, versión de
+    las ventas): si el período ya está cerrado, volver a pedirlo es instantáneo.
+    La cola en sí vive en la memoria del worker: si el worker muere, sus trabajos sin
+    terminar se marcan como 'error' la próxima vez que alguien los consulta.
+    """
+
+    def __init__(self, app, gestor, directorio, max_workers=2):
+        self.app = app
+        self.gestor = gestor
+        self.directorio = directorio
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='reporte')
+
+    # --- API ---
+    def enviar(self, fecha_inicio, fecha_fin):
+        """Crea el trabajo; si el archivo ya está en caché queda 'listo' al instante."""
+        max_venta_id = self._max_venta_id(fecha_inicio, fecha_fin)
+        version = _version_ventas()
+        trabajo = TrabajoReporte(
+            id=uuid.uuid4().hex,
+            fecha_inicio=fecha_inicio,
+            fecha_fin=fecha_fin,
+            max_venta_id=max_venta_id,
+            version_ventas=version,
+            proceso=_este_proceso(),
+            creado=datetime.now()
+        )
+
+        if max_venta_id is None:
+            trabajo.estado = 'sin_datos'
+            trabajo.terminado = trabajo.creado
+        elif os.path.exists(self._ruta_cache(fecha_inicio, fecha_fin, max_venta_id, version)):
+            trabajo.estado = 'listo'
+            trabajo.archivo = self._ruta_cache(fecha_inicio, fecha_fin, max_venta_id, version)
+            trabajo.terminado = trabajo.creado
+        else:
+            trabajo.estado = 'pendiente'
+
+        db.session.add(trabajo)
+        db.session.commit()
+
+        if trabajo.estado == 'pendiente':
+            self._pool.submit(self._ejecutar, trabajo.id)
+        return trabajo
+
+    def obtener(self, id_trabajo):
+        trabajo = db.session.get(TrabajoReporte, id_trabajo)
+        if trabajo and self._huerfano(trabajo):
+            trabajo.estado = 'error'
+            trabajo.error = "El proceso que generaba el reporte se reinició. Volvé a pedirlo."
+            trabajo.terminado = datetime.now()
+            db.session.commit()
+        return trabajo
+
+    def archivo_en_cache(self, fecha_inicio, fecha_fin):
+        """Ruta del Excel ya generado para ese rango (o None)."""
+        max_venta_id = self._max_venta_id(fecha_inicio, fecha_fin)
+        if max_venta_id is None: return None
+        ruta = self._ruta_cache(fecha_inicio, fecha_fin, max_venta_id, _version_ventas())
+        return ruta if os.path.exists(ruta) else None
+
+    # --- INTERNOS ---
+    def _ejecutar(self, id_trabajo):
+        with self.app.app_context():
+            trabajo = db.session.get(TrabajoReporte, id_trabajo)
+            trabajo.estado = 'procesando'
+            db.session.commit()
+
+            try:
+                ruta = self._ruta_cache(trabajo.fecha_inicio, trabajo.fecha_fin, trabajo.max_venta_id, trabajo.version_ventas)
+                excel = self.gestor.generar_reporte_excel(trabajo.fecha_inicio, trabajo.fecha_fin)
+                if excel is None:
+                    trabajo.estado = 'sin_datos'
+                else:
+                    os.makedirs(self.directorio, exist_ok=True)
+                    temporal = f"{ruta}.{id_trabajo}.tmp"
+                    with excel, open(temporal, 'wb') as destino:
+                        shutil.copyfileobj(excel, destino)
+                    # Renombrar es atómico: nadie ve un archivo a medio escribir
+                    os.replace(temporal, ruta)
+                    self._borrar_viejos(trabajo.fecha_inicio, trabajo.fecha_fin, ruta)
+                    trabajo.archivo = ruta
+                    trabajo.estado = 'listo'
+            except Exception as e:
+                db.session.rollback()
+                trabajo = db.session.get(TrabajoReporte, id_trabajo)
+                trabajo.estado = 'error'
+                trabajo.error = str(e)
+
+            trabajo.terminado = datetime.now()
+            db.session.commit()
+
+    def _max_venta_id(self, fecha_inicio, fecha_fin):
+        maximos = db.session.execute(en_ambas(
+            lambda V, *_: select(func.max(V.id)).where(V.fecha >= fecha_inicio, V.fecha <= fecha_fin)
+        )).scalars()
+        return max((m for m in maximos if m is not None), default=None)
+
+    def _huerfano(self, trabajo):
+        """Sin terminar y su worker ya no existe (o lleva demasiado): nadie lo va a completar."""
+        if trabajo.estado not in ('pendiente', 'procesando'): return False
+        if trabajo.creado < datetime.now() - timedelta(hours=HORAS_MAXIMAS_TRABAJO): return True
+        return not _proceso_vivo(trabajo.proceso)
+
+    def _borrar_viejos(self, fecha_inicio, fecha_fin, ruta_nueva):
+        """
+        Cada venta nueva (o cambio de versión) da otro nombre de archivo: las versiones anteriores
+        del mismo rango ya no se van a pedir. También se van los de cualquier rango con más de DIAS_CACHE.
+        """
+        mismo_rango = os.path.join(self.directorio, f"reporte_{fecha_inicio:%Y%m%d}_{fecha_fin:%Y%m%d}_*.xlsx")
+        limite = time.time() - DIAS_CACHE * 86400
+        for ruta in glob.glob(os.path.join(self.directorio, 'reporte_*.xlsx')):
+            if ruta == ruta_nueva: continue
+            try:
+                if fnmatch(ruta, mismo_rango) or os.path.getmtime(ruta) < limite:
+                    os.remove(ruta)
+            except OSError:
+                pass # Ya lo borró otro worker (o se está descargando en Windows)
+
+    def _ruta_cache(self, fecha_inicio, fecha_fin, max_venta_id, version_ventas):
+        nombre = f"reporte_{fecha_inicio:%Y%m%d}_{fecha_fin:%Y%m%d}_{max_venta_id}_v{version_ventas or 0}.xlsx"
+        return os.path.join(self.directorio, nombre)